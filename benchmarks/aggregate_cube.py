@@ -0,0 +1,77 @@
+# Benchmark of the aggregate cube against the pandas groupby path
+# Times the food price index, figure summaries and geo summary for a selection
+# of markets and commodities on a synthetic country.
+# Equality of the two paths is checked by tests/test_cube.py.
+#
+# Usage:
+#     python -m benchmarks.aggregate_cube [--scale 1] [--markets 10] [--commodities 5]
+import argparse
+import numpy as np
+
+import src.plotting as plotting
+from benchmarks.common import time_call, print_table, make_country_data
+from src.cube import PriceCube, INDEX_COMMODITY
+from src.data import generate_food_price_index_data
+from src.store import to_store_layout
+
+
+BASE_SIZE = {"n_markets": 150, "n_commodities": 50, "n_months": 240, "pair_density": 0.3}
+
+
+def pandas_summaries(data, date_range, markets, commodities):
+    """Compute the same summaries as the cube with the pandas chart builders, without plotting."""
+    summaries = {}
+    plot_figure_charts, plot_country_cities = plotting.plot_figure_charts, plotting.plot_country_cities
+    plotting.plot_figure_charts = lambda summary, values: summaries.setdefault("figure", summary)
+    plotting.plot_country_cities = lambda country_id, summary: summaries.setdefault("geo", summary)
+    try:
+        index_data = generate_food_price_index_data(data, markets, commodities)
+        plotting.generate_figure_chart(data, date_range, markets, commodities)
+        plotting.generate_figure_chart(index_data, date_range, markets, [INDEX_COMMODITY])
+        plotting.generate_geo_chart(index_data, date_range, markets, [INDEX_COMMODITY], "Japan")
+    finally:
+        plotting.plot_figure_charts, plotting.plot_country_cities = plot_figure_charts, plot_country_cities
+    return summaries
+
+
+def cube_summaries(cube, date_range, markets, commodities):
+    return {
+        "index": cube.food_price_index(markets, commodities),
+        "figure": cube.price_summary(date_range, markets, commodities),
+        "index_figure": cube.index_summary(date_range, markets, commodities),
+        "geo": cube.latest_index_by_market(date_range, markets, commodities),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the aggregate cube against pandas groupbys.")
+    parser.add_argument("--scale", type=int, default=1, help="size relative to the largest WFP country")
+    parser.add_argument("--markets", type=int, default=10, help="number of selected markets")
+    parser.add_argument("--commodities", type=int, default=5, help="number of selected commodities")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    data = to_store_layout(make_country_data(**dict(BASE_SIZE, n_markets=BASE_SIZE["n_markets"] * args.scale)))
+    build = time_call(PriceCube.from_frame, data, repeat=1)
+    cube = build["result"]
+
+    markets = data.market.value_counts().index[:args.markets].tolist()
+    commodities = data.commodity.value_counts().index[:args.commodities].tolist()
+    dates = np.sort(data.date.unique())
+    date_range = (dates[-24], dates[-1])
+
+    pandas_time = time_call(pandas_summaries, data, date_range, markets, commodities, repeat=args.repeat)
+    cube_time = time_call(cube_summaries, cube, date_range, markets, commodities, repeat=args.repeat)
+
+    print_table(
+        f"Chart summaries for {len(markets)} markets, {len(commodities)} commodities, {len(data)} rows (ms)",
+        [
+            {"path": "cube build (once per data version)", "p50": build["p50"], "p95": build["p95"]},
+            {"path": "pandas groupbys", "p50": pandas_time["p50"], "p95": pandas_time["p95"]},
+            {"path": "aggregate cube", "p50": cube_time["p50"], "p95": cube_time["p95"]},
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
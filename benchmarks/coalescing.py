@@ -0,0 +1,108 @@
+# Benchmark of the coalescing of chart requests
+# Replays a date slider drag (requests of one page sent in quick succession) and a burst
+# of identical requests from several pages, with and without coalescing, and reports
+# the number of chart computations and the time until the last response. Checks that
+# the last response of the drag is the same with and without coalescing.
+#
+# Usage:
+#     python -m benchmarks.coalescing [--requests 6] [--interval 0.1]
+import json
+import time
+import argparse
+import tempfile
+import threading
+
+import plotly
+import src.store as store
+import src.callbacks as callbacks
+from benchmarks.common import print_table, make_country_data
+from src.coalesce import coalescer, DEFAULT_DEBOUNCE
+from src.spec_cache import spec_cache
+from src.utils import convert_date
+
+
+BASE_SIZE = {"n_markets": 30, "n_commodities": 10, "n_months": 120, "pair_density": 0.5}
+
+
+def replay(requests, interval, draw):
+    """Send requests from threads `interval` seconds apart, returning the responses and the total time."""
+    responses = [None] * len(requests)
+
+    def send(i, request):
+        try:
+            responses[i] = draw(*request)
+        except callbacks.PreventUpdate:
+            responses[i] = "abandoned"
+
+    start = time.perf_counter()
+    threads = []
+    for i, request in enumerate(requests):
+        thread = threading.Thread(target=send, args=(i, request))
+        thread.start()
+        threads.append(thread)
+        time.sleep(interval)
+    for thread in threads:
+        thread.join()
+    return responses, (time.perf_counter() - start) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the coalescing of chart requests.")
+    parser.add_argument("--requests", type=int, default=6, help="number of requests per scenario")
+    parser.add_argument("--interval", type=float, default=0.03, help="seconds between the requests of a drag")
+    args = parser.parse_args(argv)
+
+    store.STORE_DIR = tempfile.mkdtemp(prefix="food_price_bench_store_")
+    # Requests are replayed from threads, as by a multithreaded server
+    coalescer.debounce = DEFAULT_DEBOUNCE
+    data = make_country_data(**BASE_SIZE)
+    handle = store.write_country_data("Benchmark", data)
+    markets = list(data.market.unique()[:8])
+    commodities = list(data.commodity.value_counts().index[:6])
+    end_date = convert_date(data.date.max(), "label")
+
+    # Drag of the start date of the slider by one month per request, then a burst of the last state
+    drag = [
+        (handle, [end_date - 5 - i / 12, end_date], commodities, markets, False, "Benchmark", "page-0")
+        for i in range(args.requests)
+    ]
+    burst = [request[:-1] + (f"page-{i}",) for i, request in enumerate([drag[-1]] * args.requests)]
+
+    def direct(*request):
+        # The chart builders without coalescing, as drawn before
+        return callbacks.update_index_commodities_area(*request[:-1])
+
+    def coalesced(*request):
+        return callbacks.draw_charts(*request)
+
+    rows, last_responses = [], {}
+    for scenario, requests, interval in [("slider drag", drag, args.interval), ("identical burst", burst, 0)]:
+        for stage, draw in {"direct": direct, "coalesced": coalesced}.items():
+            spec_cache.clear()
+            computed = coalescer.stats()["computed"]
+            start_charts = callbacks.compile_charts.__globals__["_stats"]["charts"]
+            responses, total_ms = replay(requests, interval, draw)
+            compiled = callbacks.compile_charts.__globals__["_stats"]["charts"] - start_charts
+            rows.append({
+                "scenario": scenario,
+                "stage": stage,
+                "requests": len(requests),
+                "computations": coalescer.stats()["computed"] - computed if stage == "coalesced" else len(requests),
+                "abandoned": sum(response == "abandoned" for response in responses),
+                "charts compiled": compiled,
+                "total ms": total_ms,
+            })
+            last = responses[-1][:3] if stage == "coalesced" else responses[-1][:2]
+            last_responses[(scenario, stage)] = json.dumps(
+                last if stage == "direct" else last[1:], cls=plotly.utils.PlotlyJSONEncoder, sort_keys=True
+            )
+
+        if last_responses[(scenario, "direct")] != last_responses[(scenario, "coalesced")]:
+            raise AssertionError(f"Coalesced responses differ from direct ones in the {scenario}")
+
+    print_table("Chart requests with and without coalescing, last responses equal", rows)
+    print_table("Coalescing", [coalescer.stats()])
+
+
+if __name__ == "__main__":
+    main()
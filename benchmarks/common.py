@@ -0,0 +1,107 @@
+# Script containing helpers shared by the benchmark scripts
+# Benchmarks are run from the repository root, e.g. `python -m benchmarks.country_index`
+import time
+import statistics
+import tracemalloc
+import numpy as np
+
+from src.synthetic import generate_country_data
+
+
+def time_call(func, *args, repeat=5, **kwargs):
+    """
+    Time repeated calls of a function.
+
+    Parameters
+    ----------
+    func : callable
+        Function to time.
+    repeat : int, optional
+        Number of calls. Defaults to 5.
+
+    Returns
+    -------
+    dict
+        "p50" and "p95" latency in milliseconds, and the "result" of the last call.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return dict(latency(timings), result=result)
+
+
+def latency(timings):
+    """Return the "p50" and "p95" of timings in milliseconds."""
+    return {
+        "p50": statistics.median(timings),
+        "p95": float(np.percentile(timings, 95)),
+    }
+
+
+def peak_memory(func, *args, **kwargs):
+    """
+    Measure the peak memory allocated while calling a function, in MB.
+
+    Allocations are traced with tracemalloc, which also records NumPy buffers.
+    """
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024 ** 2
+
+
+def print_table(title, rows):
+    """
+    Print benchmark results as an aligned text table.
+
+    Parameters
+    ----------
+    title : str
+        Title printed above the table.
+    rows : list of dict
+        One dict per row, all with the same keys.
+    """
+    print(f"\n{title}")
+    if not rows:
+        return
+    columns = list(rows[0])
+    cells = [[f"{row[c]:.2f}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def make_country_data(n_markets, n_commodities, n_months, pair_density=0.5, missing_rate=0.3, seed=0):
+    """
+    Generate cleaned-looking country data in the WFP schema.
+
+    Each market carries a random subset of commodities, observed from a random
+    start month with some months missing, at independent lognormal prices
+    (see src.synthetic.generate_country_data()).
+
+    Parameters
+    ----------
+    n_markets, n_commodities, n_months : int
+        Size of the country.
+    pair_density : float, optional
+        Share of (market, commodity) pairs that exist. Defaults to 0.5.
+    missing_rate : float, optional
+        Share of months missing within the observed span of a pair. Defaults to 0.3.
+    seed : int, optional
+        Random seed. Defaults to 0.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Dataframe with columns date, market, latitude, longitude, commodity, unit, usdprice.
+    """
+    return generate_country_data(
+        n_markets, n_commodities, n_months, pair_density, missing_rate, seed, price_model="iid", categorical=False
+    )
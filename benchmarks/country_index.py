@@ -0,0 +1,87 @@
+# Benchmark of the country index over the full WFP catalogue
+# Measures the index build with cold and warm country name conversion,
+# the country-dropdown option build, and the app startup time.
+#
+# Usage:
+#     python -m benchmarks.country_index [--countries 100]
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+import pandas as pd
+import country_converter as coco
+
+from benchmarks.common import time_call, print_table
+
+
+def write_full_index(mirror_dir, n_countries):
+    """Write a country index in the HDX format listing `n_countries` countries."""
+    iso3_codes = sorted(coco.CountryConverter().data["ISO3"].dropna().unique())[:n_countries]
+    index_df = pd.DataFrame({
+        "countryiso3": iso3_codes,
+        "market_count": 10,
+        "commodity_count": 20,
+        "price_count": 10000,
+        "start_date": "2000-01-15",
+        "end_date": "2024-01-15",
+        "url": [f"https://data.humdata.org/dataset/wfp-food-prices-for-{code.lower()}" for code in iso3_codes],
+    })
+    hxl_row = "#country+code,#meta+count,#meta+count,#meta+count,#date+start,#date+end,#country+url\n"
+    header, *body = index_df.to_csv(index=False).splitlines(keepends=True)
+    with open(os.path.join(mirror_dir, "wfp_countries_global.csv"), "w") as file:
+        file.write(header + hxl_row + "".join(body))
+
+
+def time_app_startup(env):
+    """Time `import src.app` in a fresh interpreter, in milliseconds."""
+    code = "import time; t = time.perf_counter(); import src.app; print((time.perf_counter() - t) * 1000)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the country index over the full WFP catalogue.")
+    parser.add_argument("--countries", type=int, default=100, help="number of countries in the index")
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp(prefix="food_price_bench_")
+    write_full_index(tmp_dir, args.countries)
+
+    env = dict(
+        os.environ,
+        FOOD_PRICE_SOURCE="mirror",
+        FOOD_PRICE_MIRROR_DIR=tmp_dir,
+        FOOD_PRICE_COUNTRY_NAMES=os.path.join(tmp_dir, "country_names.csv"),
+        FOOD_PRICE_STORE_DIR=os.path.join(tmp_dir, "store"),
+    )
+    os.environ.update(env)
+
+    from src.data import fetch_country_index, get_country_options
+
+    cold_index = time_call(fetch_country_index.uncached, repeat=1)
+    warm_index = time_call(fetch_country_index.uncached, repeat=5)
+    cold_options = time_call(get_country_options, cold_index["result"], repeat=1)
+    warm_options = time_call(get_country_options, cold_index["result"], repeat=5)
+
+    os.remove(env["FOOD_PRICE_COUNTRY_NAMES"])
+    cold_startup = time_app_startup(env)
+    warm_startup = time_app_startup(env)
+
+    print_table(
+        f"Country index with {len(get_country_options(cold_index['result']))} countries (ms)",
+        [
+            {"stage": "index build, cold names", "p50": cold_index["p50"], "p95": cold_index["p95"]},
+            {"stage": "index build, persisted names", "p50": warm_index["p50"], "p95": warm_index["p95"]},
+            {"stage": "dropdown options, first call", "p50": cold_options["p50"], "p95": cold_options["p95"]},
+            {"stage": "dropdown options, cached", "p50": warm_options["p50"], "p95": warm_options["p95"]},
+            {"stage": "app startup, cold names", "p50": cold_startup, "p95": cold_startup},
+            {"stage": "app startup, persisted names", "p50": warm_startup, "p95": warm_startup},
+        ],
+    )
+
+
+if __name__ == "__main__":
+    main()
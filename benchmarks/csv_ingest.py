@@ -0,0 +1,198 @@
+# Benchmark of the ingestion of country datasets
+# Writes a synthetic country dataset with all 14 columns of the WFP CSV format, and
+# compares the original read, parsing every column as objects, with the block-wise
+# pyarrow read of data.read_country_csv(): time and peak memory (measured in a fresh
+# process for each reader), from a local file and streamed from a throttled HTTP server.
+# The frames, and the cleaned frames written to the store, must be identical.
+#
+# Usage:
+#     python -m benchmarks.csv_ingest [--markets 200] [--commodities 40] [--months 180]
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+import threading
+import numpy as np
+import pandas as pd
+
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks import reference
+from benchmarks.common import make_country_data, print_table
+
+
+HXL_ROW = "#date,#adm1+name,#adm2+name,#loc+market+name,#geo+lat,#geo+lon,#item+type,#item+name,#item+unit,#item+price+flag,#item+price+type,#currency,#value,#value+usd\n"
+
+
+def write_raw_csv(path, n_markets, n_commodities, n_months, seed=0):
+    """
+    Write a country dataset in the WFP CSV format, with an HXL row and all 14 columns.
+
+    Some commodities are also priced in a second unit, and some prices and markets are
+    missing, so that the cleaning steps have duplicates and gaps to handle.
+    """
+    rng = np.random.default_rng(seed)
+    data = make_country_data(n_markets, n_commodities, n_months, seed=seed)
+
+    data["unit"] = np.where(rng.random(len(data)) < 0.05, "500 G", "KG")
+    data.loc[rng.random(len(data)) < 0.01, "usdprice"] = np.nan
+    data.loc[rng.random(len(data)) < 0.001, "market"] = np.nan
+    raw = pd.DataFrame({
+        "date": data["date"].dt.strftime("%Y-%m-%d"),
+        "admin1": "Region " + data["market"].str.slice(-1),
+        "admin2": "District " + data["market"].str.slice(-2),
+        "market": data["market"],
+        "latitude": data["latitude"],
+        "longitude": data["longitude"],
+        "category": "cereals and tubers",
+        "commodity": data["commodity"],
+        "unit": data["unit"],
+        "priceflag": "actual",
+        "pricetype": "Retail",
+        "currency": "XOF",
+        "price": (data["usdprice"] * 600).round(2),
+        "usdprice": data["usdprice"],
+    })
+
+    header, *body = raw.to_csv(index=False).splitlines(keepends=True)
+    with open(path, "w") as file:
+        file.write(header)
+        file.write(HXL_ROW)
+        file.writelines(body)
+    return len(raw)
+
+
+def read(reader, location):
+    """Read a dataset with the original or the block-wise reader."""
+    if reader == "original":
+        return reference.read_country_csv(location)
+    from src.data import read_country_csv
+    return read_country_csv(location)
+
+
+def peak_rss_mb():
+    """
+    Return the peak resident memory of this process in MB.
+
+    Reads VmHWM on Linux, as ru_maxrss also covers the parent process the
+    interpreter was started from.
+    """
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except FileNotFoundError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(reader, location):
+    """Read a dataset in this process, returning the time and the peak memory added by the read."""
+    import src.data  # noqa: F401, imported before the baseline is taken
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    data = read(reader, location)
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = peak_rss_mb()
+
+    return {
+        "ms": elapsed,
+        "peak_mb": peak - baseline,
+        "frame_mb": data.memory_usage(deep=True).sum() / 1024 ** 2,
+    }
+
+
+def measure_in_subprocess(reader, location):
+    """Measure a read in a fresh interpreter, so that peak memory is not shared between readers."""
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.csv_ingest", "--measure", reader, location],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+class ThrottledHandler(SimpleHTTPRequestHandler):
+    """File server sending files in chunks at a limited rate, as a slow upstream would."""
+
+    chunk_size = 1 << 16
+    chunk_delay = 0.0
+
+    def copyfile(self, source, outputfile):
+        while chunk := source.read(self.chunk_size):
+            outputfile.write(chunk)
+            time.sleep(self.chunk_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ingestion of country datasets.")
+    parser.add_argument("--markets", type=int, default=200)
+    parser.add_argument("--commodities", type=int, default=40)
+    parser.add_argument("--months", type=int, default=180)
+    parser.add_argument("--rate", type=float, default=50.0, help="MB/s served by the throttled HTTP server")
+    parser.add_argument("--measure", nargs=2, metavar=("READER", "LOCATION"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    from src.data import get_clean_data
+    from src.store import to_store_layout, compute_data_version
+
+    served_dir = tempfile.mkdtemp(prefix="food_price_bench_served_")
+    path = os.path.join(served_dir, "wfp_food_prices_syn.csv")
+    n_rows = write_raw_csv(path, args.markets, args.commodities, args.months)
+    size_mb = os.path.getsize(path) / 1024 ** 2
+
+    # Identical frames, and identical cleaned frames and data versions in the store
+    original, streamed = read("original", path), read("streamed", path)
+    categorical = {column: object for column in ["market", "commodity", "unit"]}
+    pd.testing.assert_frame_equal(streamed.astype(categorical), original)
+    original_layout = to_store_layout(get_clean_data(original))
+    streamed_layout = to_store_layout(get_clean_data(streamed))
+    pd.testing.assert_frame_equal(streamed_layout, original_layout)
+    assert compute_data_version(streamed_layout) == compute_data_version(original_layout)
+
+    rows = [
+        dict(reader=reader, source="file", **measure_in_subprocess(reader, path))
+        for reader in ("original", "streamed")
+    ]
+
+    # Streamed from HTTP: the original read only starts once the download is complete
+    ThrottledHandler.chunk_delay = ThrottledHandler.chunk_size / (args.rate * 1024 ** 2)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(ThrottledHandler, directory=served_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/{os.path.basename(path)}"
+
+    def download_then_read():
+        local_path = os.path.join(tempfile.mkdtemp(prefix="food_price_bench_mirror_"), os.path.basename(path))
+        reference.download(url, local_path)
+        return reference.read_country_csv(local_path)
+
+    for reader, run in (("original", download_then_read), ("streamed", lambda: read("streamed", url))):
+        start = time.perf_counter()
+        data = run()
+        rows.append({
+            "reader": reader,
+            "source": f"http {args.rate:g} MB/s",
+            "ms": (time.perf_counter() - start) * 1000,
+            "peak_mb": float("nan"),
+            "frame_mb": data.memory_usage(deep=True).sum() / 1024 ** 2,
+        })
+    server.shutdown()
+
+    print_table(f"Read {n_rows} rows ({size_mb:.1f} MB), frames and cleaned data equal", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# Benchmark of the figure charts built from a shared spec template
+# Compares building and compiling the layered figure chart of each commodity against
+# filling the compiled template, checks that both return the same Vega specs, and
+# reports the spec bytes per commodity.
+#
+# Usage:
+#     python -m benchmarks.figure_specs [--commodities 5 20 50]
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import time_call, print_table
+from src.plotting import plot_figure_charts, plot_figure_specs, get_figure_template
+from src.vega_runtime import compile_charts
+
+
+def make_price_summary(n_commodities, seed=0):
+    """Generate a price summary in the layout of PriceCube.price_summary(), with some missing changes."""
+    rng = np.random.default_rng(seed)
+    mom = rng.normal(0, 0.05, n_commodities)
+    mom[rng.random(n_commodities) < 0.1] = np.nan
+    return pd.DataFrame({
+        "commodity": [f"Commodity {i}" for i in range(n_commodities)],
+        "unit": rng.choice(["KG", "L", "5 KG"], n_commodities),
+        "mom": mom,
+        "yoy": rng.normal(0, 0.2, n_commodities),
+        "usdprice": rng.lognormal(0, 1, n_commodities),
+        "date": pd.Timestamp("2024-01-15"),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the figure charts built from a shared spec template.")
+    parser.add_argument("--commodities", type=int, nargs="+", default=[5, 20, 50], help="numbers of commodities")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed calls")
+    args = parser.parse_args(argv)
+
+    get_figure_template()
+
+    rows = []
+    for n_commodities in args.commodities:
+        price_summary = make_price_summary(n_commodities)
+        commodities = price_summary.commodity.to_list()
+
+        compiled = time_call(
+            lambda: compile_charts(plot_figure_charts(price_summary, commodities)), repeat=args.repeat
+        )
+        templated = time_call(plot_figure_specs, price_summary, commodities, repeat=args.repeat)
+        if json.dumps(compiled["result"], sort_keys=True) != json.dumps(templated["result"], sort_keys=True):
+            raise AssertionError(f"Templated figure specs differ from compiled ones for {n_commodities} commodities")
+
+        spec_bytes = len(json.dumps(templated["result"]))
+        rows.append({"commodities": n_commodities, "stage": "build + compile", "p50": compiled["p50"], "p95": compiled["p95"], "bytes/commodity": spec_bytes // n_commodities})
+        rows.append({"commodities": n_commodities, "stage": "template", "p50": templated["p50"], "p95": templated["p95"], "bytes/commodity": spec_bytes // n_commodities})
+
+    print_table("Figure charts (ms), templated specs equal to compiled ones", rows)
+
+
+if __name__ == "__main__":
+    main()
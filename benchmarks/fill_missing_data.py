@@ -0,0 +1,54 @@
+# Benchmark of fill_missing_data against the original cartesian-product implementation
+# Synthetic countries are scaled from the size of the largest WFP countries
+# (about 150 markets, 50 commodities and 20 years of monthly prices).
+#
+# Usage:
+#     python -m benchmarks.fill_missing_data [--scales 1 10 100] [--reference-max-scale 10]
+import argparse
+import pandas as pd
+
+from benchmarks import reference
+from benchmarks.common import time_call, peak_memory, print_table, make_country_data
+from src.data import fill_missing_data
+
+
+BASE_SIZE = {"n_markets": 150, "n_commodities": 50, "n_months": 240, "pair_density": 0.3}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark fill_missing_data on synthetic countries.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="sizes relative to the largest WFP country")
+    parser.add_argument("--reference-max-scale", type=int, default=10, help="largest scale to run the original implementation on")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for scale in args.scales:
+        data = make_country_data(**dict(BASE_SIZE, n_markets=BASE_SIZE["n_markets"] * scale), seed=scale)
+
+        result = time_call(fill_missing_data, data, repeat=args.repeat)
+        row = {
+            "scale": f"{scale}x",
+            "rows": len(data),
+            "p50 (ms)": result["p50"],
+            "peak (MB)": peak_memory(fill_missing_data, data),
+            "original p50 (ms)": "-",
+            "original peak (MB)": "-",
+            "identical": "-",
+        }
+
+        if scale <= args.reference_max_scale:
+            original = time_call(reference.fill_missing_data, data, repeat=1)
+            pd.testing.assert_frame_equal(original["result"], result["result"])
+            row.update({
+                "original p50 (ms)": original["p50"],
+                "original peak (MB)": peak_memory(reference.fill_missing_data, data),
+                "identical": "yes",
+            })
+        rows.append(row)
+
+    print_table("fill_missing_data on synthetic countries", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# Benchmark of filter_major_data against the original merge-based implementation
+# Compares latency and peak memory on synthetic countries. Equivalence on random
+# inputs and thresholds is checked by tests/test_data.py.
+#
+# Usage:
+#     python -m benchmarks.filter_major_data [--scales 1 10]
+import argparse
+import pandas as pd
+
+from benchmarks import reference
+from benchmarks.common import time_call, peak_memory, print_table
+from src.data import filter_major_data
+from src.synthetic import generate_country_data
+
+
+BASE_SIZE = {"n_markets": 150, "n_commodities": 50, "n_months": 240, "pair_density": 0.3}
+
+
+def make_raw_country_data(scale, seed=0):
+    """
+    Generate a raw-looking country with a secondary unit and duplicated rows.
+
+    A fifth of the commodities are reported in most markets and most months, so that they
+    pass both abundance rules, and the others are dropped as in WFP data.
+    """
+    return generate_country_data(
+        **dict(BASE_SIZE, n_markets=BASE_SIZE["n_markets"] * scale), missing_rate=0.1, seed=seed,
+        major_commodities=BASE_SIZE["n_commodities"] // 5, price_model="iid", unit_variants=1,
+        duplicate_rate=0.05, categorical=False,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark filter_major_data against the original implementation.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10], help="sizes relative to the largest WFP country")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    rows = []
+    for scale in args.scales:
+        data = make_raw_country_data(scale, seed=scale)
+        result = time_call(filter_major_data, data, repeat=args.repeat)
+        original = time_call(reference.filter_major_data, data, repeat=args.repeat)
+        pd.testing.assert_frame_equal(original["result"], result["result"])
+        rows.append({
+            "scale": f"{scale}x",
+            "rows": len(data),
+            "kept rows": len(result["result"]),
+            "p50 (ms)": result["p50"],
+            "peak (MB)": peak_memory(filter_major_data, data),
+            "original p50 (ms)": original["p50"],
+            "original peak (MB)": peak_memory(reference.filter_major_data, data),
+        })
+
+    print_table("filter_major_data on synthetic countries", rows)
+
+
+if __name__ == "__main__":
+    main()
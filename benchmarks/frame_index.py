@@ -0,0 +1,70 @@
+# Benchmark of the row selection of an interaction
+# Compares boolean scans of the date, market and commodity columns, on the cleaned
+# frame and on the sorted categorical store layout, against the offset index of the
+# store layout, and checks that all of them select the same rows.
+#
+# Usage:
+#     python -m benchmarks.frame_index [--markets 10] [--commodities 6]
+import argparse
+import numpy as np
+
+from benchmarks.common import time_call, print_table, make_country_data
+from src.frame_index import FrameIndex
+from src.store import to_store_layout
+
+
+SIZES = {
+    "small": {"n_markets": 20, "n_commodities": 10, "n_months": 120, "pair_density": 0.5},
+    "large": {"n_markets": 150, "n_commodities": 50, "n_months": 240, "pair_density": 0.3},
+}
+
+
+def scan_rows(data, date_range, markets, commodities):
+    """Select the rows of each commodity with boolean scans, as the charts did before the index."""
+    selected = data.date.between(date_range[0], date_range[1]) & data.market.isin(markets)
+    return {commodity: np.flatnonzero(selected & data.commodity.isin([commodity])) for commodity in commodities}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the row selection of an interaction.")
+    parser.add_argument("--markets", type=int, default=10, help="number of selected markets")
+    parser.add_argument("--commodities", type=int, default=6, help="number of selected commodities")
+    parser.add_argument("--repeat", type=int, default=20, help="number of timed calls")
+    args = parser.parse_args(argv)
+
+    rows = []
+    for size, params in SIZES.items():
+        data = make_country_data(**params)
+        layout = to_store_layout(data)
+        dates = np.sort(data.date.unique())
+        date_range = (dates[len(dates) // 3], dates[-1])
+        markets = list(data.market.unique()[:args.markets])
+        commodities = list(data.commodity.value_counts().index[:args.commodities])
+
+        built = time_call(FrameIndex.from_frame, layout, repeat=3)
+        frame_index = built["result"]
+
+        stages = {
+            "scan, object columns": lambda: scan_rows(data, date_range, markets, commodities),
+            "scan, store layout": lambda: scan_rows(layout, date_range, markets, commodities),
+            "offset index": lambda: frame_index.rows(date_range, markets, commodities),
+        }
+        results = {}
+        for stage, select in stages.items():
+            timing = time_call(select, repeat=args.repeat)
+            results[stage] = timing["result"]
+            rows.append({"frame": f"{size} ({len(data)} rows)", "stage": stage, "p50": timing["p50"], "p95": timing["p95"]})
+        rows.append({"frame": f"{size} ({len(data)} rows)", "stage": "index build (once)", "p50": built["p50"], "p95": built["p95"]})
+
+        for commodity in commodities:
+            indexed = results["offset index"].get(commodity, np.array([], dtype=np.intp))
+            if not np.array_equal(indexed, results["scan, store layout"][commodity]):
+                raise AssertionError(f"Offset index selects different rows for {commodity} in the {size} frame")
+            if len(indexed) != len(results["scan, object columns"][commodity]):
+                raise AssertionError(f"Store layout holds different rows for {commodity} in the {size} frame")
+
+    print_table(f"Row selection of {args.commodities} commodities over {args.markets} markets (ms), same rows", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# Benchmark of the geo chart background
+# Compares the spec size and compile time of the country background embedding the
+# whole world map against the pre-split per-country shape. Browser render time is
+# approximated by the time to parse the compiled spec, which grows with its size.
+#
+# Usage:
+#     python -m benchmarks.geo_background [--countries 392 356 566 36 76]
+import json
+import argparse
+import tempfile
+
+import src.geo as geo
+import src.plotting as plotting
+from benchmarks import reference
+from benchmarks.common import time_call, print_table
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the geo chart background.")
+    parser.add_argument("--countries", type=int, nargs="+", default=[392, 356, 566, 36, 76], help="ISO numeric codes")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed calls")
+    args = parser.parse_args(argv)
+
+    geo.GEO_DIR = tempfile.mkdtemp(prefix="food_price_bench_geo_")
+    split = time_call(geo.split_world, geo_dir=geo.GEO_DIR, repeat=1)
+
+    rows = [{"country": "split (once)", "stage": "split_world", "bytes": 0, "p50": split["p50"], "p95": split["p95"]}]
+    for country_id in args.countries:
+        charts = {
+            "world + filter": lambda: reference.get_country_background(country_id),
+            "pre-split shape": lambda: plotting.get_country_background.uncached(country_id),
+        }
+        for stage, build in charts.items():
+            compiled = time_call(lambda: build().to_dict(format="vega"), repeat=args.repeat)
+            spec = json.dumps(compiled["result"])
+            parsed = time_call(json.loads, spec, repeat=args.repeat)
+            rows.append({"country": str(country_id), "stage": f"{stage}, compile", "bytes": len(spec), "p50": compiled["p50"], "p95": compiled["p95"]})
+            rows.append({"country": str(country_id), "stage": f"{stage}, parse", "bytes": len(spec), "p50": parsed["p50"], "p95": parsed["p95"]})
+
+    print_table("Geo chart background (ms)", rows)
+
+
+if __name__ == "__main__":
+    main()
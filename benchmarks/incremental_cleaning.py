@@ -0,0 +1,93 @@
+# Benchmark of the incremental cleaning of country data
+# Generates a raw country dataset with duplicated observations, missing prices, a commodity
+# changing major unit and markets opening late, then feeds it to a CleaningState one month
+# at a time, with categorical and with object columns. Compares the time of an incremental
+# monthly update with a full recompute of get_clean_data(). That both give the same data is
+# tested in tests/test_cleaning_state.py.
+#
+# Usage:
+#     python -m benchmarks.incremental_cleaning [--markets 120] [--commodities 30] [--months 120]
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from src.data import get_clean_data
+from src.cleaning_state import CleaningState
+from benchmarks.common import make_country_data, print_table
+
+
+def make_raw_data(n_markets, n_commodities, n_months, seed=0):
+    """
+    Generate raw country data in the WFP schema, sorted by date as in HDX files.
+
+    Every 40th row is observed again at shifted coordinates, every 50th row has a second
+    price, Commodity 0 moves from "KG" to "500 G" half way, 2% of the prices are missing,
+    and a fifth of the markets only open after a quarter of the period, passing the
+    abundance rules later on.
+    """
+    rng = np.random.default_rng(seed)
+    data = make_country_data(n_markets, n_commodities, n_months, pair_density=0.95, missing_rate=0.1, seed=seed)
+
+    dates = np.sort(data["date"].unique())
+    late_markets = [f"Market {i}" for i in range(0, n_markets, 5)]
+    data = data[~(data["market"].isin(late_markets) & (data["date"] < dates[len(dates) // 4]))]
+    data.loc[(data["commodity"] == "Commodity 0") & (data["date"] >= dates[len(dates) // 2]), "unit"] = "500 G"
+    data.loc[rng.random(len(data)) < 0.02, "usdprice"] = np.nan
+
+    shifted = data.iloc[::40].assign(latitude=lambda df: df["latitude"] + 0.01)
+    repriced = data.iloc[::50].assign(usdprice=lambda df: df["usdprice"] * 2)
+    data = pd.concat([data, shifted, repriced]).sort_values("date", kind="stable", ignore_index=True)
+
+    for column in ["market", "commodity", "unit"]:
+        data[column] = pd.Categorical(data[column], categories=np.sort(data[column].unique()))
+    return data
+
+
+def time_months(raw, months):
+    """Update a state month by month, and time each update and a full recompute."""
+    state = CleaningState()
+    timings = {"incremental": [], "full": []}
+    for date in months:
+        prefix = raw[raw["date"] <= date]
+
+        start = time.perf_counter()
+        state.update(prefix)
+        timings["incremental"].append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        get_clean_data(prefix)
+        timings["full"].append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the incremental cleaning of country data.")
+    parser.add_argument("--markets", type=int, default=120)
+    parser.add_argument("--commodities", type=int, default=30)
+    parser.add_argument("--months", type=int, default=120)
+    args = parser.parse_args(argv)
+
+    raw = make_raw_data(args.markets, args.commodities, args.months)
+    months = np.sort(raw["date"].unique())
+    history = months[: 4 * len(months) // 5]
+
+    rows = []
+    for dtype, data in (("category", raw), ("object", raw.astype({c: object for c in ["market", "commodity", "unit"]}))):
+        timings = time_months(data, [history[-1], *months[len(history):]])
+        rows.append({
+            "columns": dtype,
+            "updates": len(timings["incremental"]) - 1,
+            "build ms": timings["incremental"][0],
+            "update p50 ms": float(np.median(timings["incremental"][1:])),
+            "full p50 ms": float(np.median(timings["full"][1:])),
+        })
+
+    print_table(
+        f"Monthly updates of {len(raw)} raw rows over {len(months)} months, against a full recompute",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+# End-to-end benchmark suite of the chart interactions, calling the Dash callbacks directly
+# Serves the bundled Japan dataset and synthetic countries scaled up to the size of the
+# largest WFP countries from a local mirror, then replays the interactions of a page on
+# each country without a browser:
+#     country switch      update_country_data, update_widget_values and draw_charts, cold store
+#     slider drag         update_index_commodities_area over date ranges widened month by month
+#     slider drag (geo)   update_geo_area over the same date ranges
+#     add commodity       update_index_commodities_area with one more commodity
+#     toggle geo on/off   draw_charts on both branches of the geo toggle
+# Each scenario runs one interaction more than --repeat: the first under tracemalloc for its
+# peak memory and spec bytes, the others timed for their p50 and p95 latency.
+# Results are compared to a stored baseline, flagging scenarios slower, heavier or larger
+# than the baseline by more than --tolerance. Baselines are specific to a machine.
+#
+# Usage:
+#     python -m benchmarks.interactions [--countries Japan Afghanistan Syria] [--repeat 5]
+#     python -m benchmarks.interactions --save-baseline
+#     make benchmark-baseline benchmark-check BASELINE_REF=origin/main  # against a branch, see Makefile
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import argparse
+import tempfile
+import pandas as pd
+
+import src.geo as geo
+import src.sources as sources
+from src import store
+from src.app import app
+from src.cache_config import cache
+from src.spec_cache import spec_cache
+from src.data import fetch_country_index
+from src.callbacks import (
+    update_country_data, update_widget_values, draw_charts, update_geo_area, update_index_commodities_area
+)
+from src.synthetic import generate_country_data, write_country_csv
+from benchmarks.common import latency, peak_memory, print_table
+
+
+BASELINE_PATH = os.path.join("benchmarks", "baselines", "interactions.json")
+BUNDLED_PATH = os.path.join("data", "raw", "wfp_food_prices_jpn.csv")
+# Synthetic countries: ISO3 code, markets, commodities and months
+SYNTHETIC_COUNTRIES = {
+    "Afghanistan": ("AFG", 40, 20, 180),
+    "Syria": ("SYR", 100, 30, 240),
+}
+# Latency differences below this many milliseconds are never flagged
+MIN_REGRESSION_MS = 5.0
+
+
+def write_synthetic_country(path, n_markets, n_commodities, n_months, seed=0):
+    """
+    Write a synthetic country in the HDX file format, with a secondary unit and duplicated rows to clean.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    data = generate_country_data(
+        n_markets, n_commodities, n_months, pair_density=0.9, missing_rate=0.05, seed=seed,
+        unit_variants=1, duplicate_rate=0.05,
+    )
+    return write_country_csv(path, data)
+
+
+def make_mirror(countries, scale=1.0):
+    """Build a local mirror holding the bundled and synthetic countries, and return its directory and row counts."""
+    mirror_dir = tempfile.mkdtemp(prefix="food_price_bench_mirror_")
+    rows = {}
+    for country in countries:
+        if country == "Japan":
+            shutil.copy(BUNDLED_PATH, mirror_dir)
+            rows[country] = len(pd.read_csv(BUNDLED_PATH, usecols=["date"], skiprows=[1]))
+        else:
+            iso3, n_markets, n_commodities, n_months = SYNTHETIC_COUNTRIES[country]
+            rows[country] = write_synthetic_country(
+                os.path.join(mirror_dir, f"wfp_food_prices_{iso3.lower()}.csv"),
+                max(int(n_markets * scale), 2), n_commodities, n_months,
+            )
+    return mirror_dir, rows
+
+
+def load_country(country, country_index):
+    """Call update_country_data, in its background job variant when diskcache is installed."""
+    if "set_progress" in inspect.signature(update_country_data).parameters:
+        return update_country_data(lambda progress: None, country, country_index)
+    return update_country_data(country, country_index)
+
+
+def country_switch(country, country_index):
+    """Select a country missing from the store and the caches of the worker, then restore the store."""
+    store_dir = store.STORE_DIR
+    store.STORE_DIR = tempfile.mkdtemp(prefix="food_price_bench_store_")
+    store._loaded.clear()
+    spec_cache.clear()
+    cache.clear()
+    try:
+        handle = load_country(country, country_index)
+        widgets = update_widget_values(country_index, handle, False, country)
+        return draw_charts(handle, widgets[3], widgets[5], widgets[7], False, country, "benchmark")
+    finally:
+        shutil.rmtree(store.STORE_DIR, ignore_errors=True)
+        store.STORE_DIR = store_dir
+        store._loaded.clear()
+        cache.clear()
+
+
+def make_scenarios(country, country_index, n_steps):
+    """
+    Build the interactions of each scenario on a country.
+
+    Returns
+    -------
+    dict
+        List of up to `n_steps` zero-argument callables per scenario, each an interaction
+        following the previous one.
+    """
+    handle = load_country(country, country_index)
+    widgets = update_widget_values(country_index, handle, False, country)
+    (start, end), commodities, markets = widgets[3], widgets[5], widgets[7]
+    ranges = [[start - step / 12, end] for step in range(1, n_steps + 1)]
+    added = [commodities + [extra] for extra in widgets[4] if extra not in commodities][:n_steps]
+
+    return {
+        "country switch": [lambda: country_switch(country, country_index)] * n_steps,
+        "slider drag": [
+            lambda date_range=date_range: update_index_commodities_area(
+                handle, date_range, commodities, markets, False, country
+            )
+            for date_range in ranges
+        ],
+        "slider drag (geo)": [
+            lambda date_range=date_range: update_geo_area(handle, date_range, commodities, markets, True, country)
+            for date_range in ranges
+        ],
+        "add commodity": [
+            lambda selection=selection: update_index_commodities_area(
+                handle, [start, end], selection, markets, False, country
+            )
+            for selection in added
+        ],
+        "toggle geo on": [
+            lambda: draw_charts(handle, [start, end], commodities, markets, True, country, "benchmark")
+        ] * n_steps,
+        "toggle geo off": [
+            lambda: draw_charts(handle, [start, end], commodities, markets, False, country, "benchmark")
+        ] * n_steps,
+    }
+
+
+def spec_bytes(output):
+    """Return the bytes of the Vega specs of the components returned by a callback."""
+    total = 0
+    def walk(component):
+        nonlocal total
+        if isinstance(component, (list, tuple)):
+            for child in component:
+                walk(child)
+        elif hasattr(component, "to_plotly_json"):
+            if getattr(component, "spec", None) is not None:
+                total += len(json.dumps(component.spec, default=str))
+            walk(getattr(component, "children", None))
+    walk(output)
+    return total
+
+
+def run_scenario(steps):
+    """Run the steps of a scenario, the first one under tracemalloc, and return its metrics."""
+    outputs = []
+    peak = peak_memory(lambda: outputs.append(steps[0]()))
+
+    timings = []
+    for step in steps[1:]:
+        start = time.perf_counter()
+        step()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return dict(
+        latency(timings or [float("nan")]),
+        steps=len(steps),
+        peak_mb=peak,
+        spec_bytes=spec_bytes(outputs[0]),
+    )
+
+
+def find_regressions(result, baseline, tolerance):
+    """Return the metrics of a scenario exceeding its baseline by more than `tolerance`."""
+    if baseline is None:
+        return []
+    flags = []
+    for metric in ("p50", "p95"):
+        if result[metric] > baseline[metric] * (1 + tolerance) and result[metric] - baseline[metric] > MIN_REGRESSION_MS:
+            flags.append(metric)
+    for metric in ("peak_mb", "spec_bytes"):
+        if result[metric] > baseline[metric] * (1 + tolerance):
+            flags.append(metric)
+    return flags
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chart interactions end to end.")
+    parser.add_argument("--countries", nargs="+", default=["Japan", *SYNTHETIC_COUNTRIES])
+    parser.add_argument("--scale", type=float, default=1.0, help="scale of the markets of synthetic countries")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed interactions per scenario")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative excess flagged as a regression")
+    args = parser.parse_args(argv)
+
+    mirror_dir, country_rows = make_mirror(args.countries, args.scale)
+    store.STORE_DIR = tempfile.mkdtemp(prefix="food_price_bench_store_")
+    sources._source = sources.create_data_source("mirror", mirror_dir)
+    geo.GEO_DIR = tempfile.mkdtemp(prefix="food_price_bench_geo_")
+    geo.split_world(geo_dir=geo.GEO_DIR)
+
+    baselines = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as file:
+            baselines = json.load(file)
+
+    results, rows, regressions = {}, [], 0
+    with app.server.app_context():
+        country_index = fetch_country_index()
+        for country in args.countries:
+            scenarios = make_scenarios(country, country_index, args.repeat + 1)
+            for scenario, steps in scenarios.items():
+                key = f"{country}/{scenario}"
+                result = results[key] = run_scenario(steps)
+                flags = find_regressions(result, baselines.get(key), args.tolerance)
+                regressions += bool(flags)
+                rows.append({
+                    "country": country,
+                    "scenario": scenario,
+                    "steps": result["steps"],
+                    "p50 ms": result["p50"],
+                    "p95 ms": result["p95"],
+                    "peak MB": result["peak_mb"],
+                    "spec KB": result["spec_bytes"] / 1024,
+                    "baseline p50 ms": baselines[key]["p50"] if key in baselines else float("nan"),
+                    "regression": ", ".join(flags) or "-",
+                })
+
+    print_table(
+        "Chart interactions of " + ", ".join(f"{country} ({country_rows[country]} rows)" for country in args.countries)
+        + (f", against {args.baseline}" if baselines else ""),
+        rows,
+    )
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=1)
+        print(f"\nStored the baseline in {args.baseline}")
+    elif regressions:
+        print(f"\n{regressions} scenario(s) regressed by more than {args.tolerance:.0%} of the baseline")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Benchmark of the line charts of a selection
+# Compares filtering the selection once per commodity and normalizing dates per call
+# against the offset index of the store layout filling a shared chart template, checks that
+# both compile to the same Vega specs once the unplotted columns are dropped, and
+# reports the spec bytes per chart.
+#
+# Usage:
+#     python -m benchmarks.line_charts [--commodities 5 20 50] [--markets 10]
+import json
+import argparse
+
+import src.plotting as plotting
+from benchmarks import reference
+from benchmarks.common import time_call, print_table, make_country_data
+from src.store import to_store_layout
+from src.vega_runtime import compile_charts
+
+
+BASE_SIZE = {"n_markets": 150, "n_commodities": 50, "n_months": 240, "pair_density": 0.3}
+PLOTTED_COLUMNS = ("date", "market", "usdprice")
+
+
+def plotted_values(specs):
+    """Serialize Vega specs with the inline values restricted to the plotted columns."""
+    # datasets are de-duplicated on all their columns, so compare them copied back
+    specs = json.loads(json.dumps([reference.expand_datasets(spec) for spec in specs]))
+    for spec in specs:
+        for dataset in spec.get("data", []):
+            if "values" in dataset:
+                dataset["values"] = [
+                    {key: value for key, value in row.items() if key in PLOTTED_COLUMNS}
+                    for row in dataset["values"]
+                ]
+    return json.dumps(specs, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the line charts of a selection.")
+    parser.add_argument("--commodities", type=int, nargs="+", default=[5, 20, 50], help="numbers of selected commodities")
+    parser.add_argument("--markets", type=int, default=10, help="number of selected markets")
+    parser.add_argument("--repeat", type=int, default=3, help="number of timed calls")
+    args = parser.parse_args(argv)
+
+    data = to_store_layout(make_country_data(**BASE_SIZE))
+    date_range = (data.date.min(), data.date.max())
+    markets = list(data.market.unique()[:args.markets])
+
+    rows = []
+    for n_commodities in args.commodities:
+        commodities = list(data.commodity.value_counts().index[:n_commodities])
+        builders = {
+            "filter per commodity": reference.generate_line_chart,
+            "offset index + template": plotting.generate_line_chart,
+        }
+
+        specs = {}
+        for stage, build in builders.items():
+            built = time_call(build, data, date_range, markets, commodities, repeat=args.repeat)
+            compiled = time_call(lambda: compile_charts(build(data, date_range, markets, commodities)), repeat=args.repeat)
+            specs[stage] = compiled["result"]
+            rows.append({
+                "commodities": n_commodities,
+                "stage": stage,
+                "build p50": built["p50"],
+                "compile p50": compiled["p50"],
+                "compile p95": compiled["p95"],
+                "bytes/chart": len(json.dumps(compiled["result"])) // n_commodities,
+            })
+
+        if len(set(plotted_values(value) for value in specs.values())) != 1:
+            raise AssertionError(f"Line chart specs differ for {n_commodities} commodities")
+
+    print_table(f"Line charts over {len(markets)} markets (ms), specs equal on plotted columns", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Benchmark of the level-of-detail layer of the line charts
+# Draws the line charts of a 20-year country frame over growing date ranges, at full
+# monthly resolution and through the level-of-detail layer (rollups picked from the span of
+# the range, and LTTB capping the points of each series). Reports the picked level, the
+# points per series, the spec bytes and the compile time, and the shape error of the
+# downsampled series against the plotted rollup, next to keeping every n-th point instead.
+# Ranges within the point budget must compile to the same specs, and the batched LTTB must
+# keep the same points as a one-series-at-a-time implementation.
+#
+# Usage:
+#     python -m benchmarks.line_lod [--markets 20] [--commodities 4] [--years 2 5 10 20]
+import json
+import argparse
+import numpy as np
+import pandas as pd
+
+from benchmarks import reference
+from benchmarks.common import make_country_data, print_table, time_call
+from src.lod import LineLevels, choose_level, line_max_points, lttb
+from src.plotting import generate_line_chart
+from src.store import to_store_layout
+from src.vega_runtime import compile_charts
+
+
+def shape_error(full, kept):
+    """Mean absolute error of the kept points, linearly interpolated, against a full series, relative to its range."""
+    x, y = full["date"].to_numpy().astype(np.int64), full["usdprice"].to_numpy()
+    interpolated = np.interp(x, kept["date"].to_numpy().astype(np.int64), kept["usdprice"].to_numpy())
+    return np.abs(interpolated - y).mean() / max(np.ptp(y), 1e-12)
+
+
+def series_errors(full_rows, kept_rows, max_points):
+    """Shape error of each market series downsampled by LTTB, and by keeping every n-th point."""
+    lttb_errors, stride_errors = [], []
+    for market, full in full_rows.groupby("market", observed=True, sort=False):
+        if len(full) <= max_points:
+            continue
+        kept = kept_rows[kept_rows["market"] == market]
+        strided = full.iloc[np.unique(np.linspace(0, len(full) - 1, max_points).round().astype(int))]
+        lttb_errors.append(shape_error(full, kept))
+        stride_errors.append(shape_error(full, strided))
+    return (np.mean(lttb_errors), np.mean(stride_errors)) if lttb_errors else (0.0, 0.0)
+
+
+def check_lttb(seed=0):
+    """Check the batched LTTB against the one-series-at-a-time implementation."""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(60, 200, size=25)
+    x = np.concatenate([np.sort(rng.choice(10000, size=n, replace=False)) for n in lengths]).astype(float)
+    y = rng.normal(size=lengths.sum()).cumsum()
+    kept = lttb(x, y, lengths, 50).reshape(len(lengths), 50)
+    starts = np.cumsum(lengths) - lengths
+    for series, (start, n) in enumerate(zip(starts, lengths)):
+        expected = reference.lttb(list(x[start:start + n]), list(y[start:start + n]), 50)
+        assert (kept[series] - start).tolist() == expected, f"LTTB differs on series {series}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the level-of-detail layer of the line charts.")
+    parser.add_argument("--markets", type=int, default=20)
+    parser.add_argument("--commodities", type=int, default=4)
+    parser.add_argument("--years", type=int, nargs="+", default=[2, 5, 10, 20])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    check_lttb()
+
+    data = to_store_layout(make_country_data(
+        args.markets, args.commodities, 12 * max(args.years), pair_density=0.9, missing_rate=0.05
+    ))
+    levels = LineLevels(data)
+    markets = list(data["market"].unique())
+    commodities = list(data["commodity"].value_counts().index[:args.commodities])
+    max_points = line_max_points()
+    end = data["date"].max()
+
+    rows = []
+    for years in args.years:
+        date_range = (end - pd.DateOffset(years=years) + pd.DateOffset(days=1), end)
+        level = choose_level(date_range, max_points)
+        full = time_call(
+            lambda: compile_charts(generate_line_chart(data, date_range, markets, commodities)), repeat=args.repeat
+        )
+        lod = time_call(
+            lambda: compile_charts(generate_line_chart(
+                data, date_range, markets, commodities, levels=levels, max_points=max_points
+            )),
+            repeat=args.repeat,
+        )
+
+        # Shape kept by LTTB from the plotted level, against every n-th point
+        charts = generate_line_chart(data, date_range, markets, commodities, levels=levels, max_points=max_points)
+        rolled = generate_line_chart(levels.get(level)[0], date_range, markets, commodities)
+        errors = [series_errors(plain.data, chart.data, max_points) for plain, chart in zip(rolled, charts)]
+        points = max(chart.data.groupby("market", observed=True).size().max() for chart in charts)
+
+        if level == "month" and points < max_points:
+            assert json.dumps(lod["result"], sort_keys=True) == json.dumps(full["result"], sort_keys=True), \
+                f"Specs differ over {years} years"
+
+        for stage, result, shown in (("full", full, None), ("lod", lod, (level, points, errors))):
+            rows.append({
+                "years": years,
+                "stage": stage,
+                "level": shown[0] if shown else "month",
+                "points/series": shown[1] if shown else int(12 * years),
+                "bytes/chart": len(json.dumps(result["result"])) // len(commodities),
+                "compile p50 ms": result["p50"],
+                "lttb error": np.mean([error[0] for error in shown[2]]) if shown else float("nan"),
+                "stride error": np.mean([error[1] for error in shown[2]]) if shown else float("nan"),
+            })
+
+    print_table(
+        f"Line charts of {len(markets)} markets x {len(commodities)} commodities, "
+        f"{max_points} points per series, LTTB equal to the reference",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# Benchmark of the bytes sent between the browser and the Dash server per chart interaction
+# Replays the interactions of a page (country loaded, slider drag, commodity added, geo view
+# toggled on and off) against the draw_charts callback through the Dash server, and reports
+# the bytes of each request and response as sent before and after compression of the
+# responses, de-duplication of the inline datasets of each spec, and removal of the content
+# area from the callback inputs. Before, each request also carried the component tree of the
+# charts drawn last, as an input of draw_charts.
+# De-duplicated specs must render as the specs with their datasets copied back.
+#
+# Usage:
+#     python -m benchmarks.payload_bytes [--markets 20] [--commodities 8] [--months 120]
+import gzip
+import json
+import argparse
+import tempfile
+import vl_convert as vlc
+
+from dash._callback import GLOBAL_CALLBACK_MAP
+
+from src import store
+from src.app import app
+from src.utils import convert_date
+from benchmarks import reference
+from benchmarks.common import make_country_data, print_table, time_call
+
+
+def find_callback(name):
+    """Return the output key and the callback map entry of a callback function."""
+    for output, entry in GLOBAL_CALLBACK_MAP.items():
+        if entry["callback"].__name__ == name:
+            return output, entry
+    raise KeyError(name)
+
+
+def build_payload(output, entry, values, changed):
+    """Build the body of a callback request as sent by the Dash renderer."""
+    def props(dependencies):
+        return [
+            {"id": dependency["id"], "property": dependency["property"],
+             "value": values[(dependency["id"], dependency["property"])]}
+            for dependency in dependencies
+        ]
+    outputs = [
+        {"id": part.split(".")[0], "property": part.split(".")[1].split("@")[0]}
+        for part in output.strip(".").split("...")
+    ]
+    return {
+        "output": output,
+        "outputs": outputs,
+        "inputs": props(entry["inputs"]),
+        "state": props(entry["state"]),
+        "changedPropIds": [f"{changed[0]}.{changed[1]}"],
+    }
+
+
+def walk_specs(tree, func):
+    """Apply a function to the spec of every Vega component of a serialized component tree."""
+    if isinstance(tree, dict):
+        if tree.get("type") == "Vega" and "spec" in tree.get("props", {}):
+            tree["props"]["spec"] = func(tree["props"]["spec"])
+        for value in tree.values():
+            walk_specs(value, func)
+    elif isinstance(tree, list):
+        for value in tree:
+            walk_specs(value, func)
+
+
+def check_render(spec):
+    """Check that a de-duplicated spec renders as the spec with its datasets copied back."""
+    expanded = reference.expand_datasets(spec)
+    if expanded != spec:
+        assert vlc.vega_to_svg(spec) == vlc.vega_to_svg(expanded), "De-duplicated spec renders differently"
+    return spec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the bytes on the wire of the chart callbacks.")
+    parser.add_argument("--markets", type=int, default=20)
+    parser.add_argument("--commodities", type=int, default=8)
+    parser.add_argument("--months", type=int, default=120)
+    args = parser.parse_args(argv)
+
+    store.STORE_DIR = tempfile.mkdtemp(prefix="food_price_bench_store_")
+    data = make_country_data(args.markets, args.commodities, args.months, pair_density=0.8, missing_rate=0.05)
+    handle = store.write_country_data("Japan", data)
+    commodities = list(data["commodity"].value_counts().index)
+    markets = sorted(data["market"].unique())
+    end = convert_date(data["date"].max(), "label")
+
+    output, entry = find_callback("draw_charts")
+    values = {
+        ("country-data", "data"): handle,
+        ("date-range", "value"): [end - 5, end],
+        ("commodities-dropdown", "value"): commodities[:4],
+        ("markets-dropdown", "value"): markets,
+        ("geo-toggle", "on"): False,
+        ("country-dropdown", "value"): "Japan",
+        ("session-id", "data"): "benchmark",
+    }
+    interactions = [
+        ("country loaded", ("country-data", "data"), None),
+        ("slider drag", ("date-range", "value"), [end - 3, end]),
+        ("slider drag", ("date-range", "value"), [end - 8, end]),
+        ("commodity added", ("commodities-dropdown", "value"), commodities[:5]),
+        ("geo toggled on", ("geo-toggle", "on"), True),
+        ("geo toggled off", ("geo-toggle", "on"), False),
+    ]
+
+    client = app.server.test_client()
+    content_area = []
+    rows = []
+    for name, changed, value in interactions:
+        if value is not None:
+            values[changed] = value
+        payload = build_payload(output, entry, values, changed)
+        request = json.dumps(payload).encode()
+        # before, the content area holding the charts drawn last was an input of draw_charts
+        request_before = json.dumps(dict(payload, inputs=payload["inputs"] + [
+            {"id": "content-area", "property": "children", "value": content_area}
+        ])).encode()
+
+        response = client.post(
+            "/_dash-update-component", data=request,
+            headers={"Content-Type": "application/json", "Accept-Encoding": "gzip"},
+        )
+        assert response.status_code == 200, response.status_code
+        wire = response.get_data()
+        body = gzip.decompress(wire) if response.headers.get("Content-Encoding") == "gzip" else wire
+        areas = json.loads(body)["response"]
+
+        # specs as compiled before de-duplication, which must render the same charts
+        expanded = json.loads(body)["response"]
+        walk_specs(expanded, reference.expand_datasets)
+        if name == "country loaded":
+            walk_specs(json.loads(body)["response"], check_render)
+        body_before = json.dumps({"multi": True, "response": expanded}).encode()
+
+        content_area = [
+            areas[area]["children"] for area in ("geo-area", "index-area", "commodities-area") if area in areas
+        ]
+        gzip_ms = time_call(gzip.compress, body, repeat=3)["p50"]
+        rows.append({
+            "interaction": name,
+            "request before": len(request_before),
+            "request after": len(request),
+            "response before": len(body_before),
+            "deduped": len(body),
+            "deduped+gzip": len(wire),
+            "total ratio": (len(request) + len(wire)) / (len(request_before) + len(body_before)),
+            "gzip ms": gzip_ms,
+        })
+
+    print_table(
+        f"Bytes per chart interaction of {len(markets)} markets x up to 5 of {len(commodities)} commodities "
+        f"x {args.months} months",
+        rows,
+    )
+
+
+if __name__ == "__main__":
+    main()
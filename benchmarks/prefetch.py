@@ -0,0 +1,124 @@
+# Benchmark of the concurrent prefetch of country datasets
+# Serves copies of a mirrored country file from a local HTTP server with simulated
+# latency, and compares downloading them one by one with the original download against
+# the concurrent prefetch of TieredSource: cold, revalidating unchanged files with
+# conditional requests, and against a server failing the first request of each file.
+#
+# Usage:
+#     python -m benchmarks.prefetch [--countries 16] [--latency 0.2]
+import os
+import time
+import argparse
+import tempfile
+import threading
+import collections
+import pandas as pd
+
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import src.sources as sources
+from benchmarks import reference
+from benchmarks.common import print_table
+
+
+SOURCE_FILE = os.path.join("data", "raw", "wfp_food_prices_jpn.csv")
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    """File server answering after a fixed latency, optionally failing the first request of each file."""
+
+    latency = 0.0
+    fail_first = False
+    requests = collections.Counter()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        with self.lock:
+            self.requests[self.path] += 1
+            first = self.requests[self.path] == 1
+        if self.fail_first and first:
+            self.send_error(503)
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory):
+    """Start a threaded file server on a free port, returning the server and its URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(SlowHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the concurrent prefetch of country datasets.")
+    parser.add_argument("--countries", type=int, default=16, help="number of countries to fetch")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds of simulated latency per request")
+    parser.add_argument("--workers", type=int, default=8, help="number of concurrent downloads")
+    args = parser.parse_args(argv)
+
+    served_dir = tempfile.mkdtemp(prefix="food_price_bench_served_")
+    with open(SOURCE_FILE, "rb") as file:
+        content = file.read()
+    country_rows = []
+    for i in range(args.countries):
+        iso3 = f"C{i:02d}"
+        with open(os.path.join(served_dir, sources.COUNTRY_FILENAME.format(iso3=iso3.lower())), "wb") as file:
+            file.write(content)
+        country_rows.append(pd.Series({"countryiso3": iso3}))
+
+    SlowHandler.latency = args.latency
+    server, url = serve(served_dir)
+    upstream = sources.HTTPSource(url)
+    sources._http_client = sources.HTTPClient(pool_size=args.workers, backoff=0.05)
+
+    def sequential(mirror_dir):
+        for row in country_rows:
+            reference.download(upstream.country_location(row), os.path.join(mirror_dir, os.path.basename(upstream.country_location(row))))
+        return {row["countryiso3"]: "downloaded" for row in country_rows}
+
+    cold_dir = tempfile.mkdtemp(prefix="food_price_bench_mirror_")
+    tiered = sources.TieredSource(sources.LocalMirrorSource(cold_dir), upstream)
+    stale = sources.TieredSource(sources.LocalMirrorSource(cold_dir), upstream, max_age=-1)
+    flaky_dir = tempfile.mkdtemp(prefix="food_price_bench_mirror_")
+    flaky = sources.TieredSource(sources.LocalMirrorSource(flaky_dir), upstream)
+
+    stages = [
+        ("sequential, original download", lambda: sequential(tempfile.mkdtemp(prefix="food_price_bench_mirror_")), False),
+        ("prefetch, cold", lambda: tiered.prefetch(country_rows, max_workers=args.workers), False),
+        ("prefetch, fresh mirror", lambda: tiered.prefetch(country_rows, max_workers=args.workers), False),
+        ("prefetch, revalidate stale", lambda: stale.prefetch(country_rows, max_workers=args.workers), False),
+        ("prefetch, first requests fail", lambda: flaky.prefetch(country_rows, max_workers=args.workers), True),
+    ]
+
+    rows = []
+    for stage, run, fail_first in stages:
+        SlowHandler.fail_first = fail_first
+        SlowHandler.requests.clear()
+        start = time.perf_counter()
+        outcomes = run()
+        elapsed = (time.perf_counter() - start) * 1000
+        rows.append({
+            "stage": stage,
+            "countries": len(outcomes),
+            "outcomes": dict(collections.Counter(outcomes.values())),
+            "requests": sum(SlowHandler.requests.values()),
+            "ms": elapsed,
+        })
+
+    for mirror_dir in (cold_dir, flaky_dir):
+        for row in country_rows:
+            with open(sources.LocalMirrorSource(mirror_dir).country_path(row), "rb") as file:
+                if file.read() != content:
+                    raise AssertionError(f"Prefetched file of {row['countryiso3']} differs from the served one")
+
+    server.shutdown()
+    print_table(f"Fetch {args.countries} countries with {args.latency}s latency per request, files equal", rows)
+
+
+if __name__ == "__main__":
+    main()
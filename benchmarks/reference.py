@@ -0,0 +1,301 @@
+# Script containing the original, unoptimized implementations of the cleaning and plotting steps
+# Used by the benchmarks to check that optimized versions return identical output.
+import os
+import json
+import shutil
+import itertools
+import threading
+import urllib.request
+import pandas as pd
+import altair as alt
+
+
+def filter_major_data(data, date_abundance_threshold=0.5, market_abundance_threshold=0.7):
+    """
+    Original filter_major_data, merging an aggregate back onto the data for each rule.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Input food price raw data.
+    date_abundance_threshold : float, optional
+        The threshold percentage of data existence for each (commodity, market) pair relative to the full duration length. Defaults to 0.5.
+    market_abundance_threshold : float, optional
+         The threshold percentage of markets where data of a commodity exists, relative to the total number of markets. Defaults to 0.7.
+
+    Returns
+    -------
+    pandas.DataFrame
+        A DataFrame containing major data filtered based on the specified thresholds.
+
+    """
+
+    # Default Info
+    columns_to_keep = [
+        "date",
+        "market",
+        "latitude",
+        "longitude",
+        "commodity",
+        "unit",
+        "usdprice",
+    ]
+
+    clean_data_df = data
+
+    # Rule 0 - Deduplication on unit and (date, commodity, market)
+    map_df = (
+        clean_data_df.groupby(["commodity", "unit"])
+        .agg({"unit": "count"})
+        .groupby(["commodity"])
+        .idxmax()
+    )
+    map_df["unit"] = map_df["unit"].str[1]
+    map_df = map_df.reset_index()
+    clean_data_df = clean_data_df.merge(
+        map_df, how="inner", on=["commodity", "unit"]
+    )
+    clean_data_df = (
+        clean_data_df[columns_to_keep]
+        .groupby(columns_to_keep[:-1])
+        .first(["usdprice"])
+        .reset_index()
+    )
+
+    # Rule 1 - data existence for each (commodity, market) pair relative to the full duration length >= x%
+    num_date = clean_data_df["date"].nunique()
+    map_df = (
+        clean_data_df.groupby(["market", "commodity"]).agg(
+            {"usdprice": "count"}
+        )
+        >= date_abundance_threshold * num_date
+    )
+    map_df = map_df.rename(columns={"usdprice": "is_kept"})
+    clean_data_df = clean_data_df.merge(
+        map_df, how="left", on=["market", "commodity"]
+    )
+    clean_data_df = clean_data_df[
+        clean_data_df["is_kept"] == True
+    ].drop(columns=["is_kept"])
+
+    # Rule 2 - data of a commodity exists, relative to the total number of markets >= x%
+    num_market = clean_data_df["market"].nunique()
+    map_df = (
+        clean_data_df.groupby(["commodity"]).agg(
+            {"market": "nunique"}
+        )
+        >= market_abundance_threshold * num_market
+    )
+    map_df = map_df.rename(columns={"market": "is_kept"})
+    clean_data_df = clean_data_df.merge(
+        map_df, how="left", on=["commodity"]
+    )
+    clean_data_df = clean_data_df[
+        clean_data_df["is_kept"] == True
+    ].drop(columns=["is_kept"])
+
+    return clean_data_df
+
+
+def fill_missing_data(data, method="forward"):
+    """Original fill_missing_data, building the full cartesian product of factors."""
+
+    # Default Info
+    columns_to_keep = [
+        "date",
+        "market",
+        "latitude",
+        "longitude",
+        "commodity",
+        "unit",
+        "usdprice",
+    ]
+
+    # Generate dataframe with full combinations of factors
+    full_data_df = pd.DataFrame(
+        itertools.product(
+            data["date"].unique(),
+            data["market"].unique(),
+            data["commodity"].unique(),
+        ),
+        columns=["date", "market", "commodity"],
+    )
+
+    # Fill the missing value per (date, commodity, market)
+    full_data_df = full_data_df.merge(
+        data, how="left", on=["date", "market", "commodity"]
+    )
+    if method == "forward":
+        full_data_df = full_data_df.merge(
+            full_data_df.groupby(
+                ["market", "commodity"]
+            ).ffill(),
+            how="inner",
+            left_index=True,
+            right_index=True,
+            suffixes=("_drop", None),
+        )
+    full_data_df = full_data_df[columns_to_keep].dropna(
+        subset=["usdprice"], axis=0
+    )
+
+    return full_data_df
+
+
+def get_country_background(country_id, world_path="data/raw/ne_50m_admin_0_countries.json"):
+    """
+    Original get_country_background, embedding the world TopoJSON and filtering it by ISO numeric code.
+    """
+    with open(world_path, "r") as file:
+        country_data = json.load(file)
+    world = alt.Data(values=country_data, format=alt.TopoDataFormat(type="topojson", feature="ne_50m_admin_0_countries"))
+
+    country_map = alt.Chart(world, width="container", height=500).transform_calculate(
+        ISO_N3="datum.properties.ISO_N3"
+    ).transform_filter(
+        (alt.datum.ISO_N3 == f"{country_id:03}")
+    )
+    return country_map.mark_geoshape(
+        fill="lightgray",
+        stroke="white"
+    ).project(
+        type="mercator"
+    )
+
+
+def generate_line_chart(data, widget_date_range, widget_market_values, widget_commodity_values):
+    """
+    Original generate_line_chart, normalizing dates per call and filtering the selection once per commodity.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Cleaned country data.
+    widget_date_range : tuple
+        The start and end dates for filtering the data.
+    widget_market_values : list of str
+        Markets to include in the charts.
+    widget_commodity_values : list of str
+        Commodities for which the line charts will be generated.
+
+    Returns
+    -------
+    list of alt.Chart
+        One line chart per commodity, embedding all columns of the selection.
+    """
+    commodities_data = data[
+        data.date.between(widget_date_range[0], widget_date_range[1])
+        & data.market.isin(widget_market_values)
+    ].copy()
+    commodities_data['date'] = commodities_data['date'].dt.to_period("M").dt.to_timestamp()
+
+    custom_color_scheme = ['#f58518', '#72b7b2', '#eeca3b', '#e45756', '#9d755d',
+                           '#54a24b', '#b279a2', '#4c78a8', '#ff9da6', '#bab0ac']
+    custom_color_scale = alt.Scale(range=custom_color_scheme)
+
+    charts = []
+    for commodity in widget_commodity_values:
+        commodity_data = commodities_data[commodities_data.commodity.isin([commodity])]
+        chart = alt.Chart(commodity_data, width='container', height='container').mark_line(
+            size=3,
+            interpolate='monotone',
+            point=alt.OverlayMarkDef(shape='circle', size=50, filled=True)
+        ).encode(
+            x=alt.X('date:T', axis=alt.Axis(format='%Y-%m', title='Time')),
+            y=alt.Y('usdprice:Q', title='Price in USD', scale=alt.Scale(zero=False)),
+            color=alt.Color('market:N', legend=alt.Legend(title='Market'), scale=custom_color_scale),
+            tooltip=[
+                alt.Tooltip('date:T', title='Time', format='%Y-%m'),
+                alt.Tooltip('usdprice:Q', title='Price in USD', format='.2f')
+            ]
+        ).configure_view(
+            strokeWidth=0,
+        ).configure_axisX(
+            grid=False
+        ).configure_axisY(
+            grid=False
+        )
+        charts.append(chart)
+
+    return charts
+
+
+def download(url, path):
+    """
+    Original download, opening a new connection per file and always transferring it.
+
+    Parameters
+    ----------
+    url : str
+        Location of the file to download.
+    path : str
+        Destination path of the file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with urllib.request.urlopen(url) as response, open(tmp_path, "wb") as file:
+            shutil.copyfileobj(response, file)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_country_csv(location):
+    """
+    Original read of a country dataset, parsing all columns as objects before keeping seven.
+
+    Parameters
+    ----------
+    location : str or file-like
+        Path, URL or in-memory text file of the dataset.
+    """
+    columns_to_keep = [
+        "date",
+        "market",
+        "latitude",
+        "longitude",
+        "commodity",
+        "unit",
+        "usdprice",
+    ]
+
+    return pd.read_csv(
+        location,
+        parse_dates=["date"],
+        header=0,
+        skiprows=[1],
+    )[columns_to_keep]
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets of a single series, one bucket at a time (Steinarsson, 2013)."""
+    n = len(x)
+    every = (n - 2) / (n_out - 2)
+    kept = [0]
+    a = 0
+    for i in range(n_out - 2):
+        avg_start = int((i + 1) * every) + 1
+        avg_stop = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(x[avg_start:avg_stop]) / (avg_stop - avg_start)
+        avg_y = sum(y[avg_start:avg_stop]) / (avg_stop - avg_start)
+
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((x[a] - avg_x) * (y[j] - y[a]) - (x[a] - x[j]) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def expand_datasets(spec):
+    """Copy back the inline data of the datasets sourced from an identical dataset, as compiled before de-duplication."""
+    datasets = {dataset["name"]: dataset for dataset in spec.get("data", [])}
+    return dict(spec, data=[
+        dict(datasets[dataset["source"]], name=dataset["name"]) if set(dataset) == {"name", "source"} else dataset
+        for dataset in spec.get("data", [])
+    ])
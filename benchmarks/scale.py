@@ -0,0 +1,129 @@
+# Benchmark of the cleaning pipeline and the chart callbacks on synthetic countries of millions of rows
+# Generates countries of about --rows rows each with src.synthetic (major commodities, secondary
+# units, duplicated rows and months missing with --pattern), then runs once each, under
+# tracemalloc for its peak memory:
+#     generate            generate_country_data
+#     filter_major_data   the cleaning rules, on the generated data
+#     fill_missing_data   the monthly reindexing of the kept pairs
+#     write store         write_country_data, the frame, cube and line rollups of the store
+# and times the chart callbacks on the stored country over a selection of the largest
+# commodities and --markets markets: the first call with the stored frames and specs not
+# loaded yet, then the p50 of calls over new date ranges.
+# Peak memory is the memory traced while the stage runs, on top of its inputs. Countries of
+# 50M rows need about 13 GB of memory, and 5M rows about 1.3 GB.
+#
+# Usage:
+#     python -m benchmarks.scale [--rows 1000000 5000000] [--pattern random] [--repeat 3]
+import gc
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import src.geo as geo
+from src import store
+from src.app import app
+from src.spec_cache import spec_cache
+from src.data import filter_major_data, fill_missing_data
+from src.synthetic import MISSING_PATTERNS, generate_country_data, size_for_rows
+from src.callbacks import update_geo_area, update_index_commodities_area
+from src.utils import convert_date
+from benchmarks.common import print_table, time_call
+
+
+def measure(func, *args, **kwargs):
+    """Call a function once under tracemalloc, and return its result, its time in ms and its peak memory in MB."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        elapsed = (time.perf_counter() - start) * 1000
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak / 1024 ** 2
+
+
+def time_charts(callback, handle, commodities, markets, end, repeat, country, toggle):
+    """Time a chart callback once cold, then over `repeat` new date ranges."""
+    store._loaded.clear()
+    spec_cache.clear()
+    date_ranges = iter([[end - 2 - step / 12, end] for step in range(repeat + 1)])
+
+    def request():
+        return callback(handle, next(date_ranges), commodities, markets, toggle, country)
+
+    start = time.perf_counter()
+    request()
+    cold = (time.perf_counter() - start) * 1000
+    return cold, time_call(request, repeat=repeat)["p50"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the cleaning pipeline and charts at scale.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    parser.add_argument("--commodities", type=int, default=50)
+    parser.add_argument("--months", type=int, default=240)
+    parser.add_argument("--missing-rate", type=float, default=0.1)
+    parser.add_argument("--pattern", choices=MISSING_PATTERNS, default="random")
+    parser.add_argument("--markets", type=int, default=20, help="number of selected markets in the charts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    store.STORE_DIR = tempfile.mkdtemp(prefix="food_price_bench_store_")
+    geo.GEO_DIR = tempfile.mkdtemp(prefix="food_price_bench_geo_")
+    geo.split_world(geo_dir=geo.GEO_DIR)
+    country = "Syria"
+    size = dict(
+        n_commodities=args.commodities, n_months=args.months, missing_rate=args.missing_rate,
+        major_commodities=args.commodities // 5, duplicate_rate=0.02,
+    )
+
+    pipeline_rows, chart_rows = [], []
+    for n_rows in args.rows:
+        data, elapsed, peak = measure(
+            generate_country_data, size_for_rows(n_rows, **size), **size,
+            seed=args.seed, missing_pattern=args.pattern, unit_variants=2,
+        )
+        stages = [("generate", len(data), elapsed, peak)]
+
+        filtered, elapsed, peak = measure(filter_major_data, data)
+        stages.append(("filter_major_data", len(filtered), elapsed, peak))
+        del data
+
+        clean, elapsed, peak = measure(fill_missing_data, filtered)
+        stages.append(("fill_missing_data", len(clean), elapsed, peak))
+        del filtered
+
+        handle, elapsed, peak = measure(store.write_country_data, country, clean)
+        stages.append(("write store", len(clean), elapsed, peak))
+
+        for stage, rows, elapsed, peak in stages:
+            pipeline_rows.append({
+                "target rows": n_rows, "stage": stage, "rows out": rows, "ms": elapsed, "peak MB": peak,
+            })
+
+        commodities = list(clean["commodity"].value_counts().index[:4])
+        markets = sorted(clean["market"].unique())[:args.markets]
+        end = convert_date(clean["date"].max(), "label")
+        del clean
+        # the index and commodities charts are drawn with the geo toggle off, the map with it on
+        for callback, toggle in ((update_index_commodities_area, False), (update_geo_area, True)):
+            with app.server.app_context():
+                cold, p50 = time_charts(callback, handle, commodities, markets, end, args.repeat, country, toggle)
+            chart_rows.append({
+                "target rows": n_rows, "callback": callback.__name__, "cold ms": cold, "p50 ms": p50,
+            })
+
+    print_table(
+        f"Cleaning pipeline on synthetic countries of {args.commodities} commodities x {args.months} months, "
+        f"{args.pattern} missing months",
+        pipeline_rows,
+    )
+    print_table(f"Chart callbacks on 4 commodities x {args.markets} markets of the stored countries", chart_rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# Benchmark of the dashboard startup
+# Measures the import time of src.data and src.app, and the time to the first
+# served page (index and layout requests), with cold and warm caches.
+#
+# Usage:
+#     python -m benchmarks.startup [--countries 100] [--repeat 3]
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from benchmarks.common import print_table
+from benchmarks.country_index import write_full_index
+
+
+FIRST_PAGE_CODE = """
+import json, time
+start = time.perf_counter()
+import src.app
+imported = time.perf_counter()
+client = src.app.server.test_client()
+client.get("/").close()
+client.get("/_dash-layout").close()
+served = time.perf_counter()
+print(json.dumps({"import": (imported - start) * 1000, "first_page": (served - imported) * 1000}))
+"""
+
+
+def run_startup(env):
+    """Import the app and serve the first page in a fresh interpreter, timings in milliseconds."""
+    output = subprocess.run(
+        [sys.executable, "-c", FIRST_PAGE_CODE], env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def time_import(module, env):
+    """Time the import of a module in a fresh interpreter, in milliseconds."""
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True
+    )
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def summarize(stage, timings):
+    return {
+        "stage": stage,
+        "p50": statistics.median(timings),
+        "max": max(timings),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard startup.")
+    parser.add_argument("--countries", type=int, default=100, help="number of countries in the index")
+    parser.add_argument("--repeat", type=int, default=3, help="number of fresh interpreters per scenario")
+    args = parser.parse_args(argv)
+
+    tmp_dir = tempfile.mkdtemp(prefix="food_price_bench_")
+    write_full_index(tmp_dir, args.countries)
+
+    # Offline mirror, so that timings do not depend on HDX being reachable
+    env = dict(
+        os.environ,
+        FOOD_PRICE_SOURCE="mirror",
+        FOOD_PRICE_MIRROR_DIR=tmp_dir,
+        FOOD_PRICE_COUNTRY_NAMES=os.path.join(tmp_dir, "country_names.csv"),
+        FOOD_PRICE_STORE_DIR=os.path.join(tmp_dir, "store"),
+    )
+    env.pop("FOOD_PRICE_WARM_UP", None)
+    warm_env = dict(env, FOOD_PRICE_WARM_UP="1")
+
+    rows = [
+        summarize("import src.data", [time_import("src.data", env) for _ in range(args.repeat)]),
+        summarize("import src.app", [time_import("src.app", env) for _ in range(args.repeat)]),
+    ]
+
+    cold = []
+    for _ in range(args.repeat):
+        if os.path.exists(env["FOOD_PRICE_COUNTRY_NAMES"]):
+            os.remove(env["FOOD_PRICE_COUNTRY_NAMES"])
+        cold.append(run_startup(env))
+    warm = [run_startup(env) for _ in range(args.repeat)]
+    warmed_up = [run_startup(warm_env) for _ in range(args.repeat)]
+
+    rows += [
+        summarize("first page, cold names", [run["first_page"] for run in cold]),
+        summarize("first page, persisted names", [run["first_page"] for run in warm]),
+        summarize("import with warm-up", [run["import"] for run in warmed_up]),
+        summarize("first page after warm-up", [run["first_page"] for run in warmed_up]),
+    ]
+
+    print_table(f"Startup with {args.countries} countries in the index (ms)", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# Benchmark of the overhead of the stage tracing
+# Times an empty span and a call of a traced function with tracing off and on, and chart
+# requests (update_index_commodities_area on the bundled Japan data) in processes started
+# with tracing off and on. Off, spans are a shared no-op context and traced functions are
+# left undecorated, so only the check of the span() call remains.
+#
+# Usage:
+#     python -m benchmarks.tracing_overhead [--calls 100000]
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+import src.tracing as tracing
+from src import store
+from src.data import get_clean_data, read_country_csv
+from src.callbacks import update_index_commodities_area
+from src.utils import convert_date
+from benchmarks.common import print_table, time_call
+
+
+def per_call_ns(func, calls):
+    """Return the mean time of a call of a function in nanoseconds."""
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        func()
+    return (time.perf_counter_ns() - start) / calls
+
+
+def time_request(repeat):
+    """Time chart requests on the Japan data, traced if $FOOD_PRICE_TRACING was set at import."""
+    store.STORE_DIR = tempfile.mkdtemp(prefix="food_price_bench_store_")
+    data = get_clean_data(read_country_csv("data/raw/wfp_food_prices_jpn.csv"))
+    handle = store.write_country_data("Japan", data)
+    markets = list(data["market"].unique())
+    commodities = list(data["commodity"].unique())
+    end = convert_date(data["date"].max(), "label")
+    date_ranges = iter([[end - 2 - step / 12, end] for step in range(repeat + 1)])
+
+    def request():
+        # a new date range on each call, so that specs are compiled rather than read from the cache
+        with tracing.trace_request("update_index_commodities_area", "Japan"):
+            return update_index_commodities_area(handle, next(date_ranges), commodities, markets, False, "Japan")
+
+    request()
+    result = time_call(request, repeat=repeat)
+    return {"p50": result["p50"], "p95": result["p95"]}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of the stage tracing.")
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--request", action="store_true", help="only time chart requests, printed as JSON")
+    args = parser.parse_args(argv)
+
+    if args.request:
+        print(json.dumps(time_request(args.repeat)))
+        return
+
+    def empty_span():
+        with tracing.span("empty"):
+            pass
+
+    def function():
+        return None
+
+    rows = []
+    for enabled in (False, True):
+        tracing.TRACING = enabled
+        traced_function = tracing.traced("function")(function)
+        rows.append({
+            "tracing": "on" if enabled else "off",
+            "span ns": per_call_ns(empty_span, args.calls),
+            "traced call ns": per_call_ns(traced_function, args.calls),
+            "plain call ns": per_call_ns(function, args.calls),
+        })
+    print_table(f"Overhead of {args.calls} spans and traced calls", rows)
+
+    rows = []
+    for enabled in (False, True):
+        env = dict(os.environ, FOOD_PRICE_TRACING="1" if enabled else "")
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.tracing_overhead", "--request", "--repeat", str(args.repeat)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(output.splitlines()[-1])
+        rows.append({"tracing": "on" if enabled else "off", "request p50 ms": result["p50"], "request p95 ms": result["p95"]})
+    print_table("Chart request on the Japan data, in a process started with tracing off and on", rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Benchmark of chart compilation through the shared VegaFusion runtime
+# Compares compiling the figure and line charts of a selection one by one with
+# chart.to_dict(format="vega") against a single batch with compile_charts().
+#
+# Usage:
+#     python -m benchmarks.vega_runtime [--markets 10] [--commodities 6]
+import argparse
+
+import src.plotting as plotting
+from benchmarks.common import time_call, print_table, make_country_data
+from src.cube import PriceCube
+from src.vega_runtime import compile_charts, runtime_stats
+
+
+BASE_SIZE = {"n_markets": 150, "n_commodities": 50, "n_months": 240, "pair_density": 0.3}
+
+
+def build_charts(data, cube, date_range, markets, commodities):
+    """Build the figure and line charts of a selection, without compiling them."""
+    figure_charts = plotting.plot_figure_charts(cube.price_summary(date_range, markets, commodities), commodities)
+    line_charts = plotting.generate_line_chart(data, date_range, markets, commodities)
+    return figure_charts + line_charts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark chart compilation through the shared VegaFusion runtime.")
+    parser.add_argument("--markets", type=int, default=10, help="number of selected markets")
+    parser.add_argument("--commodities", type=int, default=6, help="number of selected commodities")
+    parser.add_argument("--repeat", type=int, default=5, help="number of timed calls")
+    args = parser.parse_args(argv)
+
+    data = make_country_data(**BASE_SIZE)
+    cube = PriceCube.from_frame(data)
+    date_range = (data.date.min(), data.date.max())
+    markets = list(data.market.unique()[:args.markets])
+    commodities = list(data.commodity.value_counts().index[:args.commodities])
+
+    def one_by_one():
+        return [chart.to_dict(format="vega") for chart in build_charts(data, cube, date_range, markets, commodities)]
+
+    def batched():
+        return compile_charts(build_charts(data, cube, date_range, markets, commodities))
+
+    # Warm up the Vega-Lite compiler and the runtime
+    one_by_one()
+    batched()
+
+    separate = time_call(one_by_one, repeat=args.repeat)
+    batch = time_call(batched, repeat=args.repeat)
+    stats = runtime_stats()
+
+    print_table(
+        f"Compile {2 * len(commodities)} charts over {len(markets)} markets (ms)",
+        [
+            {"stage": "to_dict per chart", "p50": separate["p50"], "p95": separate["p95"]},
+            {"stage": "compile_charts batch", "p50": batch["p50"], "p95": batch["p95"]},
+        ],
+    )
+    print_table(
+        "VegaFusion runtime",
+        [{
+            "batches": stats["batches"],
+            "charts": stats["charts"],
+            "prepare ms/chart": stats["prepare_ms"] / stats["charts"],
+            "transform ms/chart": stats["transform_ms"] / stats["charts"],
+            "cache hit rate": stats["cache_hit_rate"],
+            "cache entries": stats["cache_entries"],
+        }],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,12 @@
+import os
+import uuid
+
 from dash import Dash, html, dcc
 import dash_bootstrap_components as dbc
 import dash_daq as daq
 
 from src.cache_config import init_cache
+from src.compression import init_compression, compression_stats
 
 # Initialize the app (using bootstrap theme)
 app = Dash(
@@ -14,7 +18,17 @@ app = Dash(
 server = app.server
 
 init_cache(app.server)
+init_compression(app.server)
 import src.callbacks
+from flask import jsonify, Response
+from src.spec_cache import spec_cache
+from src.vega_runtime import runtime_stats
+from src.coalesce import coalescer
+from src.jobs import job_stats
+from src.tracing import tracing_stats, prometheus_metrics
+from src.cache_config import cache_stats
+from src.geo import load_geo_index
+from src.store import get_latest_handle, load_country_data, load_country_cube, load_frame_index
 from src.plotting import *
 from src.data import *
 
@@ -75,7 +89,16 @@ sidebar = dbc.Col([
                 placeholder="Select a country...",
                 style={'width': '100%'}
             )),
-        ])]),
+        ]),
+        # Progress of the background job loading the selected country
+        dbc.Progress(
+            id="country-progress",
+            value=0,
+            striped=True,
+            animated=True,
+            style={"display": "none"},
+            className="mt-2"
+        )]),
         html.Div([dbc.Row([
             dbc.Col(html.Label("Date Range")),
         ], id="date-range-label"),
@@ -155,58 +178,130 @@ content = dbc.Col(
     children=[
                 dbc.Row(id="index-area", children=[], style={"width":"100%", "padding":"0px", "margin":"0px"}),
                 dbc.Row(id="commodities-area", children=[], align="center", style={"width":"100%", "padding":"0px", "margin":"0px"}),
-                dbc.Row(id='geo-area', children=[])
+                dbc.Row(id='geo-area', children=[], style={"width":"100%", "padding":"0px", "margin":"0px", "display":"none"})
         ],
     style={"width":"100%", "padding":0, "margin":0}
 )
 
 # Layout (better default layout when using with bootstrap)
-app.layout = dbc.Container([
-    dbc.Row([
-        dbc.Col([topbar]),
-        dbc.Col([], md=3,)
-    ], style={
-        'backgroundColor': 'rgba(204, 85, 0, 0.6)',  # Color #CC5500 with 60% opacity
-        'padding-top': '4px',  # Center vertically, while keeping objects constant when expanding
-        'padding-bottom': '4px',  # Center vertically, while keeping objects constant when expanding
-        'height': '88px',  # min-height to allow expansion
-    }),
-    dbc.Row([
-        sidebar,
-        dbc.Col(
-            html.Div([
-                content,
+def serve_layout():
+    """
+    Build the layout on each page load.
+
+    The country index is fetched when the first page is served rather than at
+    import time, so workers start without reaching the data source.
+    """
+    return dbc.Container([
+        dbc.Row([
+            dbc.Col([topbar]),
+            dbc.Col([], md=3,)
+        ], style={
+            'backgroundColor': 'rgba(204, 85, 0, 0.6)',  # Color #CC5500 with 60% opacity
+            'padding-top': '4px',  # Center vertically, while keeping objects constant when expanding
+            'padding-bottom': '4px',  # Center vertically, while keeping objects constant when expanding
+            'height': '88px',  # min-height to allow expansion
+        }),
+        dbc.Row([
+            sidebar,
+            dbc.Col(
                 html.Div([
-                    html.Hr(),
-                    html.Footer(
-                        html.Em(
-                            "Glossary:    MoM - month-over-month percentage change.    YoY - year-over-year percentage change.",
-                            style={'fontSize': 14, "margin-bottom":"0"}
-                            ), 
-                    )
-                ])
-                ],
-            style={'height': 'calc(100vh - 88px)', 'width': '100%', 'padding': '15px', 'margin': '0', "justify-content": "space-between", 'display': 'flex', 'flex-direction': 'column',}),
-            style={"overflow":"auto", "margin": 0, "padding": 0, "width": "100%"})
-    ]),
-        dcc.Store(
-            id="country-index",
-            data=fetch_country_index(),
-            storage_type="session"
-        ),
-        dcc.Store(
-            id="country-data",
-            storage_type="session"
-        ), 
-        dcc.Store(
-            id = "widget-state",
-            storage_type="session"
-        ),
-        dcc.Store(
-            id = "commodities-charts",
-            storage_type="session"
-        )
-], fluid=True)
+                    content,
+                    html.Div([
+                        html.Hr(),
+                        html.Footer(
+                            html.Em(
+                                "Glossary:    MoM - month-over-month percentage change.    YoY - year-over-year percentage change.",
+                                style={'fontSize': 14, "margin-bottom":"0"}
+                                ), 
+                        )
+                    ])
+                    ],
+                style={'height': 'calc(100vh - 88px)', 'width': '100%', 'padding': '15px', 'margin': '0', "justify-content": "space-between", 'display': 'flex', 'flex-direction': 'column',}),
+                style={"overflow":"auto", "margin": 0, "padding": 0, "width": "100%"})
+        ]),
+            dcc.Store(
+                id="country-index",
+                data=fetch_country_index(),
+                storage_type="session"
+            ),
+            dcc.Store(
+                id="country-data",
+                storage_type="session"
+            ), 
+            dcc.Store(
+                id = "widget-state",
+                storage_type="session"
+            ),
+            # Identifies the page for the coalescing of its chart requests
+            dcc.Store(
+                id="session-id",
+                data=uuid.uuid4().hex
+            )
+    ], fluid=True)
+
+
+app.layout = serve_layout
+
+
+@server.route("/chart-stats")
+def serve_chart_stats():
+    """Serve the spec cache, VegaFusion runtime, request coalescing, background job, compression and stage metrics of this worker."""
+    return jsonify(
+        spec_cache=dict(spec_cache.stats, entries=len(spec_cache), bytes=spec_cache.size),
+        vegafusion=runtime_stats(),
+        coalescing=coalescer.stats(),
+        jobs=job_stats(),
+        compression=compression_stats(),
+        tracing=tracing_stats(),
+    )
+
+
+@server.route("/metrics")
+def serve_metrics():
+    """Serve the stage timings and the metrics of /chart-stats and /cache-stats of this worker for Prometheus."""
+    vegafusion = {key: value for key, value in runtime_stats().items() if key != "recent"}
+    return Response(
+        prometheus_metrics({
+            "cache": cache_stats(),
+            "spec_cache": dict(spec_cache.stats, entries=len(spec_cache), bytes=spec_cache.size),
+            "vegafusion": vegafusion,
+            "coalescing": coalescer.stats(),
+            "jobs": job_stats(),
+            "compression": compression_stats(),
+        }),
+        mimetype="text/plain; version=0.0.4",
+    )
+
+
+def warm_up(countries=("Japan",)):
+    """
+    Load the data served on the first page ahead of the first request.
+
+    Fetches the country index and the map index, and loads the stored data and
+    map background of `countries`. Runs at import time when $FOOD_PRICE_WARM_UP
+    is set, e.g. in a gunicorn master started with --preload.
+
+    Parameters
+    ----------
+    countries : tuple of str, optional
+        Countries to warm up. Defaults to the country selected on page load.
+    """
+    with app.server.app_context():
+        country_index = fetch_country_index()
+        get_country_options(country_index)
+        load_geo_index()
+
+        for country in countries:
+            handle = get_latest_handle(country)
+            if handle is not None:
+                load_country_data(handle)
+                load_country_cube(handle)
+                load_frame_index(handle)
+            get_country_background(get_country_iso_numeric(country))
+
+
+if os.environ.get("FOOD_PRICE_WARM_UP"):
+    warm_up()
 
   
 if __name__ == '__main__':
@@ -0,0 +1,217 @@
+# Script containing the tiered Flask-Caching backend configured in cache_config.py
+# A per-process in-memory LRU sits in front of an optional shared Redis backend,
+# so hot values are served without I/O while workers still share computed results.
+import time
+import pickle
+import threading
+
+from collections import OrderedDict
+from flask_caching.backends.base import BaseCache
+from src.tracing import span
+
+
+class TieredCache(BaseCache):
+    """
+    Flask-Caching backend with a bounded in-memory LRU in front of a shared Redis backend.
+
+    Values are pickled once on `set`. The local tier keeps the pickled bytes, so that
+    its memory cap is exact and callers never share mutable cached objects.
+
+    Parameters
+    ----------
+    redis_client : redis.Redis, optional
+        Client of the shared tier. Without a client, only the local tier is used.
+    default_timeout : int, optional
+        Default time to live in seconds, 0 meaning no expiry. Defaults to 300.
+    max_entries : int, optional
+        Maximum number of values in the local tier. Defaults to 256.
+    max_bytes : int, optional
+        Maximum total size in bytes of the values in the local tier. Defaults to 256 MiB.
+    local_timeout : int, optional
+        Maximum time to live in seconds of values in the local tier when a shared tier
+        is used, so that deletions by other processes are seen. Defaults to 60.
+    key_prefix : str, optional
+        Prefix of the keys in the shared tier. Defaults to "food_price:".
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        default_timeout=300,
+        max_entries=256,
+        max_bytes=256 * 1024 ** 2,
+        local_timeout=60,
+        key_prefix="food_price:",
+    ):
+        super().__init__(default_timeout)
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.local_timeout = local_timeout
+        self.key_prefix = key_prefix
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        url = config.get("CACHE_REDIS_URL")
+        if url:
+            kwargs["redis_client"] = create_redis_client(url)
+        kwargs.update(
+            max_entries=config.get("CACHE_MAX_ENTRIES", 256),
+            max_bytes=config.get("CACHE_MAX_BYTES", 256 * 1024 ** 2),
+            local_timeout=config.get("CACHE_LOCAL_TIMEOUT", 60),
+            key_prefix=config.get("CACHE_KEY_PREFIX") or "food_price:",
+        )
+        return cls(*args, **kwargs)
+
+    def _record(self, key, event):
+        """Count a hit, miss or eviction under the function name of a memoized key."""
+        name = key.split(":", 1)[0] if ":" in key else "other"
+        counters = self._stats.setdefault(name, {"hits": 0, "misses": 0, "evictions": 0})
+        counters[event] += 1
+
+    def _expiry(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.monotonic() + timeout if timeout > 0 else None
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            blob, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                self._bytes -= len(self._entries.pop(key)[0])
+                return None
+            self._entries.move_to_end(key)
+            return blob
+
+    def _local_set(self, key, blob, expires):
+        if len(blob) > self.max_bytes:
+            self._local_delete(key)
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key)[0])
+            self._entries[key] = (blob, expires)
+            self._bytes += len(blob)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted_key, (evicted_blob, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted_blob)
+                self._record(evicted_key, "evictions")
+
+    def _local_delete(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry[0])
+            return entry is not None
+
+    def _local_expiry(self, timeout):
+        """Expiry of a value in the local tier, bounded by `local_timeout` when a shared tier is used."""
+        timeout = self._normalize_timeout(timeout)
+        if self.redis is not None and self.local_timeout > 0:
+            timeout = min(timeout, self.local_timeout) if timeout > 0 else self.local_timeout
+        return self._expiry(timeout)
+
+    def get(self, key):
+        with span("cache_get"):
+            blob = self._local_get(key)
+            if blob is None and self.redis is not None:
+                blob = self.redis.get(self.key_prefix + key)
+                if blob is not None:
+                    self._local_set(key, blob, self._local_expiry(None))
+
+            with self._lock:
+                self._record(key, "misses" if blob is None else "hits")
+
+            return None if blob is None else pickle.loads(blob)
+
+    def set(self, key, value, timeout=None):
+        with span("cache_set"):
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            if self.redis is not None:
+                timeout = self._normalize_timeout(timeout)
+                self.redis.set(self.key_prefix + key, blob, ex=timeout if timeout > 0 else None)
+            self._local_set(key, blob, self._local_expiry(timeout))
+            return True
+
+    def add(self, key, value, timeout=None):
+        if self.has(key):
+            return False
+        return self.set(key, value, timeout)
+
+    def delete(self, key):
+        deleted = self._local_delete(key)
+        if self.redis is not None:
+            deleted = bool(self.redis.delete(self.key_prefix + key)) or deleted
+        return deleted
+
+    def has(self, key):
+        if self._local_get(key) is not None:
+            return True
+        return self.redis is not None and bool(self.redis.exists(self.key_prefix + key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.redis is not None:
+            keys = list(self.redis.scan_iter(match=self.key_prefix + "*"))
+            if keys:
+                self.redis.delete(*keys)
+        return True
+
+    def stats(self):
+        """
+        Return the cache metrics.
+
+        Returns
+        -------
+        dict
+            Hits, misses and local tier evictions per memoized function, and the
+            number of entries and bytes held by the local tier.
+        """
+        with self._lock:
+            return {
+                "functions": {name: dict(counters) for name, counters in self._stats.items()},
+                "local_entries": len(self._entries),
+                "local_bytes": self._bytes,
+                "shared": self.redis is not None,
+            }
+
+
+def create_redis_client(url):
+    """
+    Create the client of the shared tier from a URL.
+
+    Parameters
+    ----------
+    url : str
+        "redis://..." for a Redis server, or "fakeredis://" for an in-process stand-in.
+
+    Returns
+    -------
+    redis.Redis
+        The client.
+    """
+    if url.startswith("fakeredis://"):
+        try:
+            import fakeredis
+        except ImportError as e:
+            raise RuntimeError("fakeredis is required for a fakeredis:// cache URL") from e
+        return fakeredis.FakeRedis()
+
+    try:
+        import redis
+    except ImportError as e:
+        raise RuntimeError("redis is required for a redis:// cache URL") from e
+    return redis.Redis.from_url(url)
+
+
+if __name__ == "__main__":
+    pass
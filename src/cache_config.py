@@ -1,12 +1,53 @@
+import os
+from flask import jsonify
 from flask_caching import Cache
 
+# Time to live in seconds of each memoized function, 0 meaning no expiry.
+# Each can be overridden with $FOOD_PRICE_CACHE_TTL_<NAME>, e.g. $FOOD_PRICE_CACHE_TTL_FETCH_COUNTRY_INDEX.
+TIMEOUTS = {
+    "fetch_country_index": 3600,
+    "get_country_background": 0,
+}
+
 # Create a cache instance
 cache = Cache(
     config={
-        'CACHE_TYPE': 'filesystem',
-        'CACHE_DIR': 'tmp', 
+        'CACHE_TYPE': 'src.cache_backend.TieredCache',
+        'CACHE_REDIS_URL': os.environ.get('FOOD_PRICE_CACHE_URL'),
+        'CACHE_MAX_ENTRIES': int(os.environ.get('FOOD_PRICE_CACHE_MAX_ENTRIES', 256)),
+        'CACHE_MAX_BYTES': int(os.environ.get('FOOD_PRICE_CACHE_MAX_BYTES', 256 * 1024 ** 2)),
+        'CACHE_LOCAL_TIMEOUT': int(os.environ.get('FOOD_PRICE_CACHE_LOCAL_TIMEOUT', 60)),
         "CACHE_DEFAULT_TIMEOUT": 600
     }
 )
+
+
+def get_timeout(name):
+    """Return the time to live in seconds of a memoized function."""
+    return int(os.environ.get(f"FOOD_PRICE_CACHE_TTL_{name.upper()}", TIMEOUTS.get(name, 600)))
+
+
+def memoize(f):
+    """
+    Memoize a function through the shared cache with its own time to live.
+
+    Cache keys are prefixed with the function name, so that the backend
+    reports hits, misses and evictions per memoized function.
+    """
+    memoized = cache.memoize(timeout=get_timeout(f.__name__))(f)
+    make_cache_key = memoized.make_cache_key
+    memoized.make_cache_key = lambda *args, **kwargs: f"{f.__name__}:{make_cache_key(*args, **kwargs)}"
+    return memoized
+
+
+def cache_stats():
+    """Return the metrics of the cache backend of the current app."""
+    return cache.cache.stats()
+
+
 def init_cache(server):
-    cache.init_app(server)
\ No newline at end of file
+    cache.init_app(server)
+
+    @server.route("/cache-stats")
+    def serve_cache_stats():
+        return jsonify(cache_stats())
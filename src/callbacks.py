@@ -3,23 +3,36 @@
 
 from dash import html, Input, Output, State, callback
 
-import jsonpickle
+import json
 import pandas as pd
 import dash_vega_components as dvc
 import dash_bootstrap_components as dbc
 import dash_daq as daq
 
+from io import StringIO
 from dash.exceptions import PreventUpdate
-from src.cache_config import cache
 from src.data import *
+from src.cleaning_state import clean_country_data
+from src.lod import LINE_CHART_WIDTH, line_max_points
+from src.store import write_country_data, load_country_data, load_country_cube, load_frame_index, load_line_levels, get_latest_handle, check_handle
 from src.plotting import *
-from src.utils import convert_date, compile_widget_state, compare_widget_state
+from src.spec_cache import spec_cache, chart_key
+from src.vega_runtime import compile_charts
+from src.coalesce import coalescer, StaleRequest
+from src.tracing import span, trace_request
+from src.jobs import job_manager, job_pool, JOB_POLL_INTERVAL
+from src.utils import convert_date, compile_widget_state
 
-from io import StringIO
+# Placeholder of the widget values while the data of a new country is loading
+LOADING_VALUE = 'Loading Data...'
 
 
 @callback(
-    Output("content-area", "children"), 
+    [
+        Output("geo-area", "style"),
+        Output("index-area", "style"),
+        Output("commodities-area", "style"),
+    ],
     [
         Input("geo-toggle", "on"), 
     ]
@@ -27,6 +40,9 @@ from io import StringIO
 def toggle_chart_view(toggle = False): 
     """Toggle between geo and chart views 
 
+    The areas stay in the layout and are only shown or hidden, so that the charts are
+    redrawn by draw_charts() without sending the content area back to the server.
+
     Parameters
     ----------
     toggle : bool
@@ -34,22 +50,16 @@ def toggle_chart_view(toggle = False):
 
     Returns
     -------
-    dbc.Row
-        dbc elements corresponding to geo or typical charts. 
+    tuple of dict
+        Styles of the geo, index and commodities areas. 
     """
+    shown = {"width":"100%", "padding":"0px", "margin":"0px"}
+    hidden = {**shown, "display":"none"}
     if toggle: 
-        return [
-            dbc.Col(id="geo-area", children=[], style={"width":"100%", "padding":"0px", "margin":"0px"}), 
-            dbc.Row(id="index-area", children=[], style={"width":"100%", "padding":"0px", "margin":"0px", "display":"none"}),
-            dbc.Row(id="commodities-area", children=[], align="center", style={"width":"100%", "padding":"0px", "margin":"0px", "display":"none"})
-        ]
+        return shown, hidden, hidden
     
     else: 
-        return [
-            dbc.Col(id="geo-area", children=[], style={"width":"100%", "padding":"0px", "margin":"0px", "display":"none"}), 
-            dbc.Row(id="index-area", children=[], style={"width":"100%", "padding":"0px", "margin":"0px"}),
-            dbc.Row(id="commodities-area", children=[], align="center", style={"width":"100%", "padding":"0px", "margin":"0px"})
-        ]
+        return hidden, shown, shown
 
 
 @callback(
@@ -68,7 +78,7 @@ def toggle_chart_view(toggle = False):
     [Input("country-index", "data"), Input("country-data", "data"), 
      State("geo-toggle", "on"), State("country-dropdown", "value")],
 )
-def update_widget_values(country_index_json, country_json, toggle, country):
+def update_widget_values(country_index_json, country_handle, toggle, country):
     """
     Update widget options when a new country is selected.
 
@@ -77,8 +87,8 @@ def update_widget_values(country_index_json, country_json, toggle, country):
     country_index_json : str
         JSON string representing the index of the country data, used for populating country options.
 
-    country_json : str
-        JSON string representing the country data, used for extracting commodity, market, and date information.
+    country_handle : dict
+        Handle of the stored country data, used for extracting commodity, market, and date information.
 
     n_clicks : int
         The number of times the update button has been clicked (not used in the function, but required for callback).
@@ -96,63 +106,61 @@ def update_widget_values(country_index_json, country_json, toggle, country):
         lists of commodity options and default commodity selection,
         lists of market options and default market selection, and country options list.
     """
-    country_index = pd.read_json(StringIO(country_index_json), orient="split")
-
-    country_data = pd.read_json(StringIO(country_json), orient="split")
-
-    min_date_allowed = convert_date(country_data.date.min(), 'label')
-    max_date_allowed = convert_date(country_data.date.max(), 'label')
-    start_date = convert_date(max(country_data.date.max() + pd.tseries.offsets.DateOffset(years=-2), country_data.date.min()), 'label')
-    end_date = convert_date(country_data.date.max(), 'label')
-    date_step = 1/12
-    date_range = [start_date, end_date]
-
-    commodities_options = country_data.commodity.value_counts().index.tolist()
-    commodities_selection = commodities_options[:2]
-
-    markets_options = country_data.market.value_counts().index.tolist()
-    markets_selection = markets_options[:2]
-
-    country_options = sorted(country_index.index.to_list())
-
-    output = (
-        min_date_allowed,
-        max_date_allowed,
-        date_step,
-        date_range,
-        commodities_options,
-        commodities_selection,
-        markets_options,
-        markets_selection,
-        country_options,
-        compile_widget_state(
-            None, 
-            None, 
-            None,
-            None, 
-            None
+    with trace_request("update_widget_values", country):
+        check_handle(country_handle, get_country_options(country_index_json))
+        country_data = load_country_data(country_handle)
+
+        min_date_allowed = convert_date(country_data.date.min(), 'label')
+        max_date_allowed = convert_date(country_data.date.max(), 'label')
+        start_date = convert_date(max(country_data.date.max() + pd.tseries.offsets.DateOffset(years=-2), country_data.date.min()), 'label')
+        end_date = convert_date(country_data.date.max(), 'label')
+        date_step = 1/12
+        date_range = [start_date, end_date]
+
+        commodities_options = country_data.commodity.value_counts().index.tolist()
+        commodities_selection = commodities_options[:2]
+
+        markets_options = country_data.market.value_counts().index.tolist()
+        markets_selection = markets_options[:2]
+
+        country_options = get_country_options(country_index_json)
+
+        output = (
+            min_date_allowed,
+            max_date_allowed,
+            date_step,
+            date_range,
+            commodities_options,
+            commodities_selection,
+            markets_options,
+            markets_selection,
+            country_options,
+            compile_widget_state(
+                None, 
+                None, 
+                None,
+                None, 
+                None
+            )
         )
-    )
 
     return output
 
 
-@callback(
-    Output("country-data", "data"),
-    [Input("country-dropdown", "value"), Input("country-index", "data")],
-    running=[
-            (Output("date-range", "disabled"), True, False),
-            (Output("date-range", "tooltip"), None, {"placement": "bottom", "always_visible": True, 'transform': 'dateParser'}),
-            (Output("commodities-dropdown", "disabled"), True, False),
-            (Output("markets-dropdown", "disabled"), True, False),
-            (Output("country-dropdown", "disabled"), True, False),
-            (Output("geo-toggle", "disabled"), True, False),
-            ]
-)
-@cache.memoize()
-def update_country_data(country, country_index):
+# Widgets disabled while the data of a country is loading
+COUNTRY_LOADING_RUNNING = [
+    (Output("date-range", "disabled"), True, False),
+    (Output("date-range", "tooltip"), None, {"placement": "bottom", "always_visible": True, 'transform': 'dateParser'}),
+    (Output("commodities-dropdown", "disabled"), True, False),
+    (Output("markets-dropdown", "disabled"), True, False),
+    (Output("country-dropdown", "disabled"), True, False),
+    (Output("geo-toggle", "disabled"), True, False),
+]
+
+
+def prepare_country_data(country, country_index, set_progress=None):
     """
-    Update country data from country widget selection
+    Prepare the data of a country in the store, downloading and cleaning it if needed.
 
     Parameters
     ----------
@@ -160,17 +168,100 @@ def update_country_data(country, country_index):
         string of selected country, e.g., "Japan"
     country_index : pd.DataFrame.to_json()
         JSONify'd version of a pd.DataFrame, the output of fetch_country_index()
+    set_progress : callable, optional
+        Called with the (value, label) of the progress bar at each step.
 
     Returns
     -------
-    json
-        JSON version of dataframe of WFP data from the given country, retrieved from the HDX and minimially preprocessed.
+    dict
+        Handle of the stored dataframe of WFP data from the given country, retrieved from the HDX and preprocessed.
+        Use load_country_data() to retrieve the dataframe.
 
     """
-    data = fetch_country_data(country, country_index)
-    data = get_clean_data(data)
-
-    return data
+    set_progress = set_progress or (lambda progress: None)
+
+    # Serve data prepared by the sync process (src/sync.py) or an earlier request, unless
+    # the country index lists newer data
+    country_index_df = pd.read_json(StringIO(country_index), orient="split")
+    handle = get_latest_handle(country, end_date=country_index_df.loc[country, "end_date"])
+    if handle is not None:
+        return handle
+
+    with trace_request("update_country_data", country):
+        set_progress((20, f"Downloading {country} prices"))
+        data = fetch_country_data(country, country_index)
+        # Record the end of the source data rather than of the cleaned data, which loses
+        # the last months of commodities dropped by the cleaning rules
+        source_end_date = data.date.max().date().isoformat()
+        set_progress((60, "Cleaning data"))
+        data = clean_country_data(country, data)
+        set_progress((90, "Storing data"))
+
+        with span("write_country_data"):
+            return write_country_data(country, data, source_end_date=source_end_date)
+
+
+if job_manager is None:
+    @callback(
+        Output("country-data", "data"),
+        [Input("country-dropdown", "value"), Input("country-index", "data")],
+        running=COUNTRY_LOADING_RUNNING
+    )
+    def update_country_data(country, country_index):
+        """
+        Update country data from country widget selection
+
+        Parameters
+        ----------
+        country : str
+            string of selected country, e.g., "Japan"
+        country_index : pd.DataFrame.to_json()
+            JSONify'd version of a pd.DataFrame, the output of fetch_country_index()
+
+        Returns
+        -------
+        dict
+            Handle of the stored dataframe of WFP data from the given country.
+
+        """
+        return prepare_country_data(country, country_index)
+
+else:
+    # A new country selection terminates the job of the previous one
+    @callback(
+        Output("country-data", "data"),
+        [Input("country-dropdown", "value"), Input("country-index", "data")],
+        running=COUNTRY_LOADING_RUNNING + [
+            (Output("country-progress", "style"), {"display": "flex"}, {"display": "none"}),
+        ],
+        background=True,
+        manager=job_manager,
+        progress=[Output("country-progress", "value"), Output("country-progress", "label")],
+        progress_default=[0, ""],
+        interval=JOB_POLL_INTERVAL,
+    )
+    def update_country_data(set_progress, country, country_index):
+        """
+        Update country data from country widget selection, in a background job.
+
+        Parameters
+        ----------
+        set_progress : callable
+            Sets the value and label of the progress bar.
+        country : str
+            string of selected country, e.g., "Japan"
+        country_index : pd.DataFrame.to_json()
+            JSONify'd version of a pd.DataFrame, the output of fetch_country_index()
+
+        Returns
+        -------
+        dict
+            Handle of the stored dataframe of WFP data from the given country.
+
+        """
+        set_progress((5, "Waiting for a worker"))
+        with job_pool.slot():
+            return prepare_country_data(country, country_index, set_progress)
 
 @callback(
     [
@@ -203,14 +294,14 @@ def reset_widget_values(country):
     """
 
     date_range_value = [0, 0]
-    commodities_dropdown_options = ['Loading Data...']
-    commodities_dropdown_value = 'Loading Data...'
-    markets_dropdown_options = ['Loading Data...']
-    markets_dropdown_value = 'Loading Data...'
+    commodities_dropdown_options = [LOADING_VALUE]
+    commodities_dropdown_value = LOADING_VALUE
+    markets_dropdown_options = [LOADING_VALUE]
+    markets_dropdown_value = LOADING_VALUE
     geo_area = dbc.Alert(
         dbc.Row(
             [
-                dbc.Col(html.P("Loading Data...", className="ml-3", style={"margin-bottom":"0"}), width=True) 
+                dbc.Col(html.P(LOADING_VALUE, className="ml-3", style={"margin-bottom":"0"}), width=True) 
             ], align="center", justify="center", className="g-3",
             
         ),
@@ -219,7 +310,7 @@ def reset_widget_values(country):
     index_area = dbc.Alert(
         dbc.Row(
             [
-                dbc.Col(html.P("Loading Data...", className="ml-3", style={"margin-bottom":"0"}), width=True) 
+                dbc.Col(html.P(LOADING_VALUE, className="ml-3", style={"margin-bottom":"0"}), width=True) 
             ], align="center", justify="center", className="g-3",
             
         ),
@@ -272,57 +363,75 @@ def update_date_range_label(toggle):
 
 @callback(
     [Output("geo-area", "children"), Output("index-area", "children"), Output("commodities-area", "children"),
-     Output("widget-state", "data", allow_duplicate=True), Output("commodities-charts", "data")],
+     Output("widget-state", "data", allow_duplicate=True)],
     [
         Input("country-data", "data"),
         Input("date-range", "value"),
         Input("commodities-dropdown", "value"),
         Input("markets-dropdown", "value"),
-        State("geo-toggle", "on"),
+        Input("geo-toggle", "on"),
         State("country-dropdown", "value"),
-        State("widget-state", "data"),
-        State("commodities-charts", "data"), 
-        Input("content-area", "children")
+        State("session-id", "data")
     ],
     prevent_initial_call=True
 )
 def draw_charts(
-    country_json, date_range, commodities, markets, toggle, country, prior_widget_state, commodities_children, content_area
+    country_handle, date_range, commodities, markets, toggle, country, session_id=None
 ): 
     """Draw chart depending on toggle state. 
-    """
-    geo_area = []
-    index_area = [], 
-    commodities_area = []
-    commodities_area_pickle = jsonpickle.encode(commodities_area)
-    current_widget_state = []
 
-    if toggle: # draw geo chart
-        geo_area, current_widget_state = update_geo_area(
-                country_json, date_range, commodities, markets, toggle, country, content_area
-            )
+    Requests of a page are coalesced: a request superseded by a newer one of the same
+    page (e.g. while dragging the date slider) is abandoned, and a request identical to
+    one being computed for another page or by another worker awaits its result.
+    """
+    # The new country is still loading: its widget values are placeholders
+    if commodities == LOADING_VALUE or markets == LOADING_VALUE:
+        raise PreventUpdate
+    # The country index is not sent with each chart request: handles are checked against
+    # it by update_widget_values() when the country is loaded
+    check_handle(country_handle)
+
+    generation = coalescer.begin(session_id)
+    key = json.dumps([country_handle, date_range, commodities, markets, bool(toggle), country], default=str)
+
+    def draw():
+        geo_area = []
+        index_area = [], 
+        commodities_area = []
+        current_widget_state = []
+
+        if toggle: # draw geo chart
+            geo_area, current_widget_state = update_geo_area(
+                    country_handle, date_range, commodities, markets, toggle, country
+                )
 
-    elif not toggle: # draw commodities chart
-        index_area, commodities_area, current_widget_state, commodities_area_pickle = update_index_commodities_area(
-                country_json, date_range, commodities, markets, toggle, country, prior_widget_state, commodities_children, content_area
-            )
+        elif not toggle: # draw commodities chart
+            index_area, commodities_area, current_widget_state = update_index_commodities_area(
+                    country_handle, date_range, commodities, markets, toggle, country
+                )
+            
+        else: 
+            raise PreventUpdate
         
-    else: 
+        return geo_area, index_area, commodities_area, current_widget_state
+
+    try:
+        with trace_request("draw_charts", country, commodities=len(commodities or []), markets=len(markets or []), geo=bool(toggle)):
+            return coalescer.run(key, draw, session_id, generation)
+    except StaleRequest:
         raise PreventUpdate
-    
-    return geo_area, index_area, commodities_area, current_widget_state, commodities_area_pickle
 
 
 def update_geo_area(
-    country_json, date_range, commodities, markets, toggle, country, content_area
+    country_handle, date_range, commodities, markets, toggle, country
 ):
     """
     Generate and update the geo chart for the selected parameters.
 
     Parameters
     ----------
-    country_json : str
-        JSON string representing the country data from which the food price index is generated.
+    country_handle : dict
+        Handle of the stored country data from which the food price index is generated.
 
     start_date : str or datetime
         The starting date for filtering the data used in the charts.
@@ -357,16 +466,14 @@ def update_geo_area(
     if toggle == False: 
         raise PreventUpdate 
     
-    country_data = pd.read_json(StringIO(country_json), orient="split")
-
-    ## Create Index Charts
-    country_data = generate_food_price_index_data(country_data, markets, commodities)
+    country_cube = load_country_cube(country_handle)
 
     start_date = convert_date(date_range[0], 'datetime')
     end_date = convert_date(date_range[1], 'datetime')
 
-    # Plot Geo Chart
-    geo_chart = generate_geo_chart(country_data, (start_date, end_date), markets, ["Food Price Index"], country)
+    # Plot Geo Chart of the latest food price index per market
+    price_summary = country_cube.latest_index_by_market((start_date, end_date), markets, commodities)
+    geo_chart = plot_country_cities(get_country_iso_numeric(country), price_summary)
 
     geo_chart = geo_chart.properties(
         title=alt.TitleParams(
@@ -376,6 +483,9 @@ def update_geo_area(
         )
     )
 
+    # abandon the compilation if a newer request of the page has started
+    coalescer.checkpoint()
+
     # Use Card for Index Charts Layout
     geo_area = dbc.Card(
         children=[
@@ -386,7 +496,7 @@ def update_geo_area(
             'border-bottom': '0'
         }),
         dbc.CardBody([
-            dvc.Vega(spec=(geo_chart).to_dict(format="vega"), opt={'actions': False}, style={"width": "100%", "height": "auto"}),
+            dvc.Vega(spec=compile_charts([geo_chart], labels=["geo"])[0], opt={'actions': False}, style={"width": "100%", "height": "auto"}),
         ])
         ],
         style={
@@ -403,15 +513,15 @@ def update_geo_area(
 
 
 def update_index_commodities_area(
-    country_json, date_range, commodities, markets, toggle, country, prior_widget_state, commodities_children, content_area
+    country_handle, date_range, commodities, markets, toggle, country
 ):
     """
     Generate and update the food price index figure and line charts for the selected parameters.
 
     Parameters
     ----------
-    country_json : str
-        JSON string representing the country data from which the food price index is generated.
+    country_handle : dict
+        Handle of the stored country data from which the food price index is generated.
 
     date_range : tuple of str or datetime
         The starting and ending date in a tuple for filtering the data used in the charts.
@@ -457,68 +567,89 @@ def update_index_commodities_area(
             ),
             color="warning"
         )
-        return alert, [], current_widget_state, jsonpickle.encode([])
+        return alert, [], current_widget_state
 
-    country_data = pd.read_json(StringIO(country_json), orient="split")
+    country_data = load_country_data(country_handle)
+    country_cube = load_country_cube(country_handle)
 
     start_date = convert_date(date_range[0], 'datetime')
     end_date = convert_date(date_range[1], 'datetime')
 
-    ## Create commodities chart
-
-    # check if prior charts can be reused
-    existing_commodities_map = {}
-    if (
-        current_widget_state["country"] == prior_widget_state["country"] and
-        current_widget_state["date_range"] == prior_widget_state["date_range"] and 
-        set(current_widget_state["markets"]) == set(prior_widget_state["markets"]) and 
-        current_widget_state["toggle"] == prior_widget_state["toggle"] 
-    ): 
-        value_state = compare_widget_state(current_widget_state, prior_widget_state, field="commodities")
+    ## Create charts
+
+    # reuse compiled specs of charts already drawn for the same selection
+    date_key = (start_date, end_date)
+    figure_keys = {name: chart_key(country_handle, "figure", name, markets, date_key) for name in commodities}
+    line_keys = {name: chart_key(country_handle, "line", name, markets, date_key) for name in commodities}
+    index_figure_key = chart_key(country_handle, "index_figure", commodities, markets, date_key)
+    index_line_key = chart_key(country_handle, "index_line", commodities, markets, date_key)
+    with span("spec_cache_get"):
+        specs = {key: spec_cache.get(key) for key in [
+            *figure_keys.values(), *line_keys.values(), index_figure_key, index_line_key
+        ]}
+
+    # generate the charts missing from the cache: figure specs are filled from a shared
+    # template, the other charts are compiled together below
+    new_specs = {}
+    new_charts = {}
+    new_figures = [name for name in commodities if specs[figure_keys[name]] is None]
+    if new_figures:
+        figure_specs = plot_figure_specs(
+            country_cube.price_summary(date_key, markets, new_figures), new_figures
+        )
+        new_specs.update(zip([figure_keys[name] for name in new_figures], figure_specs))
 
-        # find existing commodities and extract
-        commodities_children = jsonpickle.decode(commodities_children)
-        
-        if commodities_children: 
-            for i in np.arange(0, len(commodities_children.children[1].children), 2): 
-                for child_chart in commodities_children.children[1].children[i].children: 
-                    existing_commodities_map[child_chart.id] = child_chart
-    else: 
-        value_state = {commodity_name: "new" for commodity_name in commodities}
-
-    # generate new charts
-    new_commodities = [key for key, value in value_state.items() if value == 'new']
-    if new_commodities: 
-        new_commodities_line_map = dict(zip(
-            new_commodities,
-            generate_line_chart(
-                country_data, (start_date, end_date), markets, new_commodities
-            )
-        ))
-        new_commodities_figure_map = dict(zip(
-            new_commodities,
-            generate_figure_chart(
-                country_data, (start_date, end_date), markets, new_commodities
-            )
-        ))
+    new_lines = [name for name in commodities if specs[line_keys[name]] is None]
+    if new_lines:
+        line_charts = generate_line_chart(
+            country_data, date_key, markets, new_lines, frame_index=load_frame_index(country_handle),
+            levels=load_line_levels(country_handle), max_points=line_max_points(LINE_CHART_WIDTH)
+        )
+        new_charts.update(zip([line_keys[name] for name in new_lines], line_charts))
+
+    if specs[index_line_key] is None:
+        index_data = country_cube.food_price_index(markets, commodities)
+        # the index chart spans the width of two commodity charts
+        new_charts[index_line_key] = generate_line_chart(
+            index_data, date_key, markets, ["Food Price Index"], max_points=line_max_points(2 * LINE_CHART_WIDTH)
+        )[0]
+
+    if specs[index_figure_key] is None:
+        new_specs[index_figure_key] = plot_figure_specs(
+            country_cube.index_summary(date_key, markets, commodities),
+            ["Food Price Index"],
+            title={
+                "text": "Food Price Index",
+                "fontSize": 15,
+                "subtitle": [f"(Arithmetic mean of {', '.join(commodities)})"],
+                "frame": "group",
+            },
+        )[0]
+
+    # abandon the compilation if a newer request of the page has started
+    coalescer.checkpoint()
+
+    # compile all new charts of the country frame in one batch and cache them with the new figures
+    new_specs.update(zip(new_charts, compile_charts(
+        list(new_charts.values()),
+        labels=[f"{key[2]}:{key[3]}" if isinstance(key[3], str) else key[2] for key in new_charts]
+    )))
+    for key, spec in new_specs.items():
+        specs[key] = spec
+        spec_cache.put(key, spec)
 
     # lay out commodity charts in grid
     chart_plots = []
     tmp = []
-    for i, (commodity_name, state) in enumerate(value_state.items()):
-        if state == "new":
-            tmp.append(
-                dbc.Col([
-                        dvc.Vega(spec=(new_commodities_figure_map[commodity_name]).to_dict(format="vega"), opt={'actions': False}, style={'width': '100%'}),
-                        dvc.Vega(spec=(new_commodities_line_map[commodity_name]).to_dict(format="vega"), opt={'actions': False}, style={'width': '100%', "height": "180px"}),
-                    ],
-                        md=6, 
-                        id = commodity_name
-                    )
+    for i, commodity_name in enumerate(commodities):
+        tmp.append(
+            dbc.Col([
+                    dvc.Vega(spec=specs[figure_keys[commodity_name]], opt={'actions': False}, style={'width': '100%'}),
+                    dvc.Vega(spec=specs[line_keys[commodity_name]], opt={'actions': False}, style={'width': '100%', "height": "180px"}),
+                ],
+                    md=6, 
+                    id = commodity_name
                 )
-        elif state == "exists":
-            tmp.append(
-                existing_commodities_map[commodity_name]
             )
         if i % 2 == 1:
                 chart_plots.append(dbc.Row(tmp))
@@ -552,25 +683,6 @@ def update_index_commodities_area(
         }
     )
 
-    ## Create Index Charts
-    country_data = generate_food_price_index_data(country_data, markets, commodities)
-    
-    index_line = generate_line_chart(
-        country_data, (start_date, end_date), markets, ["Food Price Index"]
-    )[0]
-
-    index_figure = generate_figure_chart(
-        country_data, (start_date, end_date), markets, ["Food Price Index"]
-    )[0]
-
-    index_figure = index_figure.properties(
-        title=alt.TitleParams(
-            text="Food Price Index",
-            fontSize=15,
-            subtitle=[f"(Arithmetic mean of {', '.join(commodities)})"],
-        )
-    )
-
     # Use Card for Index Charts Layout
     index_area = dbc.Card(
         children=[
@@ -581,8 +693,8 @@ def update_index_commodities_area(
             'border-radius': '5px',
         }),
         dbc.CardBody([
-            dvc.Vega(spec=(index_figure).to_dict(format="vega"), opt={'actions': False}, style={"width": "100%"}),
-            dvc.Vega(spec=(index_line).to_dict(format="vega"), opt={'actions': False}, style={"width": "100%", "height": "220px"})
+            dvc.Vega(spec=specs[index_figure_key], opt={'actions': False}, style={"width": "100%"}),
+            dvc.Vega(spec=specs[index_line_key], opt={'actions': False}, style={"width": "100%", "height": "220px"})
         ])
         ],
         style={
@@ -595,4 +707,4 @@ def update_index_commodities_area(
         }
     )
 
-    return index_area, commodities_area, current_widget_state, jsonpickle.encode(commodities_area)
+    return index_area, commodities_area, current_widget_state
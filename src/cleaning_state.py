@@ -0,0 +1,424 @@
+# Script containing the incremental cleaning of country data used by sync.py and callbacks.py
+# A CleaningState keeps the deduplicated rows of a country and the counters of the abundance
+# rules of data.filter_major_data(), as arrays indexed by the category codes of markets,
+# commodities and units. When HDX appends new months to a country dataset, only the appended
+# rows are deduplicated and counted, the rules are re-evaluated from the counters, and only
+# the new dates, and the pairs whose rules changed, are forward filled as in
+# data.fill_missing_data().
+import hashlib
+import numpy as np
+import pandas as pd
+
+from src.store import read_cleaning_state, write_cleaning_state
+from src.tracing import traced
+
+
+KEY_COLUMNS = ["date", "market", "latitude", "longitude", "commodity", "unit"]
+CLEAN_COLUMNS = KEY_COLUMNS + ["usdprice"]
+PAIR_COLUMNS = ["market", "commodity", "unit"]
+
+
+def _categories(data, categories):
+    """Return the sorted union of the given categories and of the (market, commodity, unit) categories of `data`."""
+    return {
+        column: pd.Index(np.sort(pd.unique(np.concatenate([
+            categories[column].to_numpy(dtype=object), data[column].cat.categories.to_numpy(dtype=object)
+        ]))), dtype=object)
+        for column in PAIR_COLUMNS
+    }
+
+
+def _set_categories(data, categories):
+    """Return `data` with the given categories, recoding only the columns whose categories differ."""
+    if data is None:
+        return None
+    changed = {
+        column: data[column].cat.set_categories(categories[column])
+        for column in PAIR_COLUMNS
+        if not data[column].cat.categories.equals(categories[column])
+    }
+    return data.assign(**changed) if changed else data
+
+
+def _reindex(counts, columns, old_categories, categories):
+    """Re-index a counter from `old_categories` to `categories` including them, along the axes of `columns`."""
+    for axis, column in enumerate(columns):
+        if column in PAIR_COLUMNS and not old_categories[column].equals(categories[column]):
+            shape = list(counts.shape)
+            shape[axis] = len(categories[column])
+            index = [slice(None)] * counts.ndim
+            index[axis] = categories[column].get_indexer(old_categories[column])
+            expanded = np.zeros(shape, dtype=counts.dtype)
+            expanded[tuple(index)] = counts
+            counts = expanded
+    return counts
+
+
+def _count(codes, shape):
+    """Count the rows of each combination of codes in an array of `shape`, skipping rows with missing values."""
+    is_valid = np.logical_and.reduce([code >= 0 for code in codes])
+    flat = np.ravel_multi_index([code[is_valid] for code in codes], shape)
+    return np.bincount(flat, minlength=int(np.prod(shape))).reshape(shape)
+
+
+def _codes(data, column):
+    """Return the category codes of a column as int64, -1 for missing values."""
+    return data[column].cat.codes.to_numpy().astype(np.int64)
+
+
+def _isin_pairs(data, pairs):
+    """Return whether the (market, commodity, unit) of each row is True in a boolean table of pairs."""
+    # The padded entry is the one of the -1 code of missing values
+    table = np.pad(pairs, [(0, 1)] * pairs.ndim)
+    return table[tuple(data[column].cat.codes.to_numpy() for column in PAIR_COLUMNS)]
+
+
+def _unique(column):
+    """Return the values of a column in order of first appearance, as an object index."""
+    return pd.Index(np.asarray(pd.unique(column), dtype=object))
+
+
+def _ranks(column, values):
+    """Return the position in `values` of the value of each row of a categorical column."""
+    rank_of_code = np.full(len(column.cat.categories), len(values), dtype=np.int64)
+    rank_of_code[column.cat.categories.get_indexer(values)] = np.arange(len(values))
+    return rank_of_code[column.cat.codes.to_numpy()]
+
+
+def _deduplicate(data):
+    """Keep the first price of each (date, market, latitude, longitude, commodity, unit), as rule 0."""
+    return data[CLEAN_COLUMNS].groupby(KEY_COLUMNS, observed=True).first().reset_index()
+
+
+def _fill(rows, dates, seeds=None):
+    """
+    Forward fill the prices of (market, commodity) pairs on a date axis, as data.fill_missing_data().
+
+    Parameters
+    ----------
+    rows : pandas.DataFrame
+        Filtered rows of the pairs, in (date, market, latitude, longitude, commodity) order.
+    dates : pandas.DatetimeIndex
+        Sorted date axis, including the dates of all rows.
+    seeds : pandas.DataFrame, optional
+        Last filled row of pairs filled before, dated on the first date of the axis. They
+        are filled from instead of their first observation, and left out of the result.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Rows of each pair from its first date to the end of the axis, before rows
+        without price are dropped, ordered by pair then date.
+    """
+    num_seed = 0 if seeds is None else len(seeds)
+    rows = pd.concat([seeds[CLEAN_COLUMNS], rows[CLEAN_COLUMNS]] if num_seed else [rows[CLEAN_COLUMNS]], ignore_index=True)
+    if rows.empty:
+        return rows
+
+    pair_codes, pairs = pd.factorize(
+        rows["market"].cat.codes.to_numpy(dtype=np.int64) * len(rows["commodity"].cat.categories)
+        + rows["commodity"].cat.codes.to_numpy()
+    )
+    first_rows = np.unique(pair_codes, return_index=True)[1]
+    date_codes = dates.searchsorted(rows["date"])
+    num_date = len(dates)
+
+    # Expand each pair from its first date to the last date
+    first_dates = np.full(len(pairs), num_date, dtype=np.int64)
+    np.minimum.at(first_dates, pair_codes, date_codes)
+    lengths = num_date - first_dates
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    full_keys = np.repeat(np.arange(len(pairs)) * num_date + first_dates, lengths) + offsets
+    data_keys = pair_codes.astype(np.int64) * num_date + date_codes
+
+    missing_keys = np.setdiff1d(full_keys, data_keys)
+    missing_df = pd.DataFrame({
+        "date": dates.take(missing_keys % num_date),
+        "market": rows["market"].take(first_rows[missing_keys // num_date]).array,
+        "commodity": rows["commodity"].take(first_rows[missing_keys // num_date]).array,
+    })
+
+    full_data_df = pd.concat([rows, missing_df] if len(missing_df) else [rows], axis=0, ignore_index=True)
+    full_keys = np.concatenate([data_keys, missing_keys])
+    order = np.argsort(full_keys, kind="stable")
+    full_data_df = full_data_df.take(order)
+
+    fill_columns = ["latitude", "longitude", "unit", "usdprice"]
+    full_data_df[fill_columns] = full_data_df[fill_columns].groupby(full_keys[order] // num_date).ffill()
+
+    return full_data_df[order >= num_seed][CLEAN_COLUMNS].reset_index(drop=True)
+
+
+def _sort(data, dates, markets, commodities):
+    """
+    Sort filled rows as data.fill_missing_data(): by date, then market and commodity in
+    order of first appearance.
+
+    Rows of the same date, market and commodity, i.e. observations at several coordinates,
+    must already be in (latitude, longitude) order, which the stable sort keeps.
+    """
+    keys = (
+        dates.searchsorted(data["date"]).astype(np.int64) * (len(markets) + 1)
+        + _ranks(data["market"], markets)
+    ) * (len(commodities) + 1) + _ranks(data["commodity"], commodities)
+    if np.all(keys[1:] >= keys[:-1]):
+        return data
+    return data.take(np.argsort(keys, kind="stable"))
+
+
+def _as_categorical(data, columns):
+    """Convert the given object columns of raw rows to categoricals with sorted categories."""
+    return data.astype({column: pd.CategoricalDtype(np.sort(data[column].dropna().unique())) for column in columns})
+
+
+class CleaningState:
+    """
+    Incremental state of data.get_clean_data() for one country.
+
+    Parameters
+    ----------
+    date_abundance_threshold : float, optional
+        Rule 1 threshold of data.filter_major_data(). Defaults to 0.5.
+    market_abundance_threshold : float, optional
+        Rule 2 threshold of data.filter_major_data(). Defaults to 0.7.
+
+    Attributes
+    ----------
+    data : pandas.DataFrame
+        Cleaned data of all rows seen so far, with categorical market, commodity and unit.
+    rows : pandas.DataFrame
+        Deduplicated rows of all units, in (date, market, latitude, longitude, commodity, unit) order.
+    categories : dict of pandas.Index
+        Sorted categories of market, commodity and unit, shared by all frames and indexing the counters.
+    row_dates : pandas.DatetimeIndex
+        Sorted dates of the deduplicated rows, indexing `date_units`.
+    unit_counts : numpy.ndarray
+        Number of raw rows per (commodity, unit), deciding the major unit of each commodity.
+    pair_rows, pair_prices : numpy.ndarray
+        Number of deduplicated rows, and of those with a price, per (market, commodity, unit).
+    date_units : numpy.ndarray
+        Whether there are deduplicated rows per (date, commodity, unit), counting the dates of rule 1.
+    pairs : numpy.ndarray
+        Boolean table of the (market, commodity, unit) kept by the rules.
+    dates, markets, commodities : pandas.Index
+        Date axis, and markets and commodities in order of first appearance, of the kept pairs.
+    tails : pandas.DataFrame
+        Last filled row of each kept pair, from which the next dates are filled.
+    """
+
+    def __init__(self, date_abundance_threshold=0.5, market_abundance_threshold=0.7):
+        self.date_abundance_threshold = date_abundance_threshold
+        self.market_abundance_threshold = market_abundance_threshold
+        self.raw_rows = 0
+        self.raw_digest = None
+        self.data = None
+        self.rows = None
+        self.categories = {column: pd.Index([], dtype=object) for column in PAIR_COLUMNS}
+        self.row_dates = pd.DatetimeIndex([])
+        self.unit_counts = np.zeros((0, 0), dtype=np.int64)
+        self.pair_rows = np.zeros((0, 0, 0), dtype=np.int64)
+        self.pair_prices = np.zeros((0, 0, 0), dtype=np.int64)
+        self.date_units = np.zeros((0, 0, 0), dtype=bool)
+        self.pairs = np.zeros((0, 0, 0), dtype=bool)
+        self.dates = pd.DatetimeIndex([])
+        self.markets = pd.Index([], dtype=object)
+        self.commodities = pd.Index([], dtype=object)
+        self.tails = None
+
+    @staticmethod
+    def _digest(hashes):
+        return hashlib.sha1(hashes.tobytes()).hexdigest()
+
+    def update(self, data):
+        """
+        Clean the full raw data of a country, processing only the rows appended since the last update.
+
+        Rows are considered appended when the raw data starts with the rows of the last
+        update; otherwise, e.g. when HDX revised past prices, the state is rebuilt.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Raw country data, the output of fetch_country_data().
+
+        Returns
+        -------
+        pandas.DataFrame
+            Cleaned data, equal to get_clean_data(data) up to its index.
+
+        Examples
+        --------
+        >>> state = CleaningState()
+        >>> clean_df = state.update(fetch_country_data("Japan"))
+        """
+        data = data[CLEAN_COLUMNS]
+        hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+        object_columns = [column for column in PAIR_COLUMNS if not isinstance(data[column].dtype, pd.CategoricalDtype)]
+
+        is_appended = (
+            self.data is not None
+            and self.raw_rows <= len(data)
+            and self._digest(hashes[:self.raw_rows]) == self.raw_digest
+        )
+        if not (is_appended and self.append(_as_categorical(data.iloc[self.raw_rows:], object_columns))):
+            self.__init__(self.date_abundance_threshold, self.market_abundance_threshold)
+            self.append(_as_categorical(data, object_columns))
+
+        self.raw_rows = len(data)
+        self.raw_digest = self._digest(hashes)
+        return self.data.astype({column: object for column in object_columns})
+
+    def _kept_pairs(self):
+        """Evaluate rules 0 to 2 of data.filter_major_data() on the counters."""
+        # Rule 0 - Most frequent unit of each commodity, ties broken by the alphabetical order of units
+        num_commodity = self.unit_counts.shape[0]
+        is_major_unit = np.zeros(self.unit_counts.shape, dtype=bool)
+        if self.unit_counts.size:
+            is_major_unit[np.arange(num_commodity), self.unit_counts.argmax(axis=1)] = self.unit_counts.any(axis=1)
+        num_date = (self.date_units & is_major_unit).any(axis=(1, 2)).sum()
+
+        # Rule 1 - data existence for each (commodity, market) pair relative to the full duration length >= x%
+        kept = (
+            is_major_unit
+            & (self.pair_prices > 0)
+            & (self.pair_prices >= self.date_abundance_threshold * num_date)
+        )
+
+        # Rule 2 - data of a commodity exists, relative to the total number of markets >= x%
+        num_market = kept.any(axis=(1, 2)).sum()
+        market_counts = kept.sum(axis=(0, 2))
+        major_commodities = (market_counts > 0) & (market_counts >= self.market_abundance_threshold * num_market)
+
+        return kept & major_commodities[None, :, None]
+
+    def _update_counters(self, data, new_rows, categories):
+        """Re-index the counters on `categories` and the dates of `new_rows`, and add the new rows to them."""
+        old_categories, self.categories = self.categories, categories
+        self.unit_counts = _reindex(self.unit_counts, ["commodity", "unit"], old_categories, categories)
+        self.pair_rows, self.pair_prices, self.pairs = (
+            _reindex(counts, PAIR_COLUMNS, old_categories, categories)
+            for counts in (self.pair_rows, self.pair_prices, self.pairs)
+        )
+        self.date_units = _reindex(self.date_units, ["date", "commodity", "unit"], old_categories, categories)
+        history_pairs = self.pair_rows > 0
+
+        new_dates = pd.DatetimeIndex(pd.unique(new_rows["date"])).sort_values()
+        self.row_dates = self.row_dates.append(new_dates)
+        self.date_units = np.concatenate([self.date_units, np.zeros((len(new_dates),) + self.date_units.shape[1:], dtype=bool)])
+
+        codes = [_codes(new_rows, column) for column in PAIR_COLUMNS]
+        has_price = new_rows["usdprice"].notna().to_numpy()
+        self.unit_counts += _count([_codes(data, "commodity"), _codes(data, "unit")], self.unit_counts.shape)
+        self.pair_rows += _count(codes, self.pair_rows.shape)
+        self.pair_prices += _count([code[has_price] for code in codes], self.pair_prices.shape)
+        self.date_units |= _count([self.row_dates.searchsorted(new_rows["date"])] + codes[1:], self.date_units.shape) > 0
+        return history_pairs
+
+    def append(self, data):
+        """
+        Clean raw rows appended to the data seen so far.
+
+        Parameters
+        ----------
+        data : pandas.DataFrame
+            Raw rows with categorical market, commodity and unit, all dated after the rows seen so far.
+
+        Returns
+        -------
+        bool
+            True if the rows were appended, False if some of them are not more recent than
+            the rows seen so far, in which case the state is left unchanged.
+        """
+        new_rows = _deduplicate(data)
+        history_end = self.row_dates[-1] if len(self.row_dates) else None
+        if history_end is not None and len(new_rows) and new_rows["date"].min() <= history_end:
+            return False
+
+        # Share the categories of the new rows with the history, recoding the history only for new values
+        categories = _categories(new_rows, self.categories)
+        data = _set_categories(data, categories)
+        new_rows = _set_categories(new_rows, categories)
+        self.rows = _set_categories(self.rows, categories)
+        self.data = _set_categories(self.data, categories)
+        self.tails = _set_categories(self.tails, categories)
+
+        # Update the counters with the new rows only, and re-evaluate the rules
+        history_pairs = self._update_counters(data, new_rows, categories)
+        self.rows = new_rows if self.rows is None else pd.concat([self.rows, new_rows], ignore_index=True)
+        pairs = self._kept_pairs()
+        unchanged = self.pairs & pairs
+        added = pairs & ~unchanged
+        seeds = self.tails[_isin_pairs(self.tails, unchanged)] if self.tails is not None else None
+
+        new_filtered = new_rows[_isin_pairs(new_rows, pairs)]
+        new_dates = pd.DatetimeIndex(new_filtered["date"].unique()).sort_values()
+        seed_dates = self.dates[-1:].append(new_dates) if unchanged.any() else new_dates
+
+        if not (self.pairs & ~pairs).any() and not (added & history_pairs).any():
+            # The filtered history is unchanged: fill the new dates only
+            dates = self.dates.append(new_dates)
+            markets = self.markets.append(_unique(new_filtered["market"]).difference(self.markets, sort=False))
+            commodities = self.commodities.append(_unique(new_filtered["commodity"]).difference(self.commodities, sort=False))
+            filled = _fill(new_filtered, seed_dates, seeds)
+            tail = _sort(filled.dropna(subset=["usdprice"]), dates, markets, commodities)
+            data_df = tail if self.data is None else pd.concat([self.data, tail])
+        else:
+            is_filtered = _isin_pairs(self.rows, pairs)
+            dates = pd.DatetimeIndex(pd.unique(self.rows["date"].to_numpy()[is_filtered])).sort_values()
+            markets = _unique(self.rows["market"].array[is_filtered])
+            commodities = _unique(self.rows["commodity"].array[is_filtered])
+
+            if dates[dates <= history_end].isin(self.dates).all():
+                # Keep the history of unchanged pairs, and fill the new dates and the changed pairs
+                filled = pd.concat([
+                    _fill(new_filtered[_isin_pairs(new_filtered, unchanged)], seed_dates, seeds),
+                    _fill(self.rows[_isin_pairs(self.rows, added)], dates),
+                ], ignore_index=True)
+                is_kept = _isin_pairs(self.data, unchanged) & self.data["date"].isin(dates).to_numpy()
+                data_df = pd.concat([self.data[is_kept], filled.dropna(subset=["usdprice"])], ignore_index=True)
+            else:
+                # Dates were added to the history: refill all pairs
+                filled = _fill(self.rows[is_filtered], dates)
+                data_df = filled.dropna(subset=["usdprice"])
+            data_df = _sort(data_df, dates, markets, commodities)
+
+        # Last filled row of each kept pair, from which the next dates are filled
+        tails = filled if seeds is None else pd.concat([seeds, filled], ignore_index=True)
+        self.tails = tails[_isin_pairs(tails, pairs)].drop_duplicates(["market", "commodity"], keep="last")
+        self.data = data_df.reset_index(drop=True)
+        self.pairs = pairs
+        self.dates = dates
+        self.markets = markets
+        self.commodities = commodities
+        return True
+
+
+@traced()
+def clean_country_data(country, data):
+    """
+    Clean the raw data of a country, reusing the cleaning state kept in the store.
+
+    Parameters
+    ----------
+    country : str
+        string of the country, e.g., "Japan"
+    data : pandas.DataFrame
+        Raw country data, the output of fetch_country_data().
+
+    Returns
+    -------
+    pandas.DataFrame
+        Cleaned data, equal to get_clean_data(data) up to its index.
+
+    Examples
+    --------
+    >>> clean_df = clean_country_data("Japan", fetch_country_data("Japan"))
+    """
+    state = read_cleaning_state(country) or CleaningState()
+    clean_df = state.update(data)
+    write_cleaning_state(country, state)
+    return clean_df
+
+
+if __name__ == "__main__":
+    pass
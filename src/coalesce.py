@@ -0,0 +1,309 @@
+# Script containing the request coalescing layer of the chart callbacks in callbacks.py
+# Each browser session numbers its chart requests with a generation counter, so that a
+# request superseded by a newer request of the same session (e.g. while picking several
+# commodities) is dropped after a short debounce, or abandoned at the next checkpoint of
+# its computation. Identical requests already being computed, by another session or
+# another worker, are awaited instead of recomputed.
+import os
+import time
+import pickle
+import threading
+
+from collections import OrderedDict
+from flask import has_request_context, request
+from src.cache_backend import create_redis_client
+
+
+# Debounce of requests in seconds when a newer request can arrive while one waits
+DEFAULT_DEBOUNCE = 0.05
+
+
+class StaleRequest(Exception):
+    """Raised at a checkpoint of a computation superseded by a newer request of its session."""
+
+
+class _Flight:
+    """A computation in progress in this process, awaited by identical requests."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Coalescer:
+    """
+    Per-session generation counters and single-flight deduplication of computations.
+
+    Parameters
+    ----------
+    redis_client : redis.Redis, optional
+        Client of the shared tier, holding the generation counters, the locks of
+        computations in progress and their results, so that they are shared by all
+        workers. Without a client, counters and computations are per process.
+    key_prefix : str, optional
+        Prefix of the keys in the shared tier. Defaults to "food_price:coalesce:".
+    lock_timeout : int, optional
+        Maximum time in seconds a worker waits for the computation of another worker
+        before computing the result itself. Defaults to 60.
+    result_timeout : int, optional
+        Time to live in seconds of shared results. Defaults to 30.
+    session_timeout : int, optional
+        Time to live in seconds of the generation counter of an idle session. Defaults to 1 day.
+    max_sessions : int, optional
+        Maximum number of per-process generation counters. Defaults to 10000.
+    poll_interval : float, optional
+        Interval in seconds between checks for the result of another worker. Defaults to 0.05.
+    debounce : float, optional
+        Time in seconds a request of a session waits for a newer request before being
+        computed. If None, DEFAULT_DEBOUNCE when a newer request can be received while
+        waiting, i.e. with a shared tier or a multithreaded server, and 0 otherwise.
+        Defaults to 0, no debounce.
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        key_prefix="food_price:coalesce:",
+        lock_timeout=60,
+        result_timeout=30,
+        session_timeout=24 * 3600,
+        max_sessions=10000,
+        poll_interval=0.05,
+        debounce=0,
+    ):
+        self.redis = redis_client
+        self.key_prefix = key_prefix
+        self.lock_timeout = lock_timeout
+        self.result_timeout = result_timeout
+        self.session_timeout = session_timeout
+        self.max_sessions = max_sessions
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._generations = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {"requests": 0, "computed": 0, "stale": 0, "deduplicated": 0, "shared_deduplicated": 0}
+
+    def _record(self, event):
+        with self._lock:
+            self._stats[event] += 1
+
+    def begin(self, session_id):
+        """
+        Start a new request of a session, superseding its requests in progress.
+
+        Parameters
+        ----------
+        session_id : str or None
+            Identifier of the browser session. Requests without a session are never stale.
+
+        Returns
+        -------
+        int or None
+            Generation of the request within its session.
+        """
+        if session_id is None:
+            return None
+
+        if self.redis is not None:
+            key = f"{self.key_prefix}generation:{session_id}"
+            generation = self.redis.incr(key)
+            self.redis.expire(key, self.session_timeout)
+            return generation
+
+        with self._lock:
+            generation = self._generations.pop(session_id, 0) + 1
+            self._generations[session_id] = generation
+            while len(self._generations) > self.max_sessions:
+                self._generations.popitem(last=False)
+        return generation
+
+    def is_current(self, session_id, generation):
+        """Return whether a request is the latest request of its session."""
+        if session_id is None:
+            return True
+
+        if self.redis is not None:
+            current = self.redis.get(f"{self.key_prefix}generation:{session_id}")
+            return current is None or int(current) == generation
+
+        with self._lock:
+            return self._generations.get(session_id, generation) == generation
+
+    def checkpoint(self):
+        """
+        Abandon the computation running in this thread if its request is stale.
+
+        A no-op outside of run(), e.g. when the chart builders are called directly.
+
+        Raises
+        ------
+        StaleRequest
+            If a newer request of the same session has started.
+        """
+        request = getattr(self._local, "request", None)
+        if request is not None and not self.is_current(*request):
+            raise StaleRequest()
+
+    def _debounce(self):
+        """Return the debounce of the current request in seconds."""
+        if self.debounce is not None:
+            return self.debounce
+        # A single-threaded worker only reads the next request once this one is answered,
+        # so waiting for it would only delay the response
+        is_threaded = has_request_context() and request.environ.get("wsgi.multithread", False)
+        return DEFAULT_DEBOUNCE if self.redis is not None or is_threaded else 0
+
+    def run(self, key, compute, session_id=None, generation=None):
+        """
+        Compute the result of a request, unless it is stale or already being computed.
+
+        Parameters
+        ----------
+        key : str
+            Identifier of the result, e.g. the widget state and data version of a chart request.
+        compute : callable
+            Function computing the result. It may call checkpoint() between expensive steps.
+        session_id : str, optional
+            Identifier of the browser session of the request.
+        generation : int, optional
+            Generation of the request, as returned by begin().
+
+        Returns
+        -------
+        object
+            The result of `compute`, or of an identical computation awaited in its place.
+
+        Raises
+        ------
+        StaleRequest
+            If a newer request of the same session started before the result was computed.
+
+        Examples
+        --------
+        >>> generation = coalescer.begin(session_id)
+        >>> coalescer.run(key, lambda: draw(...), session_id, generation)
+        """
+        self._record("requests")
+        debounce = self._debounce()
+        if debounce and session_id is not None:
+            time.sleep(debounce)
+
+        while True:
+            if not self.is_current(session_id, generation):
+                self._record("stale")
+                raise StaleRequest()
+
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+
+            if leader:
+                try:
+                    flight.result = self._compute_shared(key, compute, session_id, generation)
+                    return flight.result
+                except BaseException as error:
+                    flight.error = error
+                    raise
+                finally:
+                    with self._lock:
+                        self._flights.pop(key, None)
+                    flight.done.set()
+
+            flight.done.wait()
+            if flight.error is None:
+                self._record("deduplicated")
+                return flight.result
+            if not isinstance(flight.error, StaleRequest):
+                raise flight.error
+            # The awaited computation was abandoned by its own session: compute it for this request
+
+    def _compute(self, compute, session_id, generation):
+        """Run a computation with the checkpoints of its request."""
+        previous = getattr(self._local, "request", None)
+        self._local.request = (session_id, generation)
+        try:
+            result = compute()
+        except StaleRequest:
+            self._record("stale")
+            raise
+        finally:
+            self._local.request = previous
+
+        self._record("computed")
+        return result
+
+    def _compute_shared(self, key, compute, session_id, generation):
+        """Run a computation once across workers, through a lock in the shared tier."""
+        if self.redis is None:
+            return self._compute(compute, session_id, generation)
+
+        lock_key = f"{self.key_prefix}lock:{key}"
+        result_key = f"{self.key_prefix}result:{key}"
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            blob = self.redis.get(result_key)
+            if blob is not None:
+                self._record("shared_deduplicated")
+                return pickle.loads(blob)
+
+            if self.redis.set(lock_key, b"1", nx=True, ex=self.lock_timeout):
+                try:
+                    result = self._compute(compute, session_id, generation)
+                    self.redis.set(result_key, pickle.dumps(result, pickle.HIGHEST_PROTOCOL), ex=self.result_timeout)
+                    return result
+                finally:
+                    self.redis.delete(lock_key)
+
+            # Another worker is computing the result
+            if not self.is_current(session_id, generation):
+                self._record("stale")
+                raise StaleRequest()
+            time.sleep(self.poll_interval)
+
+        return self._compute(compute, session_id, generation)
+
+    def stats(self):
+        """
+        Return the coalescing metrics of the process.
+
+        Returns
+        -------
+        dict
+            Number of requests, computations, requests abandoned as stale, and requests
+            served by an identical computation of this process or of another worker.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._flights)
+            stats["sessions"] = len(self._generations)
+        stats["shared"] = self.redis is not None
+        return stats
+
+
+def create_coalescer():
+    """
+    Create the coalescer of the process, shared across workers when $FOOD_PRICE_CACHE_URL is set.
+
+    Requests are debounced by $FOOD_PRICE_COALESCE_DEBOUNCE seconds. By default, they are
+    debounced by DEFAULT_DEBOUNCE only when a newer request can arrive meanwhile.
+    """
+    url = os.environ.get("FOOD_PRICE_CACHE_URL")
+    debounce = os.environ.get("FOOD_PRICE_COALESCE_DEBOUNCE")
+    return Coalescer(
+        redis_client=create_redis_client(url) if url else None,
+        lock_timeout=int(os.environ.get("FOOD_PRICE_COALESCE_LOCK_TIMEOUT", 60)),
+        result_timeout=int(os.environ.get("FOOD_PRICE_COALESCE_RESULT_TIMEOUT", 30)),
+        debounce=float(debounce) if debounce is not None else None,
+    )
+
+
+coalescer = create_coalescer()
+
+
+if __name__ == "__main__":
+    pass
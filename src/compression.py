@@ -0,0 +1,109 @@
+# Script containing the response compression of the Dash server used by app.py
+# Callback responses carry pre-transformed Vega specs with inline data, which are JSON
+# and compress well. Responses are gzip-compressed by flask-compress for browsers
+# accepting it, after the response is built, so callbacks and routes are unchanged.
+#
+# flask-compress is set up here rather than with Dash(compress=True): Dash restricts it to
+# gzip only after the extension has read its configuration, so that recent versions would
+# negotiate zstd or brotli instead, and it does not give access to the extension, which
+# counts the bytes served for compression_stats() here.
+import os
+import threading
+
+from flask import request
+from flask_compress import Compress
+
+
+# Compression level of gzip from 1 to 9, 0 disabling compression
+COMPRESS_LEVEL = int(os.environ.get("FOOD_PRICE_COMPRESS_LEVEL", 6))
+# Responses smaller than this many bytes are sent as they are
+COMPRESS_MIN_BYTES = int(os.environ.get("FOOD_PRICE_COMPRESS_MIN_BYTES", 500))
+COMPRESS_MIMETYPES = (
+    "application/json",
+    "application/javascript",
+    "text/html",
+    "text/css",
+    "text/javascript",
+    "text/plain",
+)
+
+_stats = {"responses": 0, "compressed": 0, "bytes_in": 0, "bytes_out": 0}
+_stats_lock = threading.Lock()
+
+
+def accepts_gzip(request):
+    """Return whether the client of a request accepts gzip-encoded responses."""
+    return "gzip" in request.headers.get("Accept-Encoding", "").lower()
+
+
+class CountingCompress(Compress):
+    """
+    flask-compress extension counting the bytes of the text and JSON responses it may compress.
+
+    Responses that are streamed, already encoded, or sent to clients not accepting gzip
+    are not counted.
+    """
+
+    def after_request(self, response):
+        counted = (
+            not response.is_streamed
+            and response.status_code == 200
+            and "Content-Encoding" not in response.headers
+            and response.mimetype in COMPRESS_MIMETYPES
+            and accepts_gzip(request)
+        )
+        bytes_in = response.content_length
+        response = super().after_request(response)
+
+        if counted and bytes_in is not None:
+            with _stats_lock:
+                _stats["responses"] += 1
+                _stats["compressed"] += response.headers.get("Content-Encoding") == "gzip"
+                _stats["bytes_in"] += bytes_in
+                _stats["bytes_out"] += response.content_length
+        return response
+
+
+def compression_stats():
+    """
+    Return the response compression metrics of the process.
+
+    Returns
+    -------
+    dict
+        Number of text and JSON responses and of compressed ones, their bytes before and
+        after compression, and the resulting compression ratio.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["ratio"] = stats["bytes_out"] / stats["bytes_in"] if stats["bytes_in"] else None
+    return stats
+
+
+def init_compression(server, level=None, min_bytes=None):
+    """
+    Gzip the responses of a Flask server, e.g. app.server, for the clients accepting it.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        Server of the app.
+    level : int, optional
+        Compression level, 0 disabling compression. Defaults to $FOOD_PRICE_COMPRESS_LEVEL (6).
+    min_bytes : int, optional
+        Minimum size of the compressed bodies. Defaults to $FOOD_PRICE_COMPRESS_MIN_BYTES (500).
+    """
+    level = COMPRESS_LEVEL if level is None else level
+    if not level:
+        return
+    server.config.update(
+        COMPRESS_ALGORITHM=["gzip"],
+        COMPRESS_LEVEL=level,
+        COMPRESS_MIN_SIZE=COMPRESS_MIN_BYTES if min_bytes is None else min_bytes,
+        COMPRESS_MIMETYPES=list(COMPRESS_MIMETYPES),
+    )
+    CountingCompress(server)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,295 @@
+# Script containing the per-country aggregate cube used by callbacks.py
+# The cube holds per-(date, location, commodity) sums and counts of prices in dense
+# NumPy arrays, so that the food price index, latest averages, MoM / YoY changes
+# and per-market latest values are answered by slicing and reducing arrays.
+# Locations are (market, latitude, longitude), as in the groupbys of
+# generate_food_price_index_data() and generate_geo_chart(), so a market reported
+# at several coordinates is one point per coordinates on the map.
+import numpy as np
+import pandas as pd
+
+from src.tracing import traced
+from src.utils import to_month_start
+
+
+INDEX_COMMODITY = "Food Price Index"
+INDEX_UNIT = "PPL"
+
+
+class PriceCube:
+    """
+    Dense aggregate of a cleaned country frame.
+
+    Parameters
+    ----------
+    dates : pd.DatetimeIndex
+        Sorted unique dates.
+    markets : pd.Index
+        Market of each location, in order of first appearance. A market is repeated
+        for each of its coordinates.
+    commodities : pd.Index
+        Commodities, in order of first appearance.
+    units : np.ndarray
+        Unit of each commodity.
+    latitudes, longitudes : np.ndarray
+        Coordinates of each location.
+    sums : np.ndarray
+        Sum of `usdprice` per (date, location, commodity), shape (dates, locations, commodities).
+    counts : np.ndarray
+        Number of prices per (date, location, commodity), same shape as `sums`.
+    """
+
+    def __init__(self, dates, markets, commodities, units, latitudes, longitudes, sums, counts):
+        self.dates = pd.DatetimeIndex(dates)
+        self.markets = pd.Index(markets)
+        self.commodities = pd.Index(commodities)
+        self.units = np.asarray(units, dtype=object)
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.sums = sums
+        self.counts = counts
+
+    @classmethod
+    def from_frame(cls, data):
+        """
+        Build the cube from a cleaned country frame, the output of get_clean_data().
+
+        Each (market, latitude, longitude) is a location, and each commodity has the unit
+        of its first row (filter_major_data keeps a single unit per commodity).
+        """
+        data = data.dropna(subset=["usdprice"])
+        date_codes, dates = pd.factorize(data["date"], sort=True)
+        location_codes = (
+            data.groupby(["market", "latitude", "longitude"], sort=False, observed=True, dropna=False)
+            .ngroup()
+            .to_numpy()
+        )
+        commodity_codes, commodities = pd.factorize(data["commodity"])
+        first_location_rows = np.unique(location_codes, return_index=True)[1]
+
+        shape = (len(dates), len(first_location_rows), len(commodities))
+        cell_codes = np.ravel_multi_index((date_codes, location_codes, commodity_codes), shape)
+        size = int(np.prod(shape))
+        sums = np.bincount(cell_codes, weights=data["usdprice"].to_numpy(dtype=float), minlength=size)
+        counts = np.bincount(cell_codes, minlength=size).astype(np.int32)
+
+        first_commodity_rows = np.unique(commodity_codes, return_index=True)[1]
+
+        return cls(
+            dates,
+            data["market"].to_numpy(dtype=object)[first_location_rows],
+            np.asarray(commodities, dtype=object),
+            data["unit"].to_numpy(dtype=object)[first_commodity_rows],
+            data["latitude"].to_numpy(dtype=float)[first_location_rows],
+            data["longitude"].to_numpy(dtype=float)[first_location_rows],
+            sums.reshape(shape),
+            counts.reshape(shape),
+        )
+
+    def save(self, path):
+        """Save the cube to a `.npz` file."""
+        np.savez(
+            path,
+            dates=self.dates.asi8,
+            markets=np.asarray(self.markets, dtype=str),
+            commodities=np.asarray(self.commodities, dtype=str),
+            units=np.asarray(self.units, dtype=str),
+            latitudes=self.latitudes,
+            longitudes=self.longitudes,
+            sums=self.sums,
+            counts=self.counts,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a cube saved with save()."""
+        with np.load(path) as arrays:
+            return cls(
+                pd.to_datetime(arrays["dates"]),
+                arrays["markets"].astype(object),
+                arrays["commodities"].astype(object),
+                arrays["units"].astype(object),
+                arrays["latitudes"],
+                arrays["longitudes"],
+                arrays["sums"],
+                arrays["counts"],
+            )
+
+    def _select(self, widget_date_range, widget_market_values, widget_commodity_values, located=False):
+        """
+        Return the date slice and the location / commodity positions of a selection.
+
+        With `located`, locations without coordinates are left out, as the groupbys of
+        the pandas path drop them.
+        """
+        if widget_date_range is None:
+            date_slice = slice(0, len(self.dates))
+        else:
+            date_slice = slice(
+                self.dates.searchsorted(pd.Timestamp(widget_date_range[0]), side="left"),
+                self.dates.searchsorted(pd.Timestamp(widget_date_range[1]), side="right"),
+            )
+        is_selected = self.markets.isin(widget_market_values)
+        if located:
+            is_selected &= ~(np.isnan(self.latitudes) | np.isnan(self.longitudes))
+        commodity_positions = self.commodities.get_indexer(pd.Index(widget_commodity_values).unique())
+
+        return (
+            date_slice,
+            np.flatnonzero(is_selected),
+            np.sort(commodity_positions[commodity_positions >= 0]),
+        )
+
+    def _market_index(self, widget_date_range, widget_market_values, widget_commodity_values):
+        """Return dates, location positions and the (date, location) sums and counts over selected commodities."""
+        date_slice, market_positions, commodity_positions = self._select(
+            widget_date_range, widget_market_values, widget_commodity_values, located=True
+        )
+        cells = (date_slice, market_positions[:, None], commodity_positions[None, :])
+
+        return (
+            self.dates[date_slice],
+            market_positions,
+            self.sums[cells].sum(axis=2),
+            self.counts[cells].sum(axis=2),
+        )
+
+    @traced("cube.food_price_index")
+    def food_price_index(self, widget_market_values, widget_commodity_values, widget_date_range=None):
+        """
+        Compute the food price index, the arithmetic average of prices by date and location.
+
+        Equivalent to the index rows appended by generate_food_price_index_data().
+
+        Returns
+        -------
+        pd.DataFrame
+            Dataframe with columns date, market, latitude, longitude, usdprice, commodity, unit
+            and month, the date normalized to the start of its month.
+        """
+        dates, market_positions, sums, counts = self._market_index(
+            widget_date_range, widget_market_values, widget_commodity_values
+        )
+        date_ids, market_ids = np.nonzero(counts)
+        market_positions = market_positions[market_ids]
+
+        return pd.DataFrame({
+            "date": dates[date_ids],
+            "market": self.markets[market_positions],
+            "latitude": self.latitudes[market_positions],
+            "longitude": self.longitudes[market_positions],
+            "usdprice": sums[date_ids, market_ids] / counts[date_ids, market_ids],
+            "commodity": INDEX_COMMODITY,
+            "unit": INDEX_UNIT,
+            "month": to_month_start(dates)[date_ids],
+        })
+
+    @traced("cube.price_summary")
+    def price_summary(self, widget_date_range, widget_market_values, widget_commodity_values):
+        """
+        Compute the latest average price and period-over-period changes per commodity.
+
+        Equivalent to the summary computed by generate_figure_chart().
+
+        Returns
+        -------
+        pd.DataFrame
+            Dataframe with columns commodity, unit, mom, yoy, usdprice and date.
+        """
+        date_slice, market_positions, commodity_positions = self._select(
+            widget_date_range, widget_market_values, widget_commodity_values
+        )
+        cells = (date_slice, market_positions[:, None], commodity_positions[None, :])
+        sums = self.sums[cells].sum(axis=1)
+        counts = self.counts[cells].sum(axis=1)
+
+        return self._summarize(
+            self.dates[date_slice],
+            self.commodities[commodity_positions],
+            self.units[commodity_positions],
+            sums,
+            counts,
+        )
+
+    @traced("cube.index_summary")
+    def index_summary(self, widget_date_range, widget_market_values, widget_commodity_values):
+        """
+        Compute the latest average and period-over-period changes of the food price index.
+
+        Equivalent to generate_figure_chart() on the output of generate_food_price_index_data()
+        for the "Food Price Index" commodity.
+        """
+        dates, _, sums, counts = self._market_index(
+            widget_date_range, widget_market_values, widget_commodity_values
+        )
+        has_index = counts > 0
+        index_values = np.divide(sums, counts, out=np.zeros_like(sums), where=has_index)
+
+        return self._summarize(
+            dates,
+            pd.Index([INDEX_COMMODITY]),
+            np.array([INDEX_UNIT], dtype=object),
+            index_values.sum(axis=1, keepdims=True),
+            has_index.sum(axis=1, keepdims=True),
+        )
+
+    @traced("cube.latest_index_by_market")
+    def latest_index_by_market(self, widget_date_range, widget_market_values, widget_commodity_values):
+        """
+        Compute the latest food price index of each location within the date range.
+
+        Equivalent to the summary computed by generate_geo_chart() for the "Food Price Index".
+
+        Returns
+        -------
+        pd.DataFrame
+            Dataframe with columns market, latitude, longitude, date and usdprice.
+        """
+        dates, market_positions, sums, counts = self._market_index(
+            widget_date_range, widget_market_values, widget_commodity_values
+        )
+        has_index = (counts > 0).any(axis=0)
+        latest = len(dates) - 1 - np.argmax(counts[::-1] > 0, axis=0)
+        market_ids = np.nonzero(has_index)[0]
+        latest = latest[market_ids]
+        market_positions = market_positions[market_ids]
+
+        return pd.DataFrame({
+            "market": self.markets[market_positions],
+            "latitude": self.latitudes[market_positions],
+            "longitude": self.longitudes[market_positions],
+            "date": dates[latest],
+            "usdprice": sums[latest, market_ids] / counts[latest, market_ids],
+        })
+
+    @staticmethod
+    def _summarize(dates, commodities, units, sums, counts):
+        """Reduce (date, commodity) sums and counts to the latest value, MoM and YoY changes."""
+        # Keep dates with at least one price, as a pivot table of the prices would
+        has_price = counts > 0
+        rows = has_price.any(axis=1)
+        columns = has_price.any(axis=0)
+        values = np.where(has_price, sums / np.where(has_price, counts, 1), np.nan)[rows][:, columns]
+        dates = dates[rows]
+
+        # Forward fill missing values before computing changes, as DataFrame.pct_change does
+        filled = pd.DataFrame(values).ffill().to_numpy()
+
+        def change(periods):
+            if len(filled) <= periods:
+                return np.full(filled.shape[1], np.nan)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return filled[-1] / filled[-1 - periods] - 1
+
+        return pd.DataFrame({
+            "commodity": commodities[columns],
+            "unit": units[columns],
+            "mom": change(1),
+            "yoy": change(12),
+            "usdprice": values[-1] if len(values) else np.nan,
+            "date": dates[-1] if len(dates) else pd.NaT,
+        })
+
+
+if __name__ == "__main__":
+    pass
@@ -1,25 +1,102 @@
 # Script containing all data retrieval and preprocessing relevant to app.py
-import itertools
+import os
+import functools
+import numpy as np
 import pandas as pd
 import country_converter as coco
 
 
 from io import StringIO
-from hdx.api.configuration import Configuration
-from hdx.data.dataset import Dataset
-from src.cache_config import cache
+from src.cache_config import memoize
+from src.sources import get_data_source, open_location
+from src.tracing import span, traced
+
+
+COUNTRY_NAMES_PATH = os.environ.get(
+    "FOOD_PRICE_COUNTRY_NAMES", os.path.join("data", "processed", "country_names.csv")
+)
+
+# Size in bytes of the blocks in which country datasets are parsed
+CSV_BLOCK_SIZE = int(os.environ.get("FOOD_PRICE_CSV_BLOCK_SIZE", 1 << 20))
+# Columns of the WFP datasets used by the dashboard, and their types once parsed
+CSV_COLUMN_TYPES = {
+    "date": "timestamp",
+    "market": "category",
+    "latitude": "float64",
+    "longitude": "float64",
+    "commodity": "category",
+    "unit": "category",
+    "usdprice": "float64",
+}
 
 
 ## Data Loading
 
-# create HDX configuration
-Configuration.create(
-    hdx_site="prod",
-    user_agent="DSCI-532_2024_19_food-price-tracker",
-    hdx_read_only=True,
-)
+def convert_country_codes(iso3_codes):
+    """
+    Convert ISO3 country codes to short country names and ISO numeric codes.
+
+    Conversions are persisted to COUNTRY_NAMES_PATH, so that country_converter
+    only runs once for each code.
+
+    Parameters
+    ----------
+    iso3_codes : list-like of str
+        ISO3 country codes, e.g. ["JPN", "AFG"].
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe indexed by the given codes, with columns "name_short" and "iso_numeric".
+        Codes unknown to country_converter have missing values.
 
-@cache.memoize()
+    Examples
+    --------
+    >>> convert_country_codes(["JPN"])
+    """
+    try:
+        names_df = pd.read_csv(COUNTRY_NAMES_PATH, index_col="countryiso3")
+    except FileNotFoundError:
+        names_df = pd.DataFrame(
+            columns=["name_short", "iso_numeric"], index=pd.Index([], name="countryiso3")
+        )
+
+    missing_codes = pd.Index(pd.unique(pd.Series(iso3_codes))).difference(names_df.index)
+    if len(missing_codes) > 0:
+        cc = coco.CountryConverter()
+        missing_series = pd.Series(missing_codes)
+        new_df = pd.DataFrame({
+            "name_short": cc.pandas_convert(series=missing_series, src="ISO3", to="name_short").values,
+            "iso_numeric": cc.pandas_convert(series=missing_series, src="ISO3", to="ISOnumeric").values,
+        }, index=missing_codes.rename("countryiso3")).replace("not found", pd.NA)
+
+        names_df = pd.concat([names_df, new_df]) if len(names_df) > 0 else new_df
+
+        os.makedirs(os.path.dirname(COUNTRY_NAMES_PATH), exist_ok=True)
+        tmp_path = f"{COUNTRY_NAMES_PATH}.{os.getpid()}.tmp"
+        names_df.to_csv(tmp_path)
+        os.replace(tmp_path, COUNTRY_NAMES_PATH)
+
+    return names_df.reindex(iso3_codes)
+
+
+@functools.lru_cache(maxsize=None)
+def get_country_iso_numeric(country):
+    """
+    Return the ISO numeric code of a country from its short name, e.g. 392 for "Japan".
+    """
+    try:
+        names_df = pd.read_csv(COUNTRY_NAMES_PATH)
+        iso_numeric = names_df.loc[names_df.name_short == country, "iso_numeric"]
+        if len(iso_numeric) > 0 and pd.notna(iso_numeric.iloc[0]):
+            return int(iso_numeric.iloc[0])
+    except FileNotFoundError:
+        pass
+    return coco.convert(names=country, to="ISOnumeric")
+
+
+@memoize
+@traced()
 def fetch_country_index():
     """
     Fetch country index and preprocess into dataframe.
@@ -35,40 +112,48 @@ def fetch_country_index():
     >>> country_index = fetch_country_index()
     """
 
-    cc = coco.CountryConverter()
-
     country_index_df = pd.read_csv(
-        Dataset.read_from_hdx("global-wfp-food-prices").get_resource(0)["url"],
+        get_data_source().index_location(),
         parse_dates=["start_date", "end_date"],
         header=0,
         skiprows=[1],
     )
 
-    country_index_df = country_index_df.assign(
-        country=cc.pandas_convert(series=country_index_df.countryiso3, to="name_short"),
-        hdx_identifier=country_index_df.url.str.rsplit("/", n=1).str[1],
-    ).set_index("country")
-
-    # For prototype
-    prototype_countries = [
-        'Afghanistan',
-        'Bolivia',
-        'Japan',
-        'Mexico',
-        'Laos',
-        'Pakistan',
-        'Syria',
-        'Tanzania',
-        'Ukraine',
-    ]
-
-    country_index_df = country_index_df.loc[prototype_countries]
+    country_index_df = (
+        country_index_df.assign(
+            country=convert_country_codes(country_index_df.countryiso3)["name_short"].values,
+            hdx_identifier=country_index_df.url.str.rsplit("/", n=1).str[1],
+        )
+        .dropna(subset=["country"])
+        .set_index("country")
+    )
 
     return country_index_df.to_json(date_format='iso', orient='split')
 
-def fetch_country_data(country, country_index_json=fetch_country_index()):
+
+@functools.lru_cache(maxsize=4)
+def get_country_options(country_index_json):
+    """
+    Return the sorted list of countries for the country dropdown.
+
+    Parameters
+    ----------
+    country_index_json : str
+        JSON string of the country index, the output of fetch_country_index().
+
+    Returns
+    -------
+    list of str
+        Sorted country names.
+    """
+    with span("read_json"):
+        country_index_df = pd.read_json(StringIO(country_index_json), orient='split')
+    return sorted(country_index_df.index.to_list())
+
+@traced()
+def fetch_country_data(country, country_index_json=None):
     """
-    Fetch and preprocess data from HDX (https://data.humdata.org/)
+    Fetch and preprocess data from HDX (https://data.humdata.org/), or its local mirror.
     Dynamically load the corresponding country dataset and preprocess.
 
     Parameters
@@ -99,27 +184,148 @@ def fetch_country_data(country, country_index_json=fetch_country_index()):
         "usdprice",
     ]
 
-    country_index_df = pd.read_json(StringIO(country_index_json), orient='split')
+    if country_index_json is None:
+        country_index_json = fetch_country_index()
 
-    country_df = pd.read_csv(
-        Dataset.read_from_hdx(
-            country_index_df.loc[country, "hdx_identifier"]
-        ).get_resource(0)["url"],
-        parse_dates=["date"],
-        header=0,
-        skiprows=[1],
+    with span("read_json"):
+        country_index_df = pd.read_json(StringIO(country_index_json), orient='split')
+
+    country_df = read_country_csv(
+        get_data_source().country_location(country_index_df.loc[country])
     )[columns_to_keep]
 
     return country_df
 
 
+@traced()
+def read_country_csv(location, block_size=CSV_BLOCK_SIZE):
+    """
+    Read the columns of CSV_COLUMN_TYPES from a WFP dataset, block by block.
+
+    The file is parsed by pyarrow in blocks of `block_size` bytes as it is read,
+    e.g. while it is still being downloaded from an HTTP(S) location. Other columns
+    are skipped without being converted. Each block is converted as it arrives and
+    then released: numbers and dates to numpy arrays, and text columns to codes of
+    categories shared by all blocks. Memory thus grows with the number of rows kept,
+    as the compact frame being built, rather than with the size of the file. Rows
+    are not filtered block by block, as the cleaning rules of filter_major_data()
+    depend on the date and market coverage of the whole country.
+
+    Categories are sorted, so that grouping and sorting on them orders rows as on
+    the text values. Numbers are kept as float64, as parsed by pd.read_csv.
+
+    Parameters
+    ----------
+    location : str or file-like
+        Path, URL or in-memory text file of the dataset, as returned by a data source.
+    block_size : int, optional
+        Size in bytes of the parsed blocks. Defaults to $FOOD_PRICE_CSV_BLOCK_SIZE, or 1 MiB.
+
+    Returns
+    -------
+    pd.DataFrame
+        The kept columns, with categorical text columns.
+
+    Examples
+    --------
+    >>> read_country_csv("data/raw/wfp_food_prices_jpn.csv")
+    """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+
+    arrow_types = {
+        "timestamp": pa.timestamp("ns"),
+        "category": pa.dictionary(pa.int32(), pa.string()),
+        "float64": pa.float64(),
+    }
+    # Types of the converted blocks, categories being read as codes
+    numpy_types = {"timestamp": "datetime64[ns]", "category": np.int32, "float64": np.float64}
+    read_options = pa_csv.ReadOptions(block_size=block_size, skip_rows_after_names=1)
+    convert_options = pa_csv.ConvertOptions(
+        include_columns=list(CSV_COLUMN_TYPES),
+        column_types={column: arrow_types[kind] for column, kind in CSV_COLUMN_TYPES.items()},
+        strings_can_be_null=True,
+    )
+
+    chunks = {column: [] for column in CSV_COLUMN_TYPES}
+    categories = {column: {} for column, kind in CSV_COLUMN_TYPES.items() if kind == "category"}
+    with open_location(location) as stream:
+        for batch in pa_csv.open_csv(stream, read_options=read_options, convert_options=convert_options):
+            for column in CSV_COLUMN_TYPES:
+                array = batch.column(column)
+                if column in categories:
+                    # Map the codes of the block dictionary to the shared categories, nulls to -1
+                    codes = categories[column]
+                    lookup = np.array(
+                        [codes.setdefault(value, len(codes)) if value is not None else -1
+                         for value in array.dictionary.to_pylist()] + [-1],
+                        dtype=np.int32,
+                    )
+                    array = lookup[array.indices.fill_null(len(lookup) - 1).to_numpy()]
+                else:
+                    array = array.to_numpy(zero_copy_only=False)
+                chunks[column].append(array)
+
+    country_df = pd.DataFrame(index=pd.RangeIndex(sum(map(len, chunks["date"]))))
+    for column, kind in CSV_COLUMN_TYPES.items():
+        values = np.concatenate(chunks.pop(column) or [np.array([], dtype=numpy_types[kind])])
+        if kind == "category":
+            labels = np.array(list(categories[column]), dtype=object)
+            order = np.argsort(labels, kind="stable")
+            ranks = np.empty(len(labels) + 1, dtype=np.int32)
+            ranks[order], ranks[-1] = np.arange(len(labels)), -1
+            values = pd.Categorical.from_codes(ranks[values], categories=pd.Index(labels[order], dtype=object))
+        country_df[column] = values
+
+    return country_df
+
+
+def prefetch_countries(countries, country_index_json=None, max_workers=None):
+    """
+    Download the datasets of several countries concurrently, ahead of fetch_country_data().
+
+    Parameters
+    ----------
+    countries : list of str
+        Countries to prefetch, e.g. ["Japan", "India"]. Countries missing from the index are skipped.
+
+    country_index_json : pd.DataFrame, optional
+        Index dataset from "global-wfp-food-prices" in the HDX, the output from fetch_country_index_df(). By default, the output from fetch_country_index_df().
+
+    max_workers : int, optional
+        Number of countries downloaded at the same time. Defaults to the size of the HTTP connection pool.
+
+    Returns
+    -------
+    dict
+        Outcome of the prefetch per ISO3 code, e.g. {"JPN": "downloaded"}.
+
+    Examples
+    --------
+    >>> prefetch_countries(["Japan", "India"])
+    """
+    if country_index_json is None:
+        country_index_json = fetch_country_index()
+
+    with span("read_json"):
+        country_index_df = pd.read_json(StringIO(country_index_json), orient='split')
+    country_rows = [country_index_df.loc[country] for country in countries if country in country_index_df.index]
+
+    return get_data_source().prefetch(country_rows, max_workers=max_workers)
+
+
 
 ## Data Preprocessing
 
+@traced()
 def filter_major_data(data, date_abundance_threshold=0.5, market_abundance_threshold=0.7):
     """
     Filter major data based on specified thresholds for date and market abundance.
 
+    The unit map, pair counts and market coverage are computed on integer factor
+    codes, and each rule only updates a boolean mask, so intermediate frames are
+    not merged back onto the data.
+
     Parameters
     ----------
     data : pandas.DataFrame
@@ -147,65 +353,65 @@ def filter_major_data(data, date_abundance_threshold=0.5, market_abundance_thres
         "usdprice",
     ]
 
-    clean_data_df = data
-
     # Rule 0 - Deduplication on unit and (date, commodity, market)
-    map_df = (
-        clean_data_df.groupby(["commodity", "unit"])
-        .agg({"unit": "count"})
-        .groupby(["commodity"])
-        .idxmax()
-    )
-    map_df["unit"] = map_df["unit"].str[1]
-    map_df = map_df.reset_index()
-    clean_data_df = clean_data_df.merge(
-        map_df, how="inner", on=["commodity", "unit"]
-    )
+    commodity_codes, commodities = pd.factorize(data["commodity"])
+    unit_codes, units = pd.factorize(data["unit"])
+    is_valid = (commodity_codes >= 0) & (unit_codes >= 0)
+    if not is_valid.any():
+        return data.loc[is_valid, columns_to_keep].reset_index(drop=True)
+
+    unit_counts = np.bincount(
+        commodity_codes[is_valid] * len(units) + unit_codes[is_valid],
+        minlength=len(commodities) * len(units),
+    ).reshape(len(commodities), len(units))
+
+    # Most frequent unit per commodity, ties broken by the alphabetical order of units
+    unit_order = np.argsort(np.asarray(units, dtype=str), kind="stable")
+    major_units = unit_order[unit_counts[:, unit_order].argmax(axis=1)]
+    is_kept = is_valid & (unit_codes == major_units[commodity_codes])
+
     clean_data_df = (
-        clean_data_df[columns_to_keep]
-        .groupby(columns_to_keep[:-1])
-        .first(["usdprice"])
+        data.loc[is_kept, columns_to_keep]
+        .groupby(columns_to_keep[:-1], observed=True)
+        .first()
         .reset_index()
     )
 
     # Rule 1 - data existence for each (commodity, market) pair relative to the full duration length >= x%
+    market_codes, markets = pd.factorize(clean_data_df["market"])
+    commodity_codes, commodities = pd.factorize(clean_data_df["commodity"])
+    pair_codes = market_codes * len(commodities) + commodity_codes
+
     num_date = clean_data_df["date"].nunique()
-    map_df = (
-        clean_data_df.groupby(["market", "commodity"]).agg(
-            {"usdprice": "count"}
-        )
-        >= date_abundance_threshold * num_date
+    pair_counts = np.bincount(
+        pair_codes[clean_data_df["usdprice"].notna().to_numpy()],
+        minlength=len(markets) * len(commodities),
     )
-    map_df = map_df.rename(columns={"usdprice": "is_kept"})
-    clean_data_df = clean_data_df.merge(
-        map_df, how="left", on=["market", "commodity"]
-    )
-    clean_data_df = clean_data_df[
-        clean_data_df["is_kept"] == True
-    ].drop(columns=["is_kept"])
+    is_kept = pair_counts[pair_codes] >= date_abundance_threshold * num_date
 
     # Rule 2 - data of a commodity exists, relative to the total number of markets >= x%
-    num_market = clean_data_df["market"].nunique()
-    map_df = (
-        clean_data_df.groupby(["commodity"]).agg(
-            {"market": "nunique"}
-        )
-        >= market_abundance_threshold * num_market
-    )
-    map_df = map_df.rename(columns={"market": "is_kept"})
-    clean_data_df = clean_data_df.merge(
-        map_df, how="left", on=["commodity"]
-    )
-    clean_data_df = clean_data_df[
-        clean_data_df["is_kept"] == True
-    ].drop(columns=["is_kept"])
+    kept_pairs = np.unique(pair_codes[is_kept])
+    num_market = len(np.unique(kept_pairs // len(commodities)))
+    market_counts = np.bincount(kept_pairs % len(commodities), minlength=len(commodities))
+    is_major = market_counts[commodity_codes] >= market_abundance_threshold * num_market
+
+    # Index rows by their position among the rows kept by rule 1
+    kept_positions = np.cumsum(is_kept) - 1
+    clean_data_df = clean_data_df[is_kept & is_major]
+    clean_data_df.index = kept_positions[is_kept & is_major]
 
     return clean_data_df
 
+@traced()
 def fill_missing_data(data, method="forward"):
     """
     Fills missing values in the USD price column based on specified method.
 
+    Only the (market, commodity) pairs present in the data are reindexed onto the
+    date axis, from their first observation onwards. Rows are returned in
+    (date, market, commodity) order of first appearance, with the index they
+    would have in the full cartesian product of dates, markets and commodities.
+
     Parameters
     ----------
     data : pandas.DataFrame
@@ -231,40 +437,64 @@ def fill_missing_data(data, method="forward"):
         "usdprice",
     ]
 
-    # Generate dataframe with full combinations of factors
-    full_data_df = pd.DataFrame(
-        itertools.product(
-            # pd.date_range(data["date"].min(), data["date"].max(), freq='MS') + pd.DateOffset(days=14),
-            data["date"].unique(),
-            data["market"].unique(),
-            data["commodity"].unique(),
-        ),
-        columns=["date", "market", "commodity"],
+    if data.empty:
+        return data[columns_to_keep]
+
+    # Encode factors in order of first appearance
+    date_codes, dates = pd.factorize(data["date"])
+    market_codes, markets = pd.factorize(data["market"])
+    commodity_codes, commodities = pd.factorize(data["commodity"])
+    num_pair = len(markets) * len(commodities)
+
+    # Position of each row in the full (date, market, commodity) cartesian product
+    pair_codes = market_codes.astype(np.int64) * len(commodities) + commodity_codes
+    data_keys = date_codes * num_pair + pair_codes
+
+    # Expand each observed pair from its first date to the last date
+    pairs, pair_inverse = np.unique(pair_codes, return_inverse=True)
+    first_dates = np.full(len(pairs), len(dates), dtype=np.int64)
+    np.minimum.at(first_dates, pair_inverse, date_codes)
+    lengths = len(dates) - first_dates
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    full_keys = (np.repeat(first_dates, lengths) + offsets) * num_pair + np.repeat(pairs, lengths)
+
+    # Rows to be filled, as (date, market, commodity) with missing values
+    missing_keys = np.setdiff1d(full_keys, data_keys)
+    missing_df = pd.DataFrame({
+        "date": dates.take(missing_keys // num_pair),
+        "market": markets.take(missing_keys % num_pair // len(commodities)),
+        "commodity": commodities.take(missing_keys % len(commodities)),
+    })
+
+    full_data_df = pd.concat(
+        [data[columns_to_keep], missing_df], axis=0, ignore_index=True
     )
-
-    # Fill the missing value per (date, commodity, market)
-    full_data_df = full_data_df.merge(
-        data, how="left", on=["date", "market", "commodity"]
+    full_keys = np.concatenate([data_keys, missing_keys])
+    order = np.argsort(full_keys, kind="stable")
+    full_data_df = full_data_df.take(order)
+    full_keys = full_keys[order]
+
+    # Duplicated (date, market, commodity) rows shift the position of all later rows
+    full_data_df.index = full_keys + np.cumsum(
+        np.concatenate([[False], full_keys[1:] == full_keys[:-1]])
     )
+
+    # Fill the missing value per (market, commodity)
     if method == "forward":
-        full_data_df = full_data_df.merge(
-            full_data_df.groupby(
-                ["market", "commodity"]
-            ).ffill(),
-            how="inner",
-            left_index=True,
-            right_index=True,
-            suffixes=("_drop", None),
-        )
+        fill_columns = ["date", "latitude", "longitude", "unit", "usdprice"]
+        full_data_df[fill_columns] = full_data_df[fill_columns].groupby(
+            full_keys % num_pair
+        ).ffill()
     full_data_df = full_data_df[columns_to_keep].dropna(
         subset=["usdprice"], axis=0
     )
 
     return full_data_df
 
+@traced()
 def get_clean_data(data):
     """
-    Returns JSON data containing cleaned data.
+    Returns cleaned data, ready to be written into the country store.
 
     Parameters
     ----------
@@ -273,16 +503,17 @@ def get_clean_data(data):
 
     Returns
     -------
-    str
-        JSON string containing cleaned major data.
+    pd.DataFrame
+        dataframe containing cleaned major data.
     """
     data_df = filter_major_data(data)
     data_df = fill_missing_data(data_df)
 
-    return data_df.to_json(date_format='iso', orient='split')
+    return data_df
 
 
 ## Generate index
+@traced()
 def generate_food_price_index_data(data, widget_market_values, widget_commodity_values):
     """
     Generate food price index data based on the selected markets and commodities.
@@ -342,7 +573,7 @@ def generate_food_price_index_data(data, widget_market_values, widget_commodity_
     # Calculate index (formula: arithmetic average of the index by date and market)
     index = (
         price_data.groupby(
-            ["date", "market", "latitude", "longitude"]
+            ["date", "market", "latitude", "longitude"], observed=True
         ).agg({
             "usdprice": "mean"
         })
@@ -0,0 +1,120 @@
+# Script containing the row index of the country frames used by plotting.py
+# Stored frames are sorted by (commodity, market, date), so that the rows of each
+# (commodity, market) pair are contiguous and ordered by date. Selections of dates,
+# markets and commodities then resolve to row ranges with `searchsorted`, instead
+# of boolean scans over the whole frame.
+import numpy as np
+import pandas as pd
+
+
+class FrameIndex:
+    """
+    Offset index of a country frame.
+
+    Attributes
+    ----------
+    commodities : pd.Index
+        Commodities of the frame, in the order of their codes.
+    markets : pd.Index
+        Markets of the frame, in the order of their codes.
+    dates : pd.DatetimeIndex
+        Sorted unique dates.
+    keys : np.ndarray
+        Sorted (commodity, market, date) key of each row, as a single integer.
+    order : np.ndarray or None
+        Frame position of each sorted key, or None if the frame is already sorted.
+    """
+
+    def __init__(self, commodities, markets, dates, keys, order=None):
+        self.commodities = pd.Index(commodities)
+        self.markets = pd.Index(markets)
+        self.dates = pd.DatetimeIndex(dates)
+        self.keys = keys
+        self.order = order
+
+    @staticmethod
+    def _codes(column):
+        """Return the codes and values of a column, keeping the categories order of categoricals."""
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            return column.cat.codes.to_numpy(dtype=np.int64), column.cat.categories
+        codes, uniques = pd.factorize(column)
+        return codes.astype(np.int64), uniques
+
+    @classmethod
+    def from_frame(cls, data):
+        """
+        Build the index of a country frame.
+
+        Frames in the store layout (see store.to_store_layout()) are already sorted and
+        are indexed in a single pass; other frames are sorted by a stable argsort.
+        """
+        commodity_codes, commodities = cls._codes(data["commodity"])
+        market_codes, markets = cls._codes(data["market"])
+        date_codes, dates = pd.factorize(data["date"], sort=True)
+
+        keys = (commodity_codes * len(markets) + market_codes) * len(dates) + date_codes
+        order = None
+        if np.any(keys[1:] < keys[:-1]):
+            order = np.argsort(keys, kind="stable")
+            keys = keys[order]
+
+        return cls(commodities, markets, dates, keys, order)
+
+    def rows(self, widget_date_range, widget_market_values, widget_commodity_values):
+        """
+        Return the frame positions of the selected rows of each commodity.
+
+        Equivalent to the positions of `date.between(*widget_date_range)`,
+        `market.isin(widget_market_values)` and `commodity == commodity` in a sorted frame.
+
+        Parameters
+        ----------
+        widget_date_range : tuple or None
+            The start and end dates of the selection, both included. None selects all dates.
+        widget_market_values : list of str
+            Markets of the selection.
+        widget_commodity_values : list of str
+            Commodities of the selection.
+
+        Returns
+        -------
+        dict
+            Frame positions of the rows of each selected commodity present in the frame,
+            ordered by market code, then date.
+
+        Examples
+        --------
+        >>> FrameIndex.from_frame(data).rows(("2020-01-01", "2022-01-01"), ["Tokyo"], ["Rice"])
+        {'Rice': array([1052, 1053, ...])}
+        """
+        if widget_date_range is None:
+            first_date, stop_date = 0, len(self.dates)
+        else:
+            first_date = self.dates.searchsorted(pd.Timestamp(widget_date_range[0]), side="left")
+            stop_date = self.dates.searchsorted(pd.Timestamp(widget_date_range[1]), side="right")
+
+        commodities = pd.Index(widget_commodity_values).unique()
+        commodity_codes = self.commodities.get_indexer(commodities)
+        market_codes = np.sort(self.markets.get_indexer(pd.Index(widget_market_values).unique()))
+        market_codes = market_codes[market_codes >= 0]
+        present = commodity_codes >= 0
+        if len(market_codes) == 0:
+            return {commodity: np.array([], dtype=np.intp) for commodity in commodities[present]}
+
+        # Row range of each selected (commodity, market) pair within the date range
+        pairs = (commodity_codes[present, None] * len(self.markets) + market_codes).ravel()
+        starts = np.searchsorted(self.keys, pairs * len(self.dates) + first_date, side="left")
+        stops = np.searchsorted(self.keys, pairs * len(self.dates) + stop_date, side="left")
+
+        lengths = np.maximum(stops - starts, 0)
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        if self.order is not None:
+            positions = self.order[positions]
+
+        # Split the positions by commodity
+        bounds = np.cumsum(lengths.reshape(-1, len(market_codes)).sum(axis=1))
+        return dict(zip(commodities[present], np.split(positions, bounds[:-1])))
+
+
+if __name__ == "__main__":
+    pass
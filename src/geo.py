@@ -0,0 +1,178 @@
+# Script containing the per-country map shapes used by plotting.py
+# The world TopoJSON is decoded and split by ISO numeric code once, each country's
+# geometry is simplified and written to disk as GeoJSON, so that geo charts embed
+# only the selected country instead of the whole world.
+#
+# Usage:
+#     python -m src.geo    # split the world map into data/processed/geo
+import os
+import json
+import functools
+import threading
+import shapely
+import numpy as np
+
+from shapely.geometry import shape, mapping
+
+
+WORLD_PATH = os.path.join("data", "raw", "ne_50m_admin_0_countries.json")
+WORLD_OBJECT = "ne_50m_admin_0_countries"
+GEO_DIR = os.environ.get("FOOD_PRICE_GEO_DIR", os.path.join("data", "processed", "geo"))
+SIMPLIFY_TOLERANCE = float(os.environ.get("FOOD_PRICE_GEO_TOLERANCE", 0.01))
+COORDINATE_DECIMALS = 4
+
+_split_lock = threading.Lock()
+
+
+def decode_arcs(topology):
+    """
+    Decode the quantized, delta-encoded arcs of a TopoJSON topology.
+
+    Parameters
+    ----------
+    topology : dict
+        TopoJSON topology.
+
+    Returns
+    -------
+    list of np.ndarray
+        (n, 2) array of longitude / latitude positions per arc.
+    """
+    transform = topology.get("transform")
+    arcs = []
+    for arc in topology["arcs"]:
+        positions = np.asarray(arc, dtype=float)
+        if transform is not None:
+            positions = np.cumsum(positions, axis=0) * transform["scale"] + transform["translate"]
+        arcs.append(positions)
+    return arcs
+
+
+def _ring(arcs, arc_ids):
+    """Stitch the arcs of a ring, dropping the position shared by consecutive arcs."""
+    positions = []
+    for i, arc_id in enumerate(arc_ids):
+        arc = arcs[arc_id] if arc_id >= 0 else arcs[~arc_id][::-1]
+        positions.append(arc if i == 0 else arc[1:])
+    return np.concatenate(positions).tolist()
+
+
+def _geometry(arcs, geometry):
+    """Convert a TopoJSON Polygon or MultiPolygon to GeoJSON."""
+    if geometry["type"] == "Polygon":
+        coordinates = [_ring(arcs, ring) for ring in geometry["arcs"]]
+    elif geometry["type"] == "MultiPolygon":
+        coordinates = [[_ring(arcs, ring) for ring in polygon] for polygon in geometry["arcs"]]
+    else:
+        raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+    return {"type": geometry["type"], "coordinates": coordinates}
+
+
+def split_world(world_path=WORLD_PATH, geo_dir=GEO_DIR, tolerance=SIMPLIFY_TOLERANCE):
+    """
+    Split the world TopoJSON into one simplified GeoJSON file per ISO numeric code.
+
+    Writes `{geo_dir}/{iso_n3}.json` for each country, holding the list of its features,
+    and `{geo_dir}/index.json` with the bounding box of each country. Coordinates are
+    rounded to 4 decimals (about 10 m), well below the simplification tolerance.
+
+    Parameters
+    ----------
+    world_path : str, optional
+        Path of the world TopoJSON.
+    geo_dir : str, optional
+        Output directory. Defaults to $FOOD_PRICE_GEO_DIR, or "data/processed/geo".
+    tolerance : float, optional
+        Simplification tolerance in degrees. Defaults to $FOOD_PRICE_GEO_TOLERANCE, or 0.01.
+
+    Returns
+    -------
+    dict
+        Bounding box [min_lon, min_lat, max_lon, max_lat] per ISO numeric code.
+    """
+    with open(world_path, "r") as file:
+        topology = json.load(file)
+    arcs = decode_arcs(topology)
+
+    countries = {}
+    for geometry in topology["objects"][WORLD_OBJECT]["geometries"]:
+        iso_n3 = geometry["properties"]["ISO_N3"]
+        simplified = shape(_geometry(arcs, geometry)).simplify(tolerance, preserve_topology=True)
+        simplified = shapely.transform(simplified, lambda positions: positions.round(COORDINATE_DECIMALS))
+        countries.setdefault(iso_n3, []).append({
+            "type": "Feature",
+            "properties": {"ISO_N3": iso_n3, "NAME": geometry["properties"].get("NAME")},
+            "geometry": mapping(simplified),
+            "bounds": simplified.bounds,
+        })
+
+    os.makedirs(geo_dir, exist_ok=True)
+    index = {}
+    for iso_n3, features in countries.items():
+        bounds = np.array([feature.pop("bounds") for feature in features])
+        index[iso_n3] = [*bounds[:, :2].min(axis=0).tolist(), *bounds[:, 2:].max(axis=0).tolist()]
+        _write_json(os.path.join(geo_dir, f"{iso_n3}.json"), features)
+
+    # The index is written last, as the marker of a complete split
+    _write_json(os.path.join(geo_dir, "index.json"), index)
+
+    return index
+
+
+def _write_json(path, value):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(value, file, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+@functools.lru_cache(maxsize=None)
+def load_geo_index():
+    """
+    Return the bounding box of each country, splitting the world map on first use.
+
+    Returns
+    -------
+    dict
+        Bounding box [min_lon, min_lat, max_lon, max_lat] per ISO numeric code, e.g. "392".
+    """
+    index_path = os.path.join(GEO_DIR, "index.json")
+    with _split_lock:
+        if not os.path.exists(index_path):
+            return split_world()
+
+    with open(index_path, "r") as file:
+        return json.load(file)
+
+
+@functools.lru_cache(maxsize=256)
+def load_country_shape(country_id):
+    """
+    Return the simplified GeoJSON features of a country.
+
+    Parameters
+    ----------
+    country_id : int
+        ISO numeric code of the country, e.g. 392 for Japan.
+
+    Returns
+    -------
+    list of dict
+        GeoJSON features of the country, empty if the world map has no such code.
+
+    Examples
+    --------
+    >>> load_country_shape(392)[0]["properties"]
+    {'ISO_N3': '392', 'NAME': 'Japan'}
+    """
+    iso_n3 = f"{country_id:03}"
+    if iso_n3 not in load_geo_index():
+        return []
+
+    with open(os.path.join(GEO_DIR, f"{iso_n3}.json"), "r") as file:
+        return json.load(file)
+
+
+if __name__ == "__main__":
+    index = split_world()
+    print(f"Wrote {len(index)} countries to {GEO_DIR}")
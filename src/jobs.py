@@ -0,0 +1,217 @@
+# Script containing the background job manager of the long-running callbacks in callbacks.py
+# Country loading runs as a Dash background callback in a separate process, so that a
+# slow HDX download does not tie up a web worker. Jobs and their results are kept in a
+# local diskcache, and a pool of job slots bounds the number of concurrent jobs
+# independently of the number of web workers.
+#
+# The job cache is only opened on first use, so that importing the app does not touch the disk.
+# It is given to the public DiskcacheManager constructor of dash, pinned to 2.16 in
+# requirements.txt, as a diskcache.Cache that opens itself when first used.
+#
+# Requires `pip install "dash[diskcache]"`; callbacks run in the request thread without it.
+import os
+import time
+import logging
+import threading
+import contextlib
+
+from dash import DiskcacheManager
+
+try:
+    from diskcache import Cache
+except ImportError:  # background jobs are disabled by create_job_manager()
+    Cache = object
+
+logger = logging.getLogger(__name__)
+
+JOB_DIR = os.environ.get(
+    "FOOD_PRICE_JOB_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "processed", "jobs"),
+)
+JOB_WORKERS = int(os.environ.get("FOOD_PRICE_JOB_WORKERS", 2))
+# Interval in milliseconds at which the browser polls the progress of a job
+JOB_POLL_INTERVAL = int(os.environ.get("FOOD_PRICE_JOB_POLL_INTERVAL", 250))
+
+
+class JobPool:
+    """
+    Cross-process pool of job slots kept in a diskcache.
+
+    Each slot holds the process id of the job using it. Slots of processes that
+    are gone, e.g. jobs terminated when the user picked another country, are
+    reclaimed, so that terminated jobs never leak a slot.
+
+    Parameters
+    ----------
+    manager : DiskcacheManager
+        Manager of the background callbacks, whose cache is shared by the web workers and the jobs.
+    size : int
+        Number of jobs allowed to run at the same time.
+    poll_interval : float, optional
+        Interval in seconds between attempts to acquire a slot. Defaults to 0.1.
+    """
+
+    def __init__(self, manager, size, poll_interval=0.1):
+        self.manager = manager
+        self.size = size
+        self.poll_interval = poll_interval
+
+    @property
+    def cache(self):
+        return self.manager.handle
+
+    def _slot_key(self, i):
+        return f"food_price:job_slot:{i}"
+
+    def _is_free(self, pid):
+        import psutil
+
+        if pid is None:
+            return True
+        try:
+            return psutil.Process(pid).status() == psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            # the process is gone, possibly between listing and querying it
+            return True
+
+    def acquire(self, pid=None):
+        """Wait for a free slot and assign it to a process, returning its number."""
+        pid = pid or os.getpid()
+        while True:
+            with self.cache.transact(retry=True):
+                for i in range(self.size):
+                    if self._is_free(self.cache.get(self._slot_key(i))):
+                        self.cache.set(self._slot_key(i), pid)
+                        return i
+            time.sleep(self.poll_interval)
+
+    def release(self, slot, pid=None):
+        """Free a slot held by a process."""
+        pid = pid or os.getpid()
+        with self.cache.transact(retry=True):
+            if self.cache.get(self._slot_key(slot)) == pid:
+                self.cache.delete(self._slot_key(slot))
+
+    @contextlib.contextmanager
+    def slot(self):
+        """
+        Run a block of code in a slot of the pool.
+
+        Examples
+        --------
+        >>> with job_pool.slot():
+        ...     handle = prepare_country_data(country, country_index)
+        """
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def stats(self):
+        """Return the number of slots of the pool and of slots in use."""
+        in_use = sum(not self._is_free(self.cache.get(self._slot_key(i))) for i in range(self.size))
+        return {"slots": self.size, "in_use": in_use}
+
+
+class LazyCache(Cache):
+    """
+    diskcache.Cache opening its directory and database on first use rather than when created.
+
+    Parameters
+    ----------
+    directory : str
+        Directory of the cache.
+    **kwargs
+        Other arguments of diskcache.Cache.
+    """
+
+    def __init__(self, directory, *args, **kwargs):
+        self._arguments = (directory, args, kwargs)
+        self._open_lock = threading.RLock()
+        self._opening = False
+
+    def __getattr__(self, name):
+        # Only called for attributes missing from the instance, i.e. those set when the
+        # cache is opened. Attributes read while opening it are really missing.
+        lock = self.__dict__.get("_open_lock")
+        if lock is None:
+            raise AttributeError(name)
+        with lock:
+            if self._opening or "_local" in self.__dict__:
+                raise AttributeError(name)
+            directory, args, kwargs = self._arguments
+            self._opening = True
+            try:
+                Cache.__init__(self, directory, *args, **kwargs)
+            finally:
+                self._opening = False
+        return getattr(self, name)
+
+
+class LazyDiskcacheManager(DiskcacheManager):
+    """
+    DiskcacheManager opening its cache in `job_dir` on first use rather than when created.
+
+    Parameters
+    ----------
+    job_dir : str
+        Directory of the job cache.
+    """
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        super().__init__(LazyCache(job_dir))
+
+
+def create_job_manager(job_dir=JOB_DIR):
+    """
+    Create the manager of the background callbacks.
+
+    Parameters
+    ----------
+    job_dir : str, optional
+        Directory of the job cache, opened on first use. Defaults to $FOOD_PRICE_JOB_DIR,
+        or "data/processed/jobs" in the repository.
+
+    Returns
+    -------
+    LazyDiskcacheManager or None
+        The manager, or None if background jobs are disabled with
+        $FOOD_PRICE_BACKGROUND_JOBS=0 or "dash[diskcache]" is not installed.
+    """
+    if os.environ.get("FOOD_PRICE_BACKGROUND_JOBS", "1") == "0":
+        return None
+    try:
+        import diskcache
+        import psutil
+        import multiprocess
+    except ImportError as e:
+        logger.warning(
+            "Background jobs disabled, countries load in the request thread: %s. "
+            'Install "dash[diskcache]" to enable them.', e
+        )
+        return None
+    return LazyDiskcacheManager(job_dir)
+
+
+job_manager = create_job_manager()
+job_pool = JobPool(job_manager, JOB_WORKERS) if job_manager is not None else None
+
+
+def job_stats():
+    """
+    Return the background job metrics.
+
+    Returns
+    -------
+    dict
+        Whether background jobs are enabled, and the size and usage of the job pool.
+    """
+    if job_pool is None:
+        return {"enabled": False}
+    return dict(job_pool.stats(), enabled=True)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,225 @@
+# Script containing the level-of-detail layer of the line charts used by plotting.py
+# Stored frames hold monthly prices. Over long date ranges, line charts are drawn from
+# quarterly or yearly rollups of each (commodity, market) instead, picked from the span of
+# the date range and the point budget of the chart width, and series still longer than the
+# budget are downsampled with Largest-Triangle-Three-Buckets (LTTB), which keeps the points
+# shaping the trend rather than every n-th point.
+import os
+import numpy as np
+import pandas as pd
+
+from src.frame_index import FrameIndex
+from src.utils import to_month_start
+
+
+LINE_CHART_WIDTH = int(os.environ.get("FOOD_PRICE_LINE_CHART_WIDTH", 560))
+LINE_POINT_SPACING = int(os.environ.get("FOOD_PRICE_LINE_POINT_SPACING", 8))
+LOD_LEVELS = {"month": "M", "quarter": "Q", "year": "Y"}
+LOD_MONTHS = {"month": 1, "quarter": 3, "year": 12}
+# A level is used while LTTB keeps at least 1 point in LOD_OVERSAMPLING of its series
+LOD_OVERSAMPLING = 2
+
+
+def line_max_points(width=LINE_CHART_WIDTH):
+    """
+    Return the point budget of each series of a line chart.
+
+    Parameters
+    ----------
+    width : int, optional
+        Nominal width of the chart in pixels. Defaults to $FOOD_PRICE_LINE_CHART_WIDTH (560).
+
+    Returns
+    -------
+    int
+        Number of points fitting in the width at $FOOD_PRICE_LINE_POINT_SPACING pixels (8) apart.
+    """
+    return max(width // LINE_POINT_SPACING, 3)
+
+
+def choose_level(widget_date_range, max_points):
+    """
+    Pick the finest level whose series over a date range can be downsampled to `max_points`.
+
+    Parameters
+    ----------
+    widget_date_range : tuple or None
+        The start and end dates of the chart. None draws the months of the data as they are.
+    max_points : int
+        Point budget of each series, e.g. from line_max_points().
+
+    Returns
+    -------
+    str
+        "month", "quarter" or "year".
+
+    Examples
+    --------
+    >>> choose_level(("2004-01-15", "2024-01-15"), 70)
+    'quarter'
+    """
+    if widget_date_range is None:
+        return "month"
+    start, end = pd.Timestamp(widget_date_range[0]), pd.Timestamp(widget_date_range[1])
+    span = (end.year - start.year) * 12 + end.month - start.month + 1
+    for level, months in LOD_MONTHS.items():
+        if -(-span // months) <= LOD_OVERSAMPLING * max_points:
+            return level
+    return "year"
+
+
+def rollup(data, level):
+    """
+    Average the prices of each (commodity, market) by quarter or year.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Country frame, e.g. in the store layout (see store.to_store_layout()).
+    level : str
+        "quarter" or "year".
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns commodity, market, date, month and usdprice, with the start of each period
+        as date and month, sorted by (commodity, market, date).
+    """
+    months = data["month"] if "month" in data else to_month_start(data["date"])
+    periods = months.dt.to_period(LOD_LEVELS[level]).dt.start_time.rename("date")
+    rolled = (
+        data.groupby([data["commodity"], data["market"], periods], observed=True, sort=True)
+        .agg({"usdprice": "mean"})
+        .reset_index()
+    )
+    rolled["month"] = rolled["date"]
+    return rolled
+
+
+def lttb(x, y, lengths, n_out):
+    """
+    Select the points of several series kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points of each series are kept. The points in between are split
+    into `n_out - 2` buckets, and each bucket keeps the point forming the largest triangle
+    with the point kept in the previous bucket and the average of the next bucket.
+    Buckets are processed for all series at once.
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        Coordinates of the points of all series, series after series, x sorted in each series.
+    lengths : numpy.ndarray
+        Number of points of each series, all greater than `n_out`.
+    n_out : int
+        Number of points kept per series, at least 3.
+
+    Returns
+    -------
+    numpy.ndarray
+        Positions of the kept points in `x` and `y`, series after series.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+    every = (lengths - 2) / (n_out - 2)
+
+    # Prefix sums, to average the next bucket of each series
+    x_sums = np.concatenate([[0.0], np.cumsum(x)])
+    y_sums = np.concatenate([[0.0], np.cumsum(y)])
+
+    def bound(bucket):
+        return starts + np.minimum(np.floor(bucket * every).astype(np.int64) + 1, lengths - 1)
+
+    kept = np.empty((len(lengths), n_out), dtype=np.int64)
+    kept[:, 0] = starts
+    kept[:, -1] = starts + lengths - 1
+    width = int(np.ceil(every.max())) + 1
+    for bucket in range(n_out - 2):
+        first, stop, next_stop = bound(bucket), bound(bucket + 1), bound(bucket + 2)
+        next_stop = np.where(bucket + 1 == n_out - 2, starts + lengths, next_stop)
+        next_x = (x_sums[next_stop] - x_sums[stop]) / (next_stop - stop)
+        next_y = (y_sums[next_stop] - y_sums[stop]) / (next_stop - stop)
+
+        previous = kept[:, bucket]
+        candidates = first[:, None] + np.arange(width)
+        is_valid = candidates < stop[:, None]
+        candidates = np.where(is_valid, candidates, first[:, None])
+        areas = np.abs(
+            (x[previous, None] - next_x[:, None]) * (y[candidates] - y[previous, None])
+            - (x[previous, None] - x[candidates]) * (next_y[:, None] - y[previous, None])
+        )
+        areas[~is_valid] = -1
+        kept[:, bucket + 1] = candidates[np.arange(len(lengths)), areas.argmax(axis=1)]
+
+    return kept.ravel()
+
+
+def downsample(rows, max_points):
+    """
+    Cap the number of points of each market series of a line chart with LTTB.
+
+    Parameters
+    ----------
+    rows : pandas.DataFrame
+        Plotted rows with columns date, market and usdprice, ordered by market then date.
+    max_points : int
+        Point budget of each series.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The rows kept, in the same order.
+    """
+    markets = rows["market"].to_numpy()
+    if len(markets) <= max_points:
+        return rows
+    is_start = np.concatenate([[True], markets[1:] != markets[:-1]])
+    starts = np.flatnonzero(is_start)
+    lengths = np.diff(np.append(starts, len(markets)))
+    if lengths.max() <= max_points:
+        return rows
+
+    # Series within the budget are kept whole
+    is_long = lengths > max_points
+    series_ids = np.repeat(np.arange(len(lengths)), lengths)
+    long_rows = np.flatnonzero(is_long[series_ids])
+    kept = long_rows[lttb(
+        rows["date"].to_numpy().astype("datetime64[D]").astype(np.int64)[long_rows],
+        rows["usdprice"].to_numpy()[long_rows],
+        lengths[is_long],
+        max(max_points, 3),
+    )]
+    keep = ~is_long[series_ids]
+    keep[kept] = True
+    return rows[keep]
+
+
+class LineLevels:
+    """
+    Monthly country frame and its quarterly and yearly rollups, with their offset indexes.
+
+    Rollups are built on first use, e.g. once per stored version with store.load_line_levels().
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Country frame, e.g. in the store layout.
+    frame_index : FrameIndex, optional
+        Offset index of `data`. Built from `data` when omitted.
+    """
+
+    def __init__(self, data, frame_index=None):
+        self.levels = {"month": (data, frame_index or FrameIndex.from_frame(data))}
+
+    def get(self, level):
+        """Return the frame and the offset index of a level."""
+        if level not in self.levels:
+            rolled = rollup(self.levels["month"][0], level)
+            self.levels[level] = (rolled, FrameIndex.from_frame(rolled))
+        return self.levels[level]
+
+
+if __name__ == "__main__":
+    pass
@@ -1,20 +1,22 @@
+import functools
 import numpy as np
 import pandas as pd
 import altair as alt
 import geopandas as gpd
 from vega_datasets import data
 import country_converter as coco
-from src.cache_config import cache
+from src.cache_config import memoize
+from src.data import get_country_iso_numeric
+from src.geo import load_country_shape
+from src.frame_index import FrameIndex
+from src.lod import LineLevels, choose_level, downsample
+from src.tracing import traced
+from src.utils import to_month_start
+from src.vega_runtime import compile_charts
 alt.data_transformers.enable('vegafusion')
 
-import json
-
-with open('data/raw/ne_50m_admin_0_countries.json', 'r') as file:
-    COUNTRY_DATA = json.load(file)
-    WORLD = alt.Data(values=COUNTRY_DATA, format=alt.TopoDataFormat(type='topojson', feature='ne_50m_admin_0_countries'))
-
-
 
+@traced()
 def generate_figure_chart(data, widget_date_range, widget_market_values, widget_commodity_values):
     """
     Generate figure charts displaying the latest average price and period-over-period change for specified commodities.
@@ -74,14 +76,15 @@ def generate_figure_chart(data, widget_date_range, widget_market_values, widget_
         & (price_data.market.isin(widget_market_values))
     ]
     price_data = (
-        price_data.groupby(["date", "commodity", "unit"])
+        price_data.groupby(["date", "commodity", "unit"], observed=True)
         .agg({"usdprice": "mean"})
         .reset_index()
     )
     price_pivot = price_data.pivot_table(
         index="date", 
         columns=["commodity", "unit"], 
-        values="usdprice"
+        values="usdprice",
+        observed=True
     )
 
     price_summary = price_pivot.pct_change(1).iloc[-1].rename("mom").to_frame().reset_index()
@@ -89,6 +92,27 @@ def generate_figure_chart(data, widget_date_range, widget_market_values, widget_
     price_summary["usdprice"] = price_pivot.iloc[-1].values
     price_summary["date"] = price_pivot.index[-1]
 
+    return plot_figure_charts(price_summary, widget_commodity_values)
+
+@traced()
+def plot_figure_charts(price_summary, widget_commodity_values):
+    """
+    Plot figure charts from a summary of latest average prices and period-over-period changes.
+
+    Parameters
+    ----------
+    price_summary : pandas.DataFrame
+        One row per commodity, with columns commodity, unit, mom, yoy, usdprice and date,
+        as computed by generate_figure_chart() or PriceCube.price_summary().
+    widget_commodity_values : list
+        A list of commodities for which figure charts will be generated.
+
+    Returns
+    -------
+    list of altair.Chart
+        A list of Altair figure charts displaying the latest average price and period-over-period change.
+    """
+
     # Generate Figure charts
     charts = []
     for item in widget_commodity_values:
@@ -184,17 +208,128 @@ def generate_figure_chart(data, widget_date_range, widget_market_values, widget_
 
     return charts
 
-def generate_line_chart(data, widget_date_range, widget_market_values, widget_commodity_values):
+@functools.lru_cache(maxsize=None)
+def get_figure_template():
+    """
+    Compile the Vega spec of a figure chart once, as a template for plot_figure_specs().
+
+    Returns
+    -------
+    dict
+        Pre-transformed Vega spec of a figure chart for a placeholder commodity.
+    """
+    placeholder = pd.DataFrame({
+        "commodity": ["commodity"],
+        "unit": ["unit"],
+        "mom": [0.0],
+        "yoy": [0.0],
+        "usdprice": [0.0],
+        "date": [pd.Timestamp("2000-01-01")],
+    })
+    return compile_charts(plot_figure_charts(placeholder, ["commodity"]), labels=["figure_template"])[0]
+
+@traced()
+def plot_figure_specs(price_summary, widget_commodity_values, title=None):
+    """
+    Plot figure charts as Vega specs, filling a shared template with each commodity's data.
+
+    Equivalent to compiling the charts of plot_figure_charts(), without building and
+    compiling the layers of each chart: only the data row and the title differ between specs.
+
+    Parameters
+    ----------
+    price_summary : pandas.DataFrame
+        One row per commodity, with columns commodity, unit, mom, yoy, usdprice and date,
+        as computed by generate_figure_chart() or PriceCube.price_summary().
+    widget_commodity_values : list
+        A list of commodities for which figure charts will be generated.
+    title : dict, optional
+        Vega title of all specs. Defaults to "<commodity> /<unit>" as in plot_figure_charts().
+
+    Returns
+    -------
+    list of dict
+        A list of pre-transformed Vega specs, one per commodity.
+
+    Examples
+    --------
+    >>> plot_figure_specs(cube.price_summary(date_range, markets, ["Rice", "Milk"]), ["Rice", "Milk"])
+    """
+    template = get_figure_template()
+    source = template["data"][0]
+    fields = list(source["values"][0])
+    price_summary = price_summary.drop_duplicates("commodity").set_index("commodity")
+
+    specs = []
+    for item in widget_commodity_values:
+        row = price_summary.loc[item]
+        # Non-finite values are serialized as null, as VegaFusion does
+        values = {
+            field: float(row[field]) if np.isfinite(row[field]) else None for field in fields
+        }
+
+        # The template is shared: only replace the data and title, never modify them in place
+        spec = dict(template)
+        spec["data"] = [dict(source, values=[values]), *template["data"][1:]]
+        spec["title"] = title if title is not None else dict(template["title"], text=f"{item} /{row['unit']}")
+        specs.append(spec)
+
+    return specs
+
+@functools.lru_cache(maxsize=None)
+def get_line_template():
+    """
+    Build the line chart shared by all commodities once, as a template for generate_line_chart().
+
+    Returns
+    -------
+    alt.Chart
+        Configured line chart without data.
+    """
+    # Change the default color scheme of Altair
+    custom_color_scheme = ['#f58518', '#72b7b2', '#eeca3b', '#e45756', '#9d755d', 
+                           '#54a24b', '#b279a2', '#4c78a8', '#ff9da6', '#bab0ac']
+    custom_color_scale = alt.Scale(range=custom_color_scheme)
+
+    return alt.Chart(width='container', height='container').mark_line(
+        size=3,
+        interpolate='monotone', 
+        point=alt.OverlayMarkDef(shape='circle', size=50, filled=True)
+    ).encode(
+        x=alt.X('date:T', axis=alt.Axis(format='%Y-%m', title='Time')),
+        y=alt.Y('usdprice:Q', title='Price in USD', scale=alt.Scale(zero=False)),
+        color=alt.Color('market:N', legend=alt.Legend(title='Market'), scale=custom_color_scale),
+        tooltip=[
+            alt.Tooltip('date:T', title='Time', format='%Y-%m'),
+            alt.Tooltip('usdprice:Q', title='Price in USD', format='.2f')
+        ]
+#    ).properties(
+#        title=alt.TitleParams(f'{commodity} Price')
+    ).configure_view(
+        strokeWidth=0,
+#        fill='#f5f5f5'
+    ).configure_axisX(
+        grid=False
+    ).configure_axisY(
+        grid=False
+    )
+
+@traced()
+def generate_line_chart(
+    data, widget_date_range, widget_market_values, widget_commodity_values, frame_index=None, levels=None, max_points=None
+):
     """
     Generates a list of line charts, each representing the price trends of different commodities over time within specified marketplaces.
 
-    The function filters the input data based on a given date range and a list of market values. 
-    It then iterates through a list of commodities, creating an individual line chart for each one that visualizes its price trend in USD.
+    The function resolves the given date range, market values and commodities to the row positions of each commodity
+    through the frame's offset index, and fills the shared line chart template with each commodity's rows
+    to visualize its price trend in USD.
 
     Parameters
     ----------
     data : pd.DataFrame
         A Pandas DataFrame containing the commodities data including dates, markets, and prices.
+        Dates are plotted by month, from the `month` column when present (see store.to_store_layout()).
         
     widget_date_range : tuple
         A tuple of two strings ('YYYY-MM-DD', 'YYYY-MM-DD') representing the start and end dates for filtering the data.
@@ -205,6 +340,17 @@ def generate_line_chart(data, widget_date_range, widget_market_values, widget_co
     widget_commodity_values : list of str)
         A list of string values representing the commodities for which the line charts will be generated.
 
+    frame_index : FrameIndex, optional
+        Offset index of `data`, e.g. from store.load_frame_index(). Built from `data` when omitted.
+
+    levels : LineLevels, optional
+        Rollups of `data`, e.g. from store.load_line_levels(). Built from `data` when needed and omitted.
+
+    max_points : int, optional
+        Point budget of each market series, e.g. from lod.line_max_points(). Over long date ranges,
+        quarterly or yearly rollups are plotted, and longer series are downsampled with LTTB.
+        By default, every month in the date range is plotted.
+
     Returns:
     list of alt.Chart
         A list containing Altair Chart objects, each representing a line chart for a specific commodity.
@@ -216,62 +362,45 @@ def generate_line_chart(data, widget_date_range, widget_market_values, widget_co
     # Returns a list of Altair Chart objects for 'Rice' and 'Milk' with specified configurations.
     """
 
-    # Filter the data for the selected time period and markets
-    commodities_data = data[
-        data.date.between(widget_date_range[0], widget_date_range[1])
-        & data.market.isin(widget_market_values)
-    ].copy()
-    commodities_data['date'] = commodities_data['date'].dt.to_period("M").dt.to_timestamp()
-    
-    charts = []
-
-    # Change the default color scheme of Altair
-    custom_color_scheme = ['#f58518', '#72b7b2', '#eeca3b', '#e45756', '#9d755d', 
-                           '#54a24b', '#b279a2', '#4c78a8', '#ff9da6', '#bab0ac']
-    custom_color_scale = alt.Scale(range=custom_color_scheme)
+    # Pick the rollup drawn over the selected time period
+    if max_points is not None:
+        level = choose_level(widget_date_range, max_points)
+        if level != "month":
+            levels = levels or LineLevels(data, frame_index)
+            data, frame_index = levels.get(level)
+
+    # Resolve the selected time period, markets and commodities to row positions
+    frame_index = frame_index or FrameIndex.from_frame(data)
+    row_positions = frame_index.rows(widget_date_range, widget_market_values, widget_commodity_values)
+    empty = np.array([], dtype=np.intp)
+
+    def plotted_rows(positions):
+        # Keep only the plotted columns, with dates normalized to the start of the month
+        if "month" in data:
+            month = data.month.iloc[positions]
+        else:
+            month = to_month_start(data.date.iloc[positions])
+        rows = pd.DataFrame({
+            "date": month,
+            "market": data.market.iloc[positions],
+            "usdprice": data.usdprice.iloc[positions],
+        })
+        return rows if max_points is None else downsample(rows, max_points)
+
+    template = get_line_template()
 
     # Create charts for each of the commodity
-    for commodity in widget_commodity_values:
-        # Filter the data for the specific commodity
-        commodity_data = commodities_data[commodities_data.commodity.isin([commodity])]
-     
-        # Create the chart
-        chart = alt.Chart(commodity_data, width='container', height='container').mark_line(
-            size=3,
-            interpolate='monotone', 
-            point=alt.OverlayMarkDef(shape='circle', size=50, filled=True)
-        ).encode(
-            x=alt.X('date:T', axis=alt.Axis(format='%Y-%m', title='Time')),
-            y=alt.Y('usdprice:Q', title='Price in USD', scale=alt.Scale(zero=False)),
-            color=alt.Color('market:N', legend=alt.Legend(title='Market'), scale=custom_color_scale),
-            tooltip=[
-                alt.Tooltip('date:T', title='Time', format='%Y-%m'),
-                alt.Tooltip('usdprice:Q', title='Price in USD', format='.2f')
-            ]
-#        ).properties(
-#            title=alt.TitleParams(f'{commodity} Price')
-        ).configure_view(
-            strokeWidth=0,
-#            fill='#f5f5f5'
-        ).configure_axisX(
-            grid=False
-        ).configure_axisY(
-            grid=False
-        )
-
-        # Add the chart to the list of charts
-        charts.append(chart)
-
-    return charts
+    return [
+        template.properties(data=plotted_rows(row_positions.get(commodity, empty)))
+        for commodity in widget_commodity_values
+    ]
 
 
-@cache.memoize()
+@memoize
+@traced()
 def get_country_background(country_id):
-    country_map = alt.Chart(WORLD, width='container', height=500).transform_calculate(
-        ISO_N3='datum.properties.ISO_N3' 
-    ).transform_filter(
-        (alt.datum.ISO_N3 == f"{country_id:03}")
-    )
+    # Embed only the pre-split shape of the country rather than filtering the world map in the browser
+    country_map = alt.Chart(alt.Data(values=load_country_shape(country_id)), width='container', height=500)
     background = country_map.mark_geoshape(
         fill='lightgray',
         stroke='white'
@@ -282,6 +411,7 @@ def get_country_background(country_id):
     return background
 
 
+@traced()
 def plot_country_cities(country_id, price_summary):
     """
     Generates a geographic visualization combining a country map and market points.
@@ -315,7 +445,7 @@ def plot_country_cities(country_id, price_summary):
     background = get_country_background(country_id)
 
     # Process data
-    price_summary['label'] = price_summary['market'] + ' ' + price_summary['usdprice'].round(2).astype(str)
+    price_summary['label'] = price_summary['market'].astype(str) + ' ' + price_summary['usdprice'].round(2).astype(str)
     max_usdprice = price_summary['usdprice'].max()
     price_summary = price_summary.to_dict(orient='records')
     
@@ -351,6 +481,7 @@ def plot_country_cities(country_id, price_summary):
 
     return background + markets_final
 
+@traced()
 def generate_geo_chart(data, widget_date_range, widget_market_values, widget_commodity_values, country):
     """
     Generates a geographical visualization of market data within a specified country
@@ -413,12 +544,12 @@ def generate_geo_chart(data, widget_date_range, widget_market_values, widget_com
         & (price_data.market.isin(widget_market_values))
     ]
 
-    price_data = price_data.groupby(["date", "market", "latitude", "longitude"]).agg({'usdprice': 'mean'}).reset_index()
+    price_data = price_data.groupby(["date", "market", "latitude", "longitude"], observed=True).agg({'usdprice': 'mean'}).reset_index()
 
-    price_summary = price_data.sort_values(by='date').groupby(["market", "latitude", "longitude"]).last().reset_index()
+    price_summary = price_data.sort_values(by='date').groupby(["market", "latitude", "longitude"], observed=True).last().reset_index()
 
     # Generate Geo chart
-    country_id = coco.convert(names=country, to='ISOnumeric')
+    country_id = get_country_iso_numeric(country)
     geo_chart = plot_country_cities(country_id, price_summary)
     
     return geo_chart
@@ -0,0 +1,594 @@
+# Script containing the data sources used by data.py
+# A data source resolves the country index and country datasets to a location
+# (URL or local path) that pd.read_csv can open. Downloads go through a shared HTTP
+# session with a bounded connection pool, retries with backoff, and conditional
+# requests against the ETag / Last-Modified recorded next to each downloaded file.
+import os
+import io
+import glob
+import json
+import time
+import contextlib
+import shutil
+import threading
+import urllib.request
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+INDEX_FILENAME = "wfp_countries_global.csv"
+COUNTRY_FILENAME = "wfp_food_prices_{iso3}.csv"
+
+HDX_INDEX_IDENTIFIER = "global-wfp-food-prices"
+
+# Bundled datasets, tracked by git: read as they are in "mirror" mode, and only copied
+# into the mirror of the "tiered" mode, which downloads and refreshes files
+SEED_DIR = os.path.join("data", "raw")
+MIRROR_DIR = os.path.join("data", "processed", "mirror")
+
+HTTP_POOL_SIZE = int(os.environ.get("FOOD_PRICE_HTTP_POOL_SIZE", 8))
+HTTP_RETRIES = int(os.environ.get("FOOD_PRICE_HTTP_RETRIES", 3))
+HTTP_BACKOFF = float(os.environ.get("FOOD_PRICE_HTTP_BACKOFF", 0.5))
+HTTP_TIMEOUT = float(os.environ.get("FOOD_PRICE_HTTP_TIMEOUT", 60))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_hdx_configured = False
+_hdx_lock = threading.Lock()
+
+
+def _configure_hdx():
+    """Create the HDX configuration on first use rather than at import time."""
+    global _hdx_configured
+
+    with _hdx_lock:
+        if not _hdx_configured:
+            from hdx.api.configuration import Configuration
+
+            Configuration.create(
+                hdx_site="prod",
+                user_agent="DSCI-532_2024_19_food-price-tracker",
+                hdx_read_only=True,
+            )
+            _hdx_configured = True
+
+
+class HTTPClient:
+    """
+    HTTP session shared by all downloads of the process.
+
+    Connections are kept alive in a bounded pool, failed requests are retried with
+    exponential backoff, and files downloaded before are revalidated with a
+    conditional request, so that unchanged files are not transferred again.
+
+    Parameters
+    ----------
+    pool_size : int, optional
+        Maximum number of connections per host; further requests wait for a free
+        connection. Defaults to $FOOD_PRICE_HTTP_POOL_SIZE, or 8.
+    retries : int, optional
+        Number of retries of failed connections and of 429 / 5xx responses.
+        Defaults to $FOOD_PRICE_HTTP_RETRIES, or 3.
+    backoff : float, optional
+        Backoff factor in seconds between retries, doubled at each retry.
+        Defaults to $FOOD_PRICE_HTTP_BACKOFF, or 0.5.
+    timeout : float, optional
+        Connect and read timeout in seconds. Defaults to $FOOD_PRICE_HTTP_TIMEOUT, or 60.
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, timeout=HTTP_TIMEOUT):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset({"GET", "HEAD"}),
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @staticmethod
+    def _meta_path(path):
+        return f"{path}.meta.json"
+
+    def _read_meta(self, path):
+        """Return the validators recorded when `path` was downloaded, if it still exists."""
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(self._meta_path(path)) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def download(self, url, path):
+        """
+        Download `url` to `path` unless the file is unchanged since its last download.
+
+        The new file replaces the old one atomically once complete. Its ETag and
+        Last-Modified headers are recorded in a `.meta.json` file next to it, and sent
+        back as If-None-Match / If-Modified-Since on the next download.
+
+        Parameters
+        ----------
+        url : str
+            HTTP(S) location of the file to download.
+        path : str
+            Destination path of the file.
+
+        Returns
+        -------
+        bool
+            True if the file was downloaded, False if the server reported it unchanged.
+        """
+        meta = self._read_meta(path)
+        headers = {}
+        if meta.get("url") == url:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304:
+                # Unchanged: mark the local copy as fresh again
+                os.utime(path)
+                return False
+            response.raise_for_status()
+
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                with open(tmp_path, "wb") as file:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        file.write(chunk)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            meta = {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+
+        tmp_path = f"{self._meta_path(path)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, self._meta_path(path))
+        return True
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Return the HTTP client shared by the process, creating it on first use."""
+    global _http_client
+
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HTTPClient()
+    return _http_client
+
+
+def download(url, path):
+    """
+    Download `url` to `path`, replacing the file atomically once complete.
+
+    HTTP(S) downloads go through the shared HTTPClient and are skipped when the
+    file is unchanged since its last download.
+
+    Parameters
+    ----------
+    url : str
+        Location of the file to download.
+    path : str
+        Destination path of the file.
+
+    Returns
+    -------
+    bool
+        True if the file was downloaded, False if it was unchanged.
+    """
+    if url.startswith(("http://", "https://")):
+        return get_http_client().download(url, path)
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with urllib.request.urlopen(url) as response, open(tmp_path, "wb") as file:
+            shutil.copyfileobj(response, file)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+
+@contextlib.contextmanager
+def open_location(location):
+    """
+    Open a location returned by a data source as a binary stream.
+
+    HTTP(S) locations are streamed through the shared HTTPClient, so that the
+    stream can be read while the rest of the file is still being downloaded.
+
+    Parameters
+    ----------
+    location : str or file-like
+        Local path, URL, or in-memory text file (e.g. a built index).
+
+    Yields
+    ------
+    file-like
+        Binary stream of the file content.
+
+    Examples
+    --------
+    >>> with open_location(get_data_source().country_location(country_row)) as stream:
+    ...     header = stream.readline()
+    """
+    if hasattr(location, "read"):
+        content = location.read()
+        yield io.BytesIO(content.encode() if isinstance(content, str) else content)
+    elif location.startswith(("http://", "https://")):
+        client = get_http_client()
+        with client.session.get(location, stream=True, timeout=client.timeout) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            yield response.raw
+    elif "://" in location:
+        with urllib.request.urlopen(location) as response:
+            yield response
+    else:
+        with open(location, "rb") as file:
+            yield file
+
+
+class DataSource:
+    """
+    Base class of a data source.
+
+    Subclasses resolve the global country index and each country dataset
+    to a location readable by pd.read_csv, in the WFP CSV format
+    (header row followed by an HXL tag row).
+    """
+
+    def index_location(self):
+        """Return the location of the global country index CSV."""
+        raise NotImplementedError
+
+    def country_location(self, country_row):
+        """
+        Return the location of a country dataset CSV.
+
+        Parameters
+        ----------
+        country_row : pd.Series
+            Row of the country index, with at least `countryiso3` and `hdx_identifier`.
+        """
+        raise NotImplementedError
+
+    def prefetch_country(self, country_row):
+        """
+        Prepare a country dataset ahead of its first read.
+
+        Returns
+        -------
+        str
+            Outcome of the prefetch, e.g. "ready".
+        """
+        self.country_location(country_row)
+        return "ready"
+
+    def prefetch(self, country_rows, max_workers=None):
+        """
+        Prepare the datasets of several countries concurrently, ahead of their first read.
+
+        Parameters
+        ----------
+        country_rows : list of pd.Series
+            Rows of the country index.
+        max_workers : int, optional
+            Number of countries prepared at the same time. Defaults to the size of the
+            HTTP connection pool.
+
+        Returns
+        -------
+        dict
+            Outcome per ISO3 code: the result of prefetch_country(), or the error message.
+
+        Examples
+        --------
+        >>> get_data_source().prefetch([country_index_df.loc["Japan"], country_index_df.loc["India"]])
+        {'JPN': 'downloaded', 'IND': 'not_modified'}
+        """
+        def prefetch_one(country_row):
+            try:
+                return self.prefetch_country(country_row)
+            except Exception as e:
+                return f"failed: {e}"
+
+        country_rows = list(country_rows)
+        with ThreadPoolExecutor(max_workers=max_workers or HTTP_POOL_SIZE) as executor:
+            outcomes = executor.map(prefetch_one, country_rows)
+            return {row["countryiso3"]: outcome for row, outcome in zip(country_rows, outcomes)}
+
+
+class HDXSource(DataSource):
+    """Data source reading directly from HDX (https://data.humdata.org/)."""
+
+    def index_location(self):
+        _configure_hdx()
+        from hdx.data.dataset import Dataset
+
+        return Dataset.read_from_hdx(HDX_INDEX_IDENTIFIER).get_resource(0)["url"]
+
+    def country_location(self, country_row):
+        _configure_hdx()
+        from hdx.data.dataset import Dataset
+
+        return Dataset.read_from_hdx(country_row["hdx_identifier"]).get_resource(0)["url"]
+
+
+class HTTPSource(DataSource):
+    """
+    Data source reading from an HTTP mirror of HDX, using the HDX file names.
+
+    Parameters
+    ----------
+    base_url : str
+        URL of the directory holding the files, e.g. "http://localhost:8000".
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def index_location(self):
+        return f"{self.base_url}/{INDEX_FILENAME}"
+
+    def country_location(self, country_row):
+        return f"{self.base_url}/{COUNTRY_FILENAME.format(iso3=country_row['countryiso3'].lower())}"
+
+
+class LocalMirrorSource(DataSource):
+    """
+    Data source reading from a local directory mirror of HDX.
+
+    The mirror uses the HDX file names, e.g. `wfp_countries_global.csv` for the
+    index and `wfp_food_prices_jpn.csv` for Japan. When the index file is absent,
+    an index is built from the country files found in the directory.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def index_path(self):
+        return os.path.join(self.root, INDEX_FILENAME)
+
+    def country_path(self, country_row):
+        return os.path.join(
+            self.root, COUNTRY_FILENAME.format(iso3=country_row["countryiso3"].lower())
+        )
+
+    def index_location(self):
+        if os.path.exists(self.index_path()):
+            return self.index_path()
+        return self._build_index()
+
+    def country_location(self, country_row):
+        path = self.country_path(country_row)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No mirrored data for {country_row['countryiso3']} in {self.root}")
+        return path
+
+    def _build_index(self):
+        """Build an index in the HDX format from the mirrored country files."""
+        rows = []
+        pattern = os.path.join(self.root, COUNTRY_FILENAME.format(iso3="*"))
+        for path in sorted(glob.glob(pattern)):
+            dates = pd.read_csv(path, usecols=["date"], parse_dates=["date"], skiprows=[1])["date"]
+            rows.append({
+                "countryiso3": os.path.basename(path)[len("wfp_food_prices_"):-len(".csv")].upper(),
+                "url": path,
+                "start_date": dates.min().date().isoformat(),
+                "end_date": dates.max().date().isoformat(),
+            })
+
+        index_df = pd.DataFrame(rows, columns=["countryiso3", "url", "start_date", "end_date"])
+        hxl_row = "#country+code,#country+url,#date+start,#date+end\n"
+        header, *body = index_df.to_csv(index=False).splitlines(keepends=True)
+
+        return io.StringIO(header + hxl_row + "".join(body))
+
+
+class TieredSource(DataSource):
+    """
+    Data source serving from a local mirror first, with HDX as the upstream.
+
+    Files missing from the mirror are copied from the seed when it has them, and
+    downloaded synchronously otherwise. Files older than `max_age` seconds are served
+    as they are and refreshed in a background thread, with a conditional request so
+    that unchanged files are not transferred again. The seed is never written to.
+
+    Parameters
+    ----------
+    mirror : LocalMirrorSource
+        Mirror holding the downloaded files.
+    upstream : DataSource
+        Source of the files missing from the mirror or stale, e.g. HDXSource().
+    max_age : float, optional
+        Age in seconds after which mirrored files are refreshed, 0 revalidating them on
+        every read. Defaults to one day.
+    seed : LocalMirrorSource, optional
+        Read-only mirror of bundled files, copied into the mirror on first use.
+    """
+
+    def __init__(self, mirror, upstream, max_age=86400, seed=None):
+        self.mirror = mirror
+        self.upstream = upstream
+        self.max_age = max_age
+        self.seed = seed
+        self._seeded = seed is None
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def _seed_mirror(self):
+        """Copy the seed files missing from the mirror, keeping their modification time."""
+        with self._lock:
+            if self._seeded:
+                return
+            pattern = os.path.join(self.seed.root, COUNTRY_FILENAME.format(iso3="*"))
+            for seed_path in [self.seed.index_path(), *sorted(glob.glob(pattern))]:
+                path = os.path.join(self.mirror.root, os.path.basename(seed_path))
+                if os.path.exists(seed_path) and not os.path.exists(path):
+                    os.makedirs(self.mirror.root, exist_ok=True)
+                    shutil.copy2(seed_path, path)
+            self._seeded = True
+
+    def index_location(self):
+        self._seed_mirror()
+        path = self.mirror.index_path()
+        try:
+            self._ensure(path, self.upstream.index_location)
+        except Exception:
+            # Upstream unreachable, fall back to the index built from the mirrored country files
+            return self.mirror.index_location()
+        return path
+
+    def country_location(self, country_row):
+        self._seed_mirror()
+        path = self.mirror.country_path(country_row)
+        self._ensure(path, lambda: self.upstream.country_location(country_row))
+        return path
+
+    def prefetch_country(self, country_row):
+        """
+        Download a country dataset missing from the mirror, or revalidate a stale one.
+
+        Returns
+        -------
+        str
+            "fresh" if the mirrored file is recent enough, otherwise "downloaded" or
+            "not_modified" depending on the answer of the upstream.
+        """
+        self._seed_mirror()
+        path = self.mirror.country_path(country_row)
+        if os.path.exists(path) and time.time() - os.path.getmtime(path) <= self.max_age:
+            return "fresh"
+        changed = download(self.upstream.country_location(country_row), path)
+        return "downloaded" if changed else "not_modified"
+
+    def _ensure(self, path, resolve_url):
+        if not os.path.exists(path):
+            download(resolve_url(), path)
+        elif time.time() - os.path.getmtime(path) > self.max_age:
+            self._refresh_in_background(path, resolve_url)
+
+    def _refresh_in_background(self, path, resolve_url):
+        with self._lock:
+            if path in self._refreshing:
+                return
+            self._refreshing.add(path)
+
+        def refresh():
+            try:
+                download(resolve_url(), path)
+            except Exception:
+                # Keep serving the mirrored copy; the next stale read retries
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing.discard(path)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+_source = None
+_source_lock = threading.Lock()
+
+
+def create_data_source(kind=None, mirror_dir=None, max_age=None, upstream_url=None):
+    """
+    Create a data source from arguments or environment variables.
+
+    Parameters
+    ----------
+    kind : str, optional
+        "hdx", "mirror", "http" or "tiered". Defaults to $FOOD_PRICE_SOURCE, or "tiered".
+    mirror_dir : str, optional
+        Directory of the local mirror. Defaults to $FOOD_PRICE_MIRROR_DIR, or SEED_DIR
+        ("data/raw") in mirror mode and MIRROR_DIR ("data/processed/mirror") in tiered mode.
+    max_age : float, optional
+        Age in seconds after which mirrored files are refreshed in tiered mode, 0
+        revalidating them on every read. Defaults to $FOOD_PRICE_MIRROR_MAX_AGE, or one day.
+    upstream_url : str, optional
+        URL of an HTTP mirror of HDX, read in "http" mode and used as the upstream in
+        tiered mode instead of HDX. Defaults to $FOOD_PRICE_UPSTREAM_URL.
+
+    Returns
+    -------
+    DataSource
+        The configured data source.
+
+    Examples
+    --------
+    >>> source = create_data_source("mirror", "data/raw")
+    """
+    kind = kind or os.environ.get("FOOD_PRICE_SOURCE", "tiered")
+    mirror_dir = mirror_dir or os.environ.get("FOOD_PRICE_MIRROR_DIR")
+    if max_age is None:
+        max_age = float(os.environ.get("FOOD_PRICE_MIRROR_MAX_AGE", 86400))
+    upstream_url = upstream_url or os.environ.get("FOOD_PRICE_UPSTREAM_URL")
+    upstream = HTTPSource(upstream_url) if upstream_url else HDXSource()
+
+    if kind == "hdx":
+        return HDXSource()
+    elif kind == "mirror":
+        return LocalMirrorSource(mirror_dir or SEED_DIR)
+    elif kind == "http":
+        if not upstream_url:
+            raise ValueError("The http data source requires $FOOD_PRICE_UPSTREAM_URL")
+        return upstream
+    elif kind == "tiered":
+        return TieredSource(
+            LocalMirrorSource(mirror_dir or MIRROR_DIR), upstream, max_age=max_age, seed=LocalMirrorSource(SEED_DIR)
+        )
+    else:
+        raise ValueError(f"Unknown data source: {kind}")
+
+
+def get_data_source():
+    """Return the data source shared by the process, creating it on first use."""
+    global _source
+
+    with _source_lock:
+        if _source is None:
+            _source = create_data_source()
+    return _source
+
+
+def set_data_source(source):
+    """Replace the data source shared by the process, e.g. with a mirror in tests."""
+    global _source
+
+    with _source_lock:
+        _source = source
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,114 @@
+# Script containing the server-side cache of compiled Vega specs used by callbacks.py
+# Specs are keyed by (country, data version, chart kind, commodity, markets, date range),
+# so charts are reused across sessions, users and partial selection changes.
+import os
+import json
+import threading
+
+from collections import OrderedDict
+
+
+class SpecCache:
+    """
+    Thread-safe LRU cache of Vega specs, bounded by entry count and total size.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of cached specs.
+    max_bytes : int
+        Maximum total size of the cached specs, measured as compact JSON.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=128 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        """Total size of the cached specs in bytes."""
+        return self._bytes
+
+    def get(self, key):
+        """Return the cached spec for `key`, or None."""
+        with self._lock:
+            if key not in self._entries:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return self._entries[key][0]
+
+    def put(self, key, spec):
+        """Cache `spec` under `key`, evicting the least recently used specs if needed."""
+        size = len(json.dumps(spec, separators=(",", ":"), default=str))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (spec, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def chart_key(country_handle, kind, commodity, markets, date_range):
+    """
+    Build the cache key of a chart.
+
+    Parameters
+    ----------
+    country_handle : dict
+        Handle of the stored country data, with "country" and "version".
+    kind : str
+        Kind of chart, e.g. "figure" or "line".
+    commodity : str or list of str
+        Charted commodity, or the commodities averaged into the food price index.
+        Their order is kept, as it appears in the index chart subtitle.
+    markets : list of str
+        Selected markets.
+    date_range : tuple
+        Start and end dates of the chart.
+
+    Returns
+    -------
+    tuple
+        Hashable key, independent of the order of the selected markets.
+    """
+    if not isinstance(commodity, str):
+        commodity = tuple(commodity)
+
+    return (
+        country_handle["country"],
+        country_handle["version"],
+        kind,
+        commodity,
+        tuple(sorted(markets)),
+        tuple(str(date) for date in date_range),
+    )
+
+
+spec_cache = SpecCache(
+    max_entries=int(os.environ.get("FOOD_PRICE_SPEC_CACHE_ENTRIES", 1024)),
+    max_bytes=int(os.environ.get("FOOD_PRICE_SPEC_CACHE_BYTES", 128 * 1024 ** 2)),
+)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,401 @@
+# Script containing the server-side country data store used by callbacks.py
+# Cleaned country frames are kept on disk as Parquet, keyed by (country, version),
+# so that the browser only holds a small handle instead of the full dataset.
+import os
+import re
+import json
+import pickle
+import hashlib
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from collections import OrderedDict
+from src.cube import PriceCube
+from src.frame_index import FrameIndex
+from src.lod import LineLevels
+from src.tracing import span
+from src.utils import to_month_start
+
+
+STORE_DIR = os.environ.get(
+    "FOOD_PRICE_STORE_DIR", os.path.join("data", "processed", "store")
+)
+CATEGORICAL_COLUMNS = ["market", "commodity", "unit"]
+SORT_COLUMNS = ["commodity", "market", "date"]
+MAX_LOADED_FRAMES = 8
+# Versions are the hex digests of compute_data_version()
+VERSION_PATTERN = re.compile(r"[0-9a-f]{16}")
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+def _country_dir(country):
+    """Return the directory holding all stored versions of a country."""
+    slug = "".join(ch if ch.isalnum() else "_" for ch in country.lower())
+    return os.path.join(STORE_DIR, slug)
+
+
+def check_handle(handle, countries=None):
+    """
+    Check a handle sent back by the browser before any path is built from it.
+
+    Parameters
+    ----------
+    handle : dict
+        Handle returned by write_country_data().
+    countries : list of str, optional
+        Countries of the country index. If given, the handle country must be one of them.
+
+    Returns
+    -------
+    dict
+        The handle, unchanged.
+
+    Raises
+    ------
+    ValueError
+        If the handle is malformed, its version is not a data version, or its country
+        is not in `countries`.
+    """
+    if not (
+        isinstance(handle, dict)
+        and isinstance(handle.get("country"), str)
+        and isinstance(handle.get("version"), str)
+        and VERSION_PATTERN.fullmatch(handle["version"])
+    ):
+        raise ValueError(f"Invalid country data handle: {handle!r}")
+    if countries is not None and handle["country"] not in countries:
+        raise ValueError(f"Unknown country in country data handle: {handle['country']!r}")
+    return handle
+
+
+def _handle_key(kind, handle):
+    """Return the per-process LRU key of an object loaded from a handle."""
+    check_handle(handle)
+    return (kind, handle["country"], handle["version"])
+
+
+def _frame_path(handle):
+    check_handle(handle)
+    return os.path.join(_country_dir(handle["country"]), f"{handle['version']}.parquet")
+
+
+def _cube_path(handle):
+    check_handle(handle)
+    return os.path.join(_country_dir(handle["country"]), f"{handle['version']}.cube.npz")
+
+
+def _write_cube(handle, data):
+    """Build the aggregate cube of a stored frame and write it next to the frame."""
+    path = _cube_path(handle)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        PriceCube.from_frame(data).save(file)
+    os.replace(tmp_path, path)
+
+
+def _load_cached(key, loader):
+    """Return a loaded object from the per-process LRU, loading it on a miss."""
+    with _loaded_lock:
+        if key in _loaded:
+            _loaded.move_to_end(key)
+            return _loaded[key]
+
+    with span(f"load_{key[0]}"):
+        value = loader()
+
+    with _loaded_lock:
+        _loaded[key] = value
+        while len(_loaded) > 2 * MAX_LOADED_FRAMES:
+            _loaded.popitem(last=False)
+
+    return value
+
+
+def _manifest_path(country):
+    return os.path.join(_country_dir(country), "latest.json")
+
+
+def _cleaning_state_path(country):
+    return os.path.join(_country_dir(country), "cleaning_state.pkl")
+
+
+def compute_data_version(data):
+    """
+    Compute a short, deterministic content hash of a cleaned country frame.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Cleaned country data.
+
+    Returns
+    -------
+    str
+        Hex digest identifying the content of the frame.
+    """
+    digest = hashlib.sha1(
+        pd.util.hash_pandas_object(data, index=False).values.tobytes()
+    )
+    return digest.hexdigest()[:16]
+
+
+def to_store_layout(data):
+    """
+    Convert a cleaned country frame to the typed layout kept in the store.
+
+    Categories follow the order of first appearance, also for frames read with
+    categorical columns (see data.read_country_csv()), so that ordering derived
+    from the frame (e.g. `value_counts` ties) is the same as with object columns.
+    The `month` column holds each date normalized to the start of its month, as
+    plotted by the line charts. Rows are sorted by (commodity, market, date) in the
+    order of the categories, so that FrameIndex resolves selections to row ranges.
+
+    Parameters
+    ----------
+    data : pandas.DataFrame
+        Cleaned country data.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The same data with categorical `market`, `commodity` and `unit` columns
+        and a `month` column, sorted by (commodity, market, date).
+    """
+    data = data.reset_index(drop=True)
+    if "month" not in data:
+        data["month"] = to_month_start(data["date"])
+    for column in CATEGORICAL_COLUMNS:
+        if column not in data:
+            continue
+        categories = pd.unique(data[column].dropna())
+        if isinstance(data[column].dtype, pd.CategoricalDtype):
+            data[column] = data[column].cat.set_categories(categories.tolist())
+        else:
+            data[column] = pd.Categorical(data[column], categories=categories)
+    return data.sort_values(SORT_COLUMNS, kind="stable", ignore_index=True)
+
+
+def write_country_data(country, data, source_end_date=None):
+    """
+    Write a cleaned country frame into the store and mark it as the latest version.
+
+    Parameters
+    ----------
+    country : str
+        string of the country, e.g., "Japan"
+    data : pandas.DataFrame
+        Cleaned country data, the output of get_clean_data().
+    source_end_date : str, optional
+        ISO date of the latest observation in the source data the frame was built from.
+        Recorded in the manifest, so that the sync process can skip unchanged countries.
+
+    Returns
+    -------
+    dict
+        Small handle `{"country": ..., "version": ...}` that identifies the stored frame.
+
+    Examples
+    --------
+    >>> handle = write_country_data("Japan", get_clean_data(fetch_country_data("Japan")))
+    """
+    layout = to_store_layout(data)
+    handle = {"country": country, "version": compute_data_version(layout)}
+    path = _frame_path(handle)
+
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        pq.write_table(pa.Table.from_pandas(layout, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+        # The cube is built in the source row order, which sets its market and commodity order
+        _write_cube(handle, data)
+
+    manifest = dict(handle, source_end_date=source_end_date)
+    tmp_path = f"{_manifest_path(country)}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file)
+    os.replace(tmp_path, _manifest_path(country))
+
+    return handle
+
+
+def read_manifest(country):
+    """
+    Read the manifest of the latest stored version of a country.
+
+    Parameters
+    ----------
+    country : str
+        string of the country, e.g., "Japan"
+
+    Returns
+    -------
+    dict or None
+        `{"country", "version", "source_end_date"}` of the latest version, or None if
+        the country has not been stored yet.
+    """
+    try:
+        with open(_manifest_path(country)) as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def read_cleaning_state(country):
+    """
+    Read the incremental cleaning state of a country, or None if there is none.
+
+    Parameters
+    ----------
+    country : str
+        string of the country, e.g., "Japan"
+
+    Returns
+    -------
+    CleaningState or None
+        State of the last cleaning of the country (see cleaning_state.clean_country_data()).
+    """
+    try:
+        with open(_cleaning_state_path(country), "rb") as file:
+            return pickle.load(file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError):
+        return None
+
+
+def write_cleaning_state(country, state):
+    """
+    Write the incremental cleaning state of a country next to its stored versions.
+
+    Parameters
+    ----------
+    country : str
+        string of the country, e.g., "Japan"
+    state : CleaningState
+        State of the last cleaning of the country.
+    """
+    os.makedirs(_country_dir(country), exist_ok=True)
+    tmp_path = f"{_cleaning_state_path(country)}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as file:
+        pickle.dump(state, file, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, _cleaning_state_path(country))
+
+
+def get_latest_handle(country, end_date=None):
+    """
+    Return the handle of the latest stored version of a country, or None if there is none.
+
+    Parameters
+    ----------
+    country : str
+        string of the country, e.g., "Japan"
+    end_date : pd.Timestamp, optional
+        End date of the country dataset, from the country index. If given, None is also
+        returned when the stored version was built from data older than `end_date`.
+    """
+    manifest = read_manifest(country)
+    if manifest is None or not os.path.exists(_frame_path(manifest)):
+        return None
+    if end_date is not None and (
+        manifest.get("source_end_date") is None
+        or pd.Timestamp(manifest["source_end_date"]) < pd.Timestamp(end_date).tz_localize(None)
+    ):
+        return None
+    return {"country": manifest["country"], "version": manifest["version"]}
+
+
+def load_country_data(handle):
+    """
+    Load a stored country frame from its handle.
+
+    Frames are memory-mapped from Parquet and kept in a small per-process LRU,
+    so repeated interactions on the same country do not touch the disk.
+    The returned frame is shared between callers and must not be modified in place.
+
+    Parameters
+    ----------
+    handle : dict
+        Handle returned by write_country_data().
+
+    Returns
+    -------
+    pandas.DataFrame
+        Cleaned country data with categorical `market`, `commodity` and `unit` columns.
+    """
+    return _load_cached(
+        _handle_key("frame", handle),
+        lambda: pq.read_table(_frame_path(handle), memory_map=True).to_pandas(),
+    )
+
+
+def load_country_cube(handle):
+    """
+    Load the aggregate cube of a stored country frame from its handle.
+
+    The cube is built when the frame is written; cubes missing from older
+    stores are built from the frame on first use.
+
+    Parameters
+    ----------
+    handle : dict
+        Handle returned by write_country_data().
+
+    Returns
+    -------
+    PriceCube
+        Per-(date, location, commodity) sums and counts of the country prices.
+    """
+    def load():
+        if not os.path.exists(_cube_path(handle)):
+            _write_cube(handle, load_country_data(handle))
+        return PriceCube.load(_cube_path(handle))
+
+    return _load_cached(_handle_key("cube", handle), load)
+
+
+def load_frame_index(handle):
+    """
+    Load the row index of a stored country frame from its handle.
+
+    Parameters
+    ----------
+    handle : dict
+        Handle returned by write_country_data().
+
+    Returns
+    -------
+    FrameIndex
+        Offset index resolving date, market and commodity selections to row positions.
+    """
+    return _load_cached(
+        _handle_key("index", handle),
+        lambda: FrameIndex.from_frame(load_country_data(handle)),
+    )
+
+
+def load_line_levels(handle):
+    """
+    Load the line chart rollups of a stored country frame from its handle.
+
+    Parameters
+    ----------
+    handle : dict
+        Handle returned by write_country_data().
+
+    Returns
+    -------
+    LineLevels
+        Monthly frame and its quarterly and yearly rollups, built on first use.
+    """
+    return _load_cached(
+        _handle_key("levels", handle),
+        lambda: LineLevels(load_country_data(handle), load_frame_index(handle)),
+    )
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,161 @@
+# Script containing the background sync process that pre-ingests country data
+# Walks the country index, fetches and cleans each country, and writes the result
+# into the country store, so that user requests never trigger ingestion.
+#
+# Usage:
+#     python -m src.sync                  # sync all countries every 6 hours
+#     python -m src.sync --once           # sync all countries once and exit
+#     python -m src.sync --once Japan     # sync selected countries
+import time
+import logging
+import argparse
+import pandas as pd
+
+from io import StringIO
+from collections import Counter
+from flask import Flask
+from src.cache_config import init_cache
+from src.data import fetch_country_index, fetch_country_data, prefetch_countries
+from src.cleaning_state import clean_country_data
+from src.store import get_latest_handle, write_country_data
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_up_to_date(country, end_date):
+    """
+    Check whether the stored data of a country covers the source end date.
+
+    Parameters
+    ----------
+    country : str
+        string of the country, e.g., "Japan"
+    end_date : pd.Timestamp
+        End date of the country dataset, from the country index.
+
+    Returns
+    -------
+    bool
+        True if the stored data was built from source data at least as recent as `end_date`.
+    """
+    return get_latest_handle(country, end_date=end_date) is not None
+
+
+def sync_country(country, country_index_json, force=False):
+    """
+    Fetch, clean and store the data of one country, unless it is already up to date.
+
+    Parameters
+    ----------
+    country : str
+        string of the country, e.g., "Japan"
+    country_index_json : str
+        JSON string of the country index, the output of fetch_country_index().
+    force : bool, optional
+        Re-ingest the country even if the stored data is up to date. Defaults to False.
+
+    Returns
+    -------
+    dict or None
+        Handle of the stored data, or None if the country was skipped.
+    """
+    country_index_df = pd.read_json(StringIO(country_index_json), orient="split")
+    end_date = country_index_df.loc[country, "end_date"]
+
+    if not force and is_up_to_date(country, end_date):
+        return None
+
+    data = fetch_country_data(country, country_index_json)
+
+    # Record the date covered by the source data rather than the index entry, so that a
+    # mirror that has not caught up yet is retried on the next run, and rather than by the
+    # cleaned data, which loses the last months of commodities dropped by the cleaning rules
+    source_end_date = data.date.max().date().isoformat()
+    return write_country_data(
+        country, clean_country_data(country, data), source_end_date=source_end_date
+    )
+
+
+def sync_all(countries=None, force=False):
+    """
+    Sync all countries of the index, or the given subset.
+
+    Parameters
+    ----------
+    countries : list of str, optional
+        Countries to sync. By default, every country in the country index.
+    force : bool, optional
+        Re-ingest countries even if their stored data is up to date. Defaults to False.
+
+    Returns
+    -------
+    dict
+        Number of countries "synced", "skipped" and "failed".
+    """
+    # Bypass the memoized index so that each run sees the latest end dates
+    country_index_json = fetch_country_index.uncached()
+    country_index_df = pd.read_json(StringIO(country_index_json), orient="split")
+
+    countries = countries or country_index_df.index.to_list()
+
+    # Download the outdated countries concurrently before cleaning them one by one
+    outdated = [
+        country for country in countries
+        if country in country_index_df.index
+        and (force or not is_up_to_date(country, country_index_df.loc[country, "end_date"]))
+    ]
+    if outdated:
+        outcomes = prefetch_countries(outdated, country_index_json)
+        logger.info(
+            "Prefetched %d countries: %s",
+            len(outcomes), Counter(outcome.split(":")[0] for outcome in outcomes.values()),
+        )
+
+    summary = {"synced": 0, "skipped": 0, "failed": 0}
+    for country in countries:
+        start = time.perf_counter()
+        try:
+            handle = sync_country(country, country_index_json, force=force)
+        except Exception:
+            logger.exception("Failed to sync %s", country)
+            summary["failed"] += 1
+            continue
+
+        if handle is None:
+            summary["skipped"] += 1
+        else:
+            summary["synced"] += 1
+            logger.info(
+                "Synced %s (version %s) in %.1fs",
+                country, handle["version"], time.perf_counter() - start,
+            )
+
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-ingest and pre-clean WFP country data.")
+    parser.add_argument("countries", nargs="*", help="countries to sync, by default all countries in the index")
+    parser.add_argument("--once", action="store_true", help="run a single sync and exit")
+    parser.add_argument("--interval", type=float, default=6 * 3600, help="seconds between sync runs")
+    parser.add_argument("--force", action="store_true", help="re-ingest countries that are up to date")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    # Share the cache configuration of the dashboard
+    server = Flask(__name__)
+    init_cache(server)
+
+    with server.app_context():
+        while True:
+            summary = sync_all(args.countries, force=args.force)
+            logger.info("Sync finished: %s", summary)
+            if args.once:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
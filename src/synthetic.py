@@ -0,0 +1,302 @@
+# Script containing the synthetic WFP data generator used for scale testing
+# Generates country data with the columns returned by fetch_country_data(), from a number of
+# markets, commodities and months, with the irregularities the cleaning pipeline has to deal
+# with: commodities reported in a few markets only, missing months (at random, in blocks, or
+# markets that stop reporting), secondary units and duplicated rows.
+# Data are deterministic for a seed, and each optional irregularity draws from its own stream,
+# so that turning one on does not change the others. Rows are built from integer codes with
+# categorical text columns, as read by read_country_csv(), so that tens of millions of rows
+# fit in memory.
+#
+# Usage:
+#     python -m src.synthetic data/raw/wfp_food_prices_syr.csv --rows 5000000 [--seed 0]
+import argparse
+import numpy as np
+import pandas as pd
+
+
+COLUMNS = ["date", "market", "latitude", "longitude", "commodity", "unit", "usdprice"]
+# Columns of the HDX datasets, and the HXL hashtags of their second row
+HDX_COLUMNS = {
+    "date": "#date",
+    "admin1": "#adm1+name",
+    "admin2": "#adm2+name",
+    "market": "#loc+market+name",
+    "latitude": "#geo+lat",
+    "longitude": "#geo+lon",
+    "category": "#item+type",
+    "commodity": "#item+name",
+    "unit": "#item+unit",
+    "priceflag": "#item+price+flag",
+    "pricetype": "#item+price+type",
+    "currency": "#currency",
+    "price": "#value",
+    "usdprice": "#value+usd",
+}
+BASE_UNIT = "KG"
+# Secondary units, and the quantity of the base unit they hold
+UNIT_VARIANTS = [("5 KG", 5.0), ("50 KG", 50.0), ("Pound", 0.4536), ("100 KG", 100.0), ("3 KG", 3.0)]
+MISSING_PATTERNS = ("random", "blocks", "dropout")
+PRICE_MODELS = ("trend", "iid")
+# Streams of the optional irregularities, drawn from np.random.default_rng([seed, stream])
+_MISSING_STREAM, _PRICE_STREAM, _UNIT_STREAM, _DUPLICATE_STREAM = 1, 2, 3, 4
+_CHUNK_ROWS = 1 << 20
+
+
+def _sorted_codes(names):
+    """Return the sorted categories of names, and the category code of each name."""
+    order = np.argsort(names, kind="stable")
+    codes = np.empty(len(names), dtype=np.int32)
+    codes[order] = np.arange(len(names), dtype=np.int32)
+    return names[order], codes
+
+
+def generate_country_data(
+    n_markets,
+    n_commodities,
+    n_months,
+    pair_density=0.5,
+    missing_rate=0.3,
+    seed=0,
+    *,
+    major_commodities=0,
+    major_density=0.95,
+    missing_pattern="random",
+    block_months=6,
+    unit_variants=0,
+    unit_variant_rate=0.1,
+    duplicate_rate=0.0,
+    price_model="trend",
+    start="2000-02",
+    bounds=(-30, 40, -20, 140),
+    categorical=True,
+):
+    """
+    Generate country data in the WFP schema, as returned by fetch_country_data().
+
+    Each market reports a random subset of commodities, monthly from a random start month
+    in the first half of the period, with some months missing.
+
+    Parameters
+    ----------
+    n_markets, n_commodities, n_months : int
+        Size of the country.
+    pair_density : float, optional
+        Share of (market, commodity) pairs that exist. Defaults to 0.5.
+    missing_rate : float, optional
+        Share of missing months within the reported span of a pair for the "random" and
+        "blocks" patterns, or share of markets that stop reporting for "dropout". Defaults to 0.3.
+    seed : int, optional
+        Random seed. Defaults to 0.
+    major_commodities : int, optional
+        Number of commodities reported in a share `major_density` of the markets, so that
+        they pass the market abundance rule of filter_major_data(). Defaults to 0.
+    major_density : float, optional
+        Share of markets reporting each major commodity. Defaults to 0.95.
+    missing_pattern : {"random", "blocks", "dropout"}, optional
+        Months missing independently, in runs of `block_months` months, or markets that
+        stop reporting at a random month. Defaults to "random".
+    block_months : int, optional
+        Length of the runs of months of the "blocks" pattern. Defaults to 6.
+    unit_variants : int, optional
+        Number of secondary units of UNIT_VARIANTS, besides BASE_UNIT. Defaults to 0.
+    unit_variant_rate : float, optional
+        Share of rows reported in a secondary unit, with their price scaled by its quantity. Defaults to 0.1.
+    duplicate_rate : float, optional
+        Share of rows reported twice, the copies being appended after the sorted rows. Defaults to 0.
+    price_model : {"trend", "iid"}, optional
+        Prices following a random walk per commodity, scaled per commodity and market, or
+        independent lognormal prices. Defaults to "trend".
+    start : str, optional
+        First month, e.g. "2000-02". Dates are on the 15th of each month, as in WFP data.
+    bounds : tuple of float, optional
+        Minimum and maximum latitude, then longitude, of the markets.
+    categorical : bool, optional
+        Whether text columns are categorical with sorted categories, as read by
+        read_country_csv(), or object columns. Defaults to True.
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe with columns date, market, latitude, longitude, commodity, unit, usdprice,
+        sorted by date, market and commodity.
+
+    Examples
+    --------
+    >>> data = generate_country_data(500, 40, 240, major_commodities=10, unit_variants=2, duplicate_rate=0.05)
+    """
+    if missing_pattern not in MISSING_PATTERNS:
+        raise ValueError(f"Unknown missing pattern {missing_pattern!r}, expected one of {MISSING_PATTERNS}")
+    if price_model not in PRICE_MODELS:
+        raise ValueError(f"Unknown price model {price_model!r}, expected one of {PRICE_MODELS}")
+
+    rng = np.random.default_rng(seed)
+
+    density = np.full(n_commodities, float(pair_density))
+    density[:major_commodities] = major_density
+    market_ids, commodity_ids = np.nonzero(rng.random((n_markets, n_commodities)) < density)
+    market_ids, commodity_ids = market_ids.astype(np.int32), commodity_ids.astype(np.int32)
+    start_months = rng.integers(0, n_months, size=len(market_ids)) // 2
+    end_months = np.full(len(market_ids), n_months)
+    if missing_pattern == "dropout":
+        stream = np.random.default_rng([seed, _MISSING_STREAM])
+        market_ends = np.where(
+            stream.random(n_markets) < missing_rate, stream.integers(1, n_months + 1, size=n_markets), n_months
+        )
+        end_months = market_ends[market_ids]
+    lengths = np.clip(end_months - start_months, 0, None)
+
+    # rows are indexed in int32, and the draws of missing months are made in chunks, to keep
+    # temporaries small next to the frame
+    offsets = (np.cumsum(lengths) - lengths - start_months).astype(np.int32)
+    pair_ids = np.repeat(np.arange(len(market_ids), dtype=np.int32), lengths)
+    months = np.arange(lengths.sum(), dtype=np.int32) - np.repeat(offsets, lengths)
+    if missing_pattern == "random":
+        kept = np.concatenate([
+            rng.random(min(_CHUNK_ROWS, len(months) - offset)) >= missing_rate
+            for offset in range(0, len(months), _CHUNK_ROWS)
+        ] or [np.zeros(0, dtype=bool)])
+    elif missing_pattern == "blocks":
+        stream = np.random.default_rng([seed, _MISSING_STREAM])
+        missing_blocks = stream.random((len(market_ids), -(-n_months // block_months))) < missing_rate
+        kept = ~missing_blocks[pair_ids, months // block_months]
+    if missing_pattern != "dropout":
+        pair_ids, months = pair_ids[kept], months[kept]
+        del kept
+    row_markets, row_commodities = market_ids[pair_ids], commodity_ids[pair_ids]
+    del pair_ids
+
+    dates = pd.date_range(pd.Period(start, "M").start_time, periods=n_months, freq="MS") + pd.Timedelta(days=14)
+    latitudes = rng.uniform(bounds[0], bounds[1], n_markets).round(2)
+    longitudes = rng.uniform(bounds[2], bounds[3], n_markets).round(2)
+
+    if price_model == "iid":
+        prices = rng.lognormal(0, 0.5, len(months))
+    else:
+        stream = np.random.default_rng([seed, _PRICE_STREAM])
+        commodity_scales = stream.lognormal(0, 1, n_commodities)
+        market_scales = stream.lognormal(0, 0.1, n_markets)
+        walks = np.exp(np.cumsum(stream.normal(0.003, 0.04, (n_commodities, n_months)), axis=1))
+        prices = stream.lognormal(0, 0.05, len(months))
+        prices *= commodity_scales[row_commodities]
+        prices *= market_scales[row_markets]
+        prices *= walks[row_commodities, months]
+
+    unit_codes = np.zeros(len(months), dtype=np.int8)
+    if unit_variants:
+        stream = np.random.default_rng([seed, _UNIT_STREAM])
+        varied = np.flatnonzero(stream.random(len(months)) < unit_variant_rate)
+        unit_codes[varied] = stream.integers(1, unit_variants + 1, size=len(varied))
+        quantities = np.array([1.0] + [quantity for _, quantity in UNIT_VARIANTS[:unit_variants]])
+        prices[varied] *= quantities[unit_codes[varied]]
+    prices = prices.round(4)
+
+    market_names, market_codes = _sorted_codes(np.array([f"Market {i}" for i in range(n_markets)], dtype=object))
+    commodity_names, commodity_codes = _sorted_codes(
+        np.array([f"Commodity {i}" for i in range(n_commodities)], dtype=object)
+    )
+    unit_names, unit_order = _sorted_codes(
+        np.array([BASE_UNIT] + [unit for unit, _ in UNIT_VARIANTS[:unit_variants]], dtype=object)
+    )
+
+    order = np.lexsort((commodity_codes[row_commodities], market_codes[row_markets], months))
+    if duplicate_rate:
+        stream = np.random.default_rng([seed, _DUPLICATE_STREAM])
+        order = np.concatenate([order, order[stream.random(len(order)) < duplicate_rate]])
+    row_markets, row_commodities, months = row_markets[order], row_commodities[order], months[order]
+
+    data = pd.DataFrame({
+        "date": dates.take(months),
+        "market": pd.Categorical.from_codes(market_codes[row_markets], market_names),
+        "latitude": latitudes[row_markets],
+        "longitude": longitudes[row_markets],
+        "commodity": pd.Categorical.from_codes(commodity_codes[row_commodities], commodity_names),
+        "unit": pd.Categorical.from_codes(unit_order[unit_codes[order]], unit_names),
+        "usdprice": prices[order],
+    }, copy=False)
+
+    if not categorical:
+        data = data.astype({"market": object, "commodity": object, "unit": object})
+
+    return data
+
+
+def size_for_rows(
+    n_rows, n_commodities=50, n_months=240, pair_density=0.5, missing_rate=0.3,
+    major_commodities=0, major_density=0.95, duplicate_rate=0.0,
+):
+    """
+    Return the number of markets giving about `n_rows` rows with generate_country_data().
+
+    Pairs start in the first half of the months, so that each covers 3/4 of them on average.
+    The estimate holds for the "random" and "blocks" missing patterns.
+
+    Returns
+    -------
+    int
+        Number of markets, at least 1.
+    """
+    pairs_per_market = major_commodities * major_density + (n_commodities - major_commodities) * pair_density
+    rows_per_market = pairs_per_market * (0.75 * n_months + 0.25) * (1 - missing_rate) * (1 + duplicate_rate)
+    return max(int(round(n_rows / rows_per_market)), 1)
+
+
+def write_country_csv(path, data, chunk_rows=1_000_000):
+    """
+    Write country data in the file format of the HDX datasets, with their HXL row.
+
+    The columns dropped by fetch_country_data() are filled with constants, and rows are
+    written `chunk_rows` at a time, so that large frames are not formatted at once.
+
+    Parameters
+    ----------
+    path : str
+        Path of the CSV file, e.g. "wfp_food_prices_syr.csv" in a local mirror.
+    data : pd.DataFrame
+        Country data with the columns of fetch_country_data().
+    chunk_rows : int, optional
+        Number of rows formatted at a time. Defaults to 1,000,000.
+
+    Returns
+    -------
+    int
+        Number of rows written.
+    """
+    constants = {
+        "admin1": "Region", "admin2": "District", "category": "cereals and tubers",
+        "priceflag": "actual", "pricetype": "Retail", "currency": "USD",
+    }
+    with open(path, "w") as file:
+        file.write(",".join(HDX_COLUMNS) + "\n" + ",".join(HDX_COLUMNS.values()) + "\n")
+        for offset in range(0, len(data), chunk_rows):
+            chunk = data.iloc[offset:offset + chunk_rows]
+            chunk.assign(**constants, price=chunk["usdprice"])[list(HDX_COLUMNS)].to_csv(
+                file, header=False, index=False, date_format="%Y-%m-%d"
+            )
+    return len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic WFP country dataset in the HDX file format.")
+    parser.add_argument("path", help="path of the CSV file, e.g. in a local mirror")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="approximate number of rows")
+    parser.add_argument("--commodities", type=int, default=50)
+    parser.add_argument("--months", type=int, default=240)
+    parser.add_argument("--missing-rate", type=float, default=0.1)
+    parser.add_argument("--missing-pattern", choices=MISSING_PATTERNS, default="random")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    size = dict(
+        n_commodities=args.commodities, n_months=args.months, missing_rate=args.missing_rate,
+        major_commodities=args.commodities // 5, duplicate_rate=0.02,
+    )
+    data = generate_country_data(
+        size_for_rows(args.rows, **size), **size, seed=args.seed, missing_pattern=args.missing_pattern, unit_variants=2
+    )
+    rows = write_country_csv(args.path, data)
+    print(f"Wrote {rows} rows to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# Script containing the per-stage timing of the request path used by callbacks.py, data.py and plotting.py
+# Each callback request is traced with its callback name, country and selection sizes, and
+# its stages (reading and cleaning data, loading stored frames, aggregating, building and
+# compiling charts, cache reads and writes) are timed as spans. Span durations are
+# aggregated into histograms per stage and callback, served as Prometheus metrics on
+# /metrics with the other metrics of the worker, and the spans of each request can be
+# dumped together with a cProfile of it.
+# Tracing is off unless $FOOD_PRICE_TRACING or $FOOD_PRICE_PROFILE_DIR is set: decorated
+# functions are then left undecorated and spans are a shared no-op context.
+import os
+import json
+import time
+import bisect
+import cProfile
+import functools
+import threading
+import contextlib
+import contextvars
+
+from collections import deque
+
+
+# Directory of the per-request profile dumps, None disabling them
+PROFILE_DIR = os.environ.get("FOOD_PRICE_PROFILE_DIR")
+TRACING = bool(os.environ.get("FOOD_PRICE_TRACING")) or bool(PROFILE_DIR)
+# Upper bounds in seconds of the buckets of the stage histograms
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Keys of the metrics dicts that only increase, exported as Prometheus counters
+COUNTERS = ("hits", "misses", "evictions")
+
+_NO_SPAN = contextlib.nullcontext()
+_request = contextvars.ContextVar("food_price_request", default=None)
+# Bucket counts, sum and count of the durations of each (stage, callback)
+_histograms = {}
+_recent = deque(maxlen=256)
+_lock = threading.Lock()
+# Profilers cannot run in several threads at once
+_profile_lock = threading.Lock()
+
+
+def _record(stage, seconds, attributes):
+    """Add a span to the histogram of its stage and to the spans of its request."""
+    request = _request.get()
+    callback = request["callback"] if request is not None else ""
+    span = {"stage": stage, "ms": round(seconds * 1000, 3), **attributes}
+
+    with _lock:
+        histogram = _histograms.get((stage, callback))
+        if histogram is None:
+            histogram = _histograms[(stage, callback)] = [0] * (len(BUCKETS) + 1) + [0.0]
+        histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+        histogram[-1] += seconds
+        if request is not None:
+            request["spans"].append(span)
+        else:
+            _recent.append(span)
+
+
+@contextlib.contextmanager
+def _span(stage, attributes):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record(stage, time.perf_counter() - start, attributes)
+
+
+def span(stage, **attributes):
+    """
+    Time a stage of the current request.
+
+    Parameters
+    ----------
+    stage : str
+        Name of the stage, e.g. "load_country_data".
+    **attributes
+        Attributes of the span kept with the spans of the request, e.g. rows=1000.
+
+    Returns
+    -------
+    context manager
+        Records the span on exit, or does nothing when tracing is off.
+
+    Examples
+    --------
+    >>> with span("price_summary", commodities=2):
+    ...     summary = country_cube.price_summary(date_key, markets, commodities)
+    """
+    if not TRACING:
+        return _NO_SPAN
+    return _span(stage, attributes)
+
+
+def traced(stage=None):
+    """
+    Decorate a function to time each of its calls as a span.
+
+    Parameters
+    ----------
+    stage : str, optional
+        Name of the stage. Defaults to the name of the function.
+
+    Returns
+    -------
+    callable
+        Decorator returning the function itself when tracing is off.
+    """
+    def decorate(func):
+        if not TRACING:
+            return func
+        name = stage or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _span(name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextlib.contextmanager
+def trace_request(callback, country=None, **sizes):
+    """
+    Trace a callback request, tagging its spans with the callback, the country and selection sizes.
+
+    The whole request is recorded as the "request" stage. With $FOOD_PRICE_PROFILE_DIR set,
+    the request is also profiled, and its profile (.prof, readable with pstats or snakeviz)
+    and its spans (.json) are written to the directory.
+
+    Parameters
+    ----------
+    callback : str
+        Name of the callback, e.g. "draw_charts".
+    country : str, optional
+        Selected country.
+    **sizes
+        Selection sizes, e.g. commodities=2, markets=5.
+
+    Examples
+    --------
+    >>> with trace_request("draw_charts", "Japan", commodities=2, markets=2):
+    ...     ...
+    """
+    if not TRACING or _request.get() is not None:
+        yield
+        return
+
+    request = {"callback": callback, "country": country, **sizes, "spans": []}
+    token = _request.set(request)
+    profiler = cProfile.Profile() if PROFILE_DIR and _profile_lock.acquire(blocking=False) else None
+    start = time.perf_counter()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _profile_lock.release()
+        _record("request", time.perf_counter() - start, {})
+        _request.reset(token)
+        with _lock:
+            _recent.extend(
+                dict(span, callback=callback, country=country, **sizes) for span in request["spans"]
+            )
+        if profiler is not None:
+            _dump_profile(profiler, request)
+
+
+def _dump_profile(profiler, request):
+    """Write the profile and the spans of a request to PROFILE_DIR."""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.perf_counter_ns() % 10 ** 6:06d}-{request['callback']}"
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}.prof"))
+    with open(os.path.join(PROFILE_DIR, f"{name}.json"), "w") as file:
+        json.dump(request, file, indent=1, default=str)
+
+
+def tracing_stats():
+    """
+    Return the stage timings of the process.
+
+    Returns
+    -------
+    dict
+        Whether tracing is on, the count and total milliseconds of each stage per callback,
+        and the most recent spans with the attributes of their requests.
+    """
+    with _lock:
+        stages = {
+            f"{callback or '-'}:{stage}": {"count": sum(histogram[:-1]), "total_ms": histogram[-1] * 1000}
+            for (stage, callback), histogram in _histograms.items()
+        }
+        recent = list(_recent)
+    return {"enabled": TRACING, "stages": stages, "recent": recent}
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _samples(name, stats, labels=None):
+    """
+    Flatten the numeric values of a metrics dict into (name, type, labels, value) samples.
+
+    Nested dicts of dicts become labels. COUNTERS are exported as counters named
+    <name>_total, the other values as gauges.
+    """
+    for key, value in stats.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float)):
+            if key in COUNTERS:
+                yield f"{name}_{key}_total", "counter", labels or {}, value
+            else:
+                yield f"{name}_{key}", "gauge", labels or {}, value
+        elif isinstance(value, dict) and value and all(isinstance(item, dict) for item in value.values()):
+            # e.g. the hits and misses of each memoized function: food_price_cache_hits_total{function="..."}
+            for label, item in value.items():
+                yield from _samples(name, item, dict(labels or {}, **{key.rstrip("s"): label}))
+        elif isinstance(value, dict):
+            yield from _samples(f"{name}_{key}", value, labels)
+
+
+def prometheus_metrics(sections=None):
+    """
+    Render the stage histograms and other metrics of the process in the Prometheus text format.
+
+    Parameters
+    ----------
+    sections : dict, optional
+        Metrics dicts by section name, e.g. {"spec_cache": spec_cache.stats}, rendered as
+        gauges named food_price_<section>_<key>, or counters named
+        food_price_<section>_<key>_total for COUNTERS.
+
+    Returns
+    -------
+    str
+        Metrics in the Prometheus text exposition format, version 0.0.4.
+    """
+    lines = [
+        "# HELP food_price_stage_seconds Duration of the stages of the callback requests.",
+        "# TYPE food_price_stage_seconds histogram",
+    ]
+    with _lock:
+        histograms = {key: list(histogram) for key, histogram in _histograms.items()}
+    for (stage, callback), histogram in sorted(histograms.items()):
+        labels = {"stage": stage, "callback": callback}
+        count = 0
+        for bound, bucket_count in zip([*BUCKETS, "+Inf"], histogram[:-1]):
+            count += bucket_count
+            lines.append(f"food_price_stage_seconds_bucket{_format_labels(dict(labels, le=bound))} {count}")
+        lines.append(f"food_price_stage_seconds_sum{_format_labels(labels)} {histogram[-1]}")
+        lines.append(f"food_price_stage_seconds_count{_format_labels(labels)} {count}")
+
+    for section, stats in (sections or {}).items():
+        samples, types = {}, {}
+        for name, metric_type, labels, value in _samples(f"food_price_{section}", stats):
+            samples.setdefault(name, []).append((labels, value))
+            types[name] = metric_type
+        for name, values in samples.items():
+            lines.append(f"# TYPE {name} {types[name]}")
+            lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in values)
+
+    return "\n".join(lines) + "\n"
+
+
+if __name__ == "__main__":
+    pass
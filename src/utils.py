@@ -28,6 +28,25 @@ def convert_date(input, target='label'):
         output = pd.to_datetime(f'{year}/{month}/{day}')
 
     return output
+
+def to_month_start(dates):
+    """
+    Normalize dates to the first day of their month.
+
+    Parameters
+    ----------
+    dates : pd.Series or pd.DatetimeIndex
+        Dates to be normalized.
+
+    Returns
+    -------
+    pd.Series or pd.DatetimeIndex
+        Dates at midnight of the first day of their month, e.g. 2024-01-15 becomes 2024-01-01.
+
+    """
+    if isinstance(dates, pd.Series):
+        return dates.dt.to_period("M").dt.to_timestamp()
+    return pd.DatetimeIndex(dates).to_period("M").to_timestamp()
     
 def compile_widget_state(
         toggle=None,
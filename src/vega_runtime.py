@@ -0,0 +1,259 @@
+# Script containing the VegaFusion runtime shared by the chart builders in callbacks.py
+# Charts are compiled to Vega in batches: each batch is merged into a single Vega spec
+# (one group per chart), pre-transformed by the per-process VegaFusion runtime in one
+# call, and split back into one Vega spec per chart. Inline datasets repeated within a
+# compiled spec, e.g. by the line and point layers of a line chart, are sent once.
+#
+# Batching relies on helpers of altair.utils._vegafusion_data, a private module of the
+# pinned Altair 5.3. Without them, charts are compiled one by one with the public
+# chart.to_dict(format="vega").
+import os
+import json
+import time
+import threading
+import altair as alt
+import vegafusion as vf
+
+from collections import deque
+from src.tracing import traced
+
+try:
+    from altair.utils._vegafusion_data import get_inline_tables, get_inline_table_names, handle_row_limit_exceeded
+    CAN_BATCH = True
+except ImportError:
+    CAN_BATCH = False
+
+
+# Properties of a Vega spec that a group mark can hold; the others stay top-level
+GROUP_PROPERTIES = ("data", "signals", "scales", "projections", "axes", "legends", "title", "marks")
+
+# Schema validation of the Vega-Lite specs, as chart.to_dict() does. Specs served from the
+# spec cache (spec_cache.py) are not compiled again, so only cache misses pay for it.
+# Set $FOOD_PRICE_VALIDATE_CHARTS=0 to turn it off.
+VALIDATE_CHARTS = os.environ.get("FOOD_PRICE_VALIDATE_CHARTS", "1") != "0"
+
+_stats = {
+    "batches": 0,
+    "charts": 0,
+    "cached_batches": 0,
+    "prepare_ms": 0.0,
+    "transform_ms": 0.0,
+}
+_recent = deque(maxlen=256)
+_stats_lock = threading.Lock()
+
+
+def configure_runtime(cache_capacity=None, memory_limit=None, worker_threads=None):
+    """
+    Configure the VegaFusion runtime of the process.
+
+    The runtime is created once per process and kept for its lifetime, so its
+    transform cache is shared by all chart builders.
+
+    Parameters
+    ----------
+    cache_capacity : int, optional
+        Maximum number of cached task graph values. Defaults to
+        $FOOD_PRICE_VEGAFUSION_CACHE_CAPACITY, or 256.
+    memory_limit : int, optional
+        Approximate memory limit of the cache in bytes. Defaults to
+        $FOOD_PRICE_VEGAFUSION_MEMORY_LIMIT, or 512 MiB.
+    worker_threads : int, optional
+        Number of worker threads of the runtime. Defaults to
+        $FOOD_PRICE_VEGAFUSION_WORKER_THREADS, or the VegaFusion default.
+    """
+    cache_capacity = cache_capacity or int(os.environ.get("FOOD_PRICE_VEGAFUSION_CACHE_CAPACITY", 256))
+    memory_limit = memory_limit or int(os.environ.get("FOOD_PRICE_VEGAFUSION_MEMORY_LIMIT", 512 * 1024 ** 2))
+    worker_threads = worker_threads or os.environ.get("FOOD_PRICE_VEGAFUSION_WORKER_THREADS")
+
+    vf.runtime.cache_capacity = cache_capacity
+    vf.runtime.memory_limit = memory_limit
+    if worker_threads:
+        vf.runtime.worker_threads = int(worker_threads)
+
+
+@traced("vegalite_to_vega")
+def _to_vega(chart):
+    """Compile an Altair chart to a Vega spec whose DataFrames are left as inline datasets."""
+    vegalite_spec = chart.to_dict(validate=VALIDATE_CHARTS, context={"pre_transform": False})
+    vega_spec = alt.vegalite_compilers.get()(vegalite_spec)
+    return vega_spec, get_inline_tables(vega_spec)
+
+
+def _merge(vega_specs):
+    """Merge Vega specs into one spec holding each chart as a group mark."""
+    merged = {"$schema": vega_specs[0]["$schema"], "marks": []}
+    for i, spec in enumerate(vega_specs):
+        group = {"type": "group", "name": f"chart_{i}"}
+        group.update({key: spec[key] for key in GROUP_PROPERTIES if key in spec})
+        merged["marks"].append(group)
+    return merged
+
+
+def _split(merged, vega_specs):
+    """Split a merged spec back into one spec per chart, restoring top-level properties."""
+    specs = []
+    for spec, group in zip(vega_specs, merged["marks"]):
+        spec = {key: value for key, value in spec.items() if key not in GROUP_PROPERTIES}
+        spec.update({key: group[key] for key in GROUP_PROPERTIES if key in group})
+        specs.append(spec)
+    return specs
+
+
+@traced("vegafusion_pre_transform")
+def _pre_transform(spec, inline_datasets):
+    """Pre-transform a Vega spec, raising MaxRowsError as chart.to_dict(format="vega") does."""
+    row_limit = alt.data_transformers.options.get("max_rows", None)
+    spec, warnings = vf.runtime.pre_transform_spec(
+        spec,
+        vf.get_local_tz(),
+        inline_datasets=inline_datasets,
+        row_limit=row_limit,
+    )
+    handle_row_limit_exceeded(row_limit, warnings)
+    return spec
+
+
+def _dedupe_datasets(spec):
+    """
+    Replace the inline datasets of a Vega spec repeating an earlier one by a reference to it.
+
+    A repeated dataset has the same values, format and transforms as an earlier dataset of
+    the spec, and becomes a dataset sourced from it, the transforms being already applied.
+    """
+    seen = {}
+    data = []
+    is_repeated = False
+    for dataset in spec.get("data", []):
+        if "values" not in dataset or set(dataset) - {"name", "values", "format", "transform"}:
+            data.append(dataset)
+            continue
+        key = json.dumps(
+            [dataset["values"], dataset.get("format"), dataset.get("transform")], sort_keys=True, default=str
+        )
+        if key in seen:
+            data.append({"name": dataset["name"], "source": seen[key]})
+            is_repeated = True
+        else:
+            seen[key] = dataset["name"]
+            data.append(dataset)
+    return dict(spec, data=data) if is_repeated else spec
+
+
+@traced()
+def compile_charts(charts, labels=None):
+    """
+    Compile Altair charts to pre-transformed Vega specs in a single VegaFusion call.
+
+    Parameters
+    ----------
+    charts : list of altair.Chart
+        Charts to compile, typically all charts drawn from the same country frame.
+    labels : list of str, optional
+        Label of each chart in the timing report, e.g. "line:Rice".
+
+    Returns
+    -------
+    list of dict
+        Pre-transformed Vega spec of each chart, equivalent to chart.to_dict(format="vega"),
+        with repeated inline datasets sourced from their first occurrence.
+
+    Examples
+    --------
+    >>> figure_spec, line_spec = compile_charts([figure_chart, line_chart], ["figure:Rice", "line:Rice"])
+    """
+    if not charts:
+        return []
+    labels = labels or [f"chart_{i}" for i in range(len(charts))]
+    if not CAN_BATCH:
+        return _compile_one_by_one(charts, labels)
+
+    vega_specs, inline_datasets, prepare_ms = [], {}, []
+    for chart in charts:
+        chart_start = time.perf_counter()
+        vega_spec, tables = _to_vega(chart)
+        vega_specs.append(vega_spec)
+        inline_datasets.update(tables)
+        prepare_ms.append((time.perf_counter() - chart_start) * 1000)
+
+    # The cache size delta is approximate when other threads compile charts concurrently
+    transform_start = time.perf_counter()
+    cache_size = vf.runtime.size or 0
+    if len(vega_specs) == 1:
+        specs = [_pre_transform(vega_specs[0], inline_datasets)]
+    else:
+        try:
+            specs = _split(_pre_transform(_merge(vega_specs), inline_datasets), vega_specs)
+        except alt.MaxRowsError:
+            raise
+        except Exception:
+            # Fall back to one call per chart if the merged spec cannot be planned
+            specs = [
+                _pre_transform(spec, {name: inline_datasets[name] for name in get_inline_table_names(spec)})
+                for spec in vega_specs
+            ]
+    new_cache_entries = (vf.runtime.size or 0) - cache_size
+    specs = [_dedupe_datasets(spec) for spec in specs]
+    transform_ms = (time.perf_counter() - transform_start) * 1000
+
+    _record(labels, prepare_ms, transform_ms, new_cache_entries)
+    return specs
+
+
+def _compile_one_by_one(charts, labels):
+    """Compile charts with one chart.to_dict(format="vega") call each, when they cannot be batched."""
+    specs, transform_ms = [], []
+    cache_size = vf.runtime.size or 0
+    for chart in charts:
+        chart_start = time.perf_counter()
+        specs.append(_dedupe_datasets(chart.to_dict(format="vega", validate=VALIDATE_CHARTS)))
+        transform_ms.append((time.perf_counter() - chart_start) * 1000)
+
+    _record(labels, [0.0] * len(charts), sum(transform_ms), (vf.runtime.size or 0) - cache_size)
+    return specs
+
+
+def _record(labels, prepare_ms, transform_ms, new_cache_entries):
+    """Add a compiled batch to the chart compilation metrics."""
+    with _stats_lock:
+        _stats["batches"] += 1
+        _stats["charts"] += len(labels)
+        _stats["cached_batches"] += new_cache_entries <= 0
+        _stats["prepare_ms"] += sum(prepare_ms)
+        _stats["transform_ms"] += transform_ms
+        for label, chart_prepare_ms in zip(labels, prepare_ms):
+            # The transform time of a batch is shared evenly between its charts
+            _recent.append({
+                "chart": label,
+                "prepare_ms": round(chart_prepare_ms, 2),
+                "transform_ms": round(transform_ms / len(labels), 2),
+            })
+
+
+def runtime_stats():
+    """
+    Return the chart compilation metrics of the process.
+
+    Returns
+    -------
+    dict
+        Number of batches and charts compiled, share of batches fully served from the
+        VegaFusion cache, total prepare and transform times, size and memory of the
+        VegaFusion cache, and the timings of the most recent charts.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["recent"] = list(_recent)
+
+    stats["cache_hit_rate"] = stats["cached_batches"] / stats["batches"] if stats["batches"] else None
+    stats["cache_entries"] = vf.runtime.size
+    stats["cache_bytes"] = vf.runtime.total_memory
+    stats["cache_capacity"] = vf.runtime.cache_capacity
+    return stats
+
+
+configure_runtime()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,31 @@
+# Script containing the shared setup of the tests
+# Tests are run from the repository root with `pytest tests/`, importing the `src` package.
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    """Point the country store at a temporary directory."""
+    from src import store
+
+    monkeypatch.setattr(store, "STORE_DIR", str(tmp_path / "store"))
+    store._loaded.clear()
+    yield store.STORE_DIR
+    store._loaded.clear()
+
+
+@pytest.fixture
+def raw_with_dropped_last_month():
+    """Raw country data whose last month only holds a commodity of one market, dropped by the cleaning rules."""
+    import pandas as pd
+    from benchmarks.incremental_cleaning import make_raw_data
+
+    raw = make_raw_data(5, 4, 24).astype({"commodity": object})
+    last_month = raw[raw["date"] == raw["date"].max()].iloc[[0]]
+    last_month = last_month.assign(date=raw["date"].max() + pd.DateOffset(months=1), commodity="Rare commodity")
+    return pd.concat([raw, last_month], ignore_index=True)
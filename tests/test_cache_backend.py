@@ -0,0 +1,158 @@
+# Tests of the tiered cache backend in src/cache_backend.py
+# The shared tier is an in-process fakeredis server, and the local tier expiry is driven by a
+# fake clock.
+import pickle
+
+import fakeredis
+import pytest
+from flask import Flask
+
+from src import cache_backend
+from src.cache_backend import TieredCache, create_redis_client
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the monotonic clock of the local tier by one advanced by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(cache_backend.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def blob_size(value):
+    return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = TieredCache(max_entries=2)
+    cache.set("f:a", 1)
+    cache.set("f:b", 2)
+    cache.get("f:a")
+
+    cache.set("f:c", 3)
+
+    assert cache.get("f:b") is None
+    assert (cache.get("f:a"), cache.get("f:c")) == (1, 3)
+    assert cache.stats()["functions"]["f"]["evictions"] == 1
+
+
+def test_entries_are_evicted_to_fit_the_byte_cap():
+    value = "x" * 1000
+    cache = TieredCache(max_bytes=2 * blob_size(value) + 10)
+    cache.set("f:a", value)
+    cache.set("f:b", value)
+    cache.set("f:c", value)
+
+    assert cache.stats()["local_entries"] == 2
+    assert cache.stats()["local_bytes"] == 2 * blob_size(value)
+    assert not cache.has("f:a")
+
+    # values larger than the cap are not kept at all
+    cache.set("f:big", "x" * 10000)
+    assert not cache.has("f:big")
+    assert cache.stats()["local_bytes"] == 2 * blob_size(value)
+
+
+def test_values_expire_after_their_timeout(clock):
+    cache = TieredCache(default_timeout=300)
+    cache.set("f:short", 1, timeout=10)
+    cache.set("f:default", 2)
+    cache.set("f:forever", 3, timeout=0)
+
+    clock[0] += 11
+    assert cache.get("f:short") is None
+    assert cache.get("f:default") == 2
+
+    clock[0] += 300
+    assert cache.get("f:default") is None
+    assert cache.get("f:forever") == 3
+    assert cache.stats()["local_entries"] == 1
+
+
+def test_values_are_copies():
+    cache = TieredCache()
+    value = {"rows": [1, 2]}
+    cache.set("f:a", value)
+    value["rows"].append(3)
+
+    cached = cache.get("f:a")
+    cached["rows"].append(4)
+    assert cache.get("f:a") == {"rows": [1, 2]}
+
+
+def test_workers_share_values_through_redis(server, clock):
+    worker, other_worker = (TieredCache(fakeredis.FakeRedis(server=server), local_timeout=60) for _ in range(2))
+
+    worker.set("f:a", "value", timeout=600)
+
+    assert other_worker.get("f:a") == "value"
+    assert other_worker.stats()["functions"]["f"] == {"hits": 1, "misses": 0, "evictions": 0}
+    assert 590 < fakeredis.FakeRedis(server=server).ttl("food_price:f:a") <= 600
+    assert other_worker.add("f:a", "other value") is False
+
+
+def test_deletions_by_other_workers_are_seen_after_the_local_timeout(server, clock):
+    worker, other_worker = (TieredCache(fakeredis.FakeRedis(server=server), local_timeout=60) for _ in range(2))
+    worker.set("f:a", "value", timeout=0)
+    other_worker.get("f:a")
+
+    worker.delete("f:a")
+
+    assert other_worker.get("f:a") == "value"
+    clock[0] += 61
+    assert other_worker.get("f:a") is None
+
+
+def test_clear_only_removes_keys_of_the_prefix(server):
+    client = fakeredis.FakeRedis(server=server)
+    client.set("other_app:key", b"1")
+    cache = TieredCache(client)
+    cache.set("f:a", 1)
+    cache.set("g:b", 2)
+
+    cache.clear()
+
+    assert client.keys() == [b"other_app:key"]
+    assert cache.stats()["local_entries"] == 0
+
+
+def test_stats_count_hits_and_misses_per_function():
+    cache = TieredCache()
+    cache.set("fetch_country_index:key", "index")
+    cache.get("fetch_country_index:key")
+    cache.get("fetch_country_index:key")
+    cache.get("get_country_background:key")
+    cache.get("unprefixed")
+
+    assert cache.stats()["functions"] == {
+        "fetch_country_index": {"hits": 2, "misses": 0, "evictions": 0},
+        "get_country_background": {"hits": 0, "misses": 1, "evictions": 0},
+        "other": {"hits": 0, "misses": 1, "evictions": 0},
+    }
+
+
+def test_memoized_functions_go_through_the_tiers():
+    from src.cache_config import cache, cache_stats, memoize
+
+    app = Flask(__name__)
+    cache.init_app(app, config=dict(cache.config, CACHE_REDIS_URL="fakeredis://"))
+    calls = []
+
+    @memoize
+    def double(value):
+        calls.append(value)
+        return 2 * value
+
+    with app.app_context():
+        assert [double(2), double(2), double(3)] == [4, 4, 6]
+        stats = cache_stats()["functions"]["double"]
+        assert cache_stats()["shared"]
+
+    assert calls == [2, 3]
+    assert stats["hits"] == 1
+    assert isinstance(create_redis_client("fakeredis://"), fakeredis.FakeRedis)
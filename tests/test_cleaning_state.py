@@ -0,0 +1,43 @@
+# Tests of the incremental cleaning of country data in src/cleaning_state.py
+# Cleaned data must equal get_clean_data() of all the rows so far after every monthly update.
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.data import get_clean_data
+from src.cleaning_state import CleaningState, clean_country_data
+from benchmarks.incremental_cleaning import make_raw_data
+
+
+@pytest.fixture(scope="module")
+def raw():
+    return make_raw_data(30, 10, 60)
+
+
+@pytest.mark.parametrize("dtype", ["category", "object"])
+def test_monthly_updates_equal_full_recompute(raw, dtype):
+    if dtype == "object":
+        raw = raw.astype({column: object for column in ["market", "commodity", "unit"]})
+    months = np.sort(raw["date"].unique())
+
+    state = CleaningState()
+    for date in months[len(months) // 2:]:
+        prefix = raw[raw["date"] <= date]
+        pd.testing.assert_frame_equal(state.update(prefix), get_clean_data(prefix).reset_index(drop=True))
+
+
+def test_revised_history_is_rebuilt(raw):
+    state = CleaningState()
+    state.update(raw)
+    revised = raw.copy()
+    revised.loc[len(raw) // 3, "usdprice"] = 123.0
+
+    pd.testing.assert_frame_equal(state.update(revised), get_clean_data(revised).reset_index(drop=True))
+
+
+def test_clean_country_data_keeps_state_in_store(raw, store_dir):
+    months = np.sort(raw["date"].unique())
+    clean_country_data("Japan", raw[raw["date"] < months[-1]])
+    result = clean_country_data("Japan", raw)
+
+    pd.testing.assert_frame_equal(result, get_clean_data(raw).reset_index(drop=True))
@@ -0,0 +1,161 @@
+# Tests of the request coalescing in src/coalesce.py
+# Workers sharing a tier are coalescers on one in-process fakeredis server, and waits
+# go through a fake clock recording the sleeps instead of sleeping.
+import fakeredis
+import pytest
+from flask import Flask
+
+from src import coalesce
+from src.coalesce import Coalescer, StaleRequest, DEFAULT_DEBOUNCE, create_coalescer
+
+
+class FakeTime:
+    """Clock of src.coalesce, advanced by its sleeps, which may also run a callback."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+        self.on_sleep = None
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        if self.on_sleep is not None:
+            self.on_sleep()
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(coalesce, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def make_worker(server, **kwargs):
+    """Return the coalescer of a worker sharing the tier of `server`."""
+    return Coalescer(redis_client=fakeredis.FakeRedis(server=server), **kwargs)
+
+
+@pytest.mark.parametrize("multithread", [False, True])
+def test_default_debounce_depends_on_the_server(app, clock, multithread):
+    coalescer = Coalescer(debounce=None)
+    generation = coalescer.begin("page-0")
+
+    with app.test_request_context(environ_overrides={"wsgi.multithread": multithread}):
+        coalescer.run("key", lambda: "result", "page-0", generation)
+
+    assert clock.sleeps == ([DEFAULT_DEBOUNCE] if multithread else [])
+
+
+def test_default_debounce_outside_requests_and_with_a_shared_tier():
+    assert Coalescer(debounce=None)._debounce() == 0
+    assert Coalescer(redis_client=object(), debounce=None)._debounce() == DEFAULT_DEBOUNCE
+
+
+def test_configured_debounce_is_always_used(app, monkeypatch):
+    monkeypatch.setenv("FOOD_PRICE_COALESCE_DEBOUNCE", "0.02")
+    monkeypatch.delenv("FOOD_PRICE_CACHE_URL", raising=False)
+    coalescer = create_coalescer()
+
+    with app.test_request_context(environ_overrides={"wsgi.multithread": False}):
+        assert coalescer._debounce() == 0.02
+    monkeypatch.delenv("FOOD_PRICE_COALESCE_DEBOUNCE")
+    assert create_coalescer().debounce is None
+
+
+def test_superseded_requests_are_dropped():
+    coalescer = Coalescer()
+    generation = coalescer.begin("page-0")
+    coalescer.begin("page-0")
+
+    with pytest.raises(StaleRequest):
+        coalescer.run("key", lambda: "result", "page-0", generation)
+    assert coalescer.stats()["stale"] == 1
+
+
+def test_workers_share_the_generations_of_a_session(server, clock):
+    worker, other_worker = make_worker(server, debounce=None), make_worker(server, debounce=None)
+    generation = worker.begin("page-0")
+
+    assert other_worker.begin("page-0") == generation + 1
+    with pytest.raises(StaleRequest):
+        worker.run("key", lambda: "result", "page-0", generation)
+    assert other_worker.run("key", lambda: "result", "page-0", generation + 1) == "result"
+    assert 0 < fakeredis.FakeRedis(server=server).ttl("food_price:coalesce:generation:page-0") <= 24 * 3600
+    # requests of a shared tier are debounced by default
+    assert clock.sleeps == [DEFAULT_DEBOUNCE] * 2
+
+
+def test_workers_share_results(server, clock):
+    worker, other_worker = make_worker(server), make_worker(server)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"charts": [1, 2]}
+
+    assert worker.run("key", compute, "page-0", worker.begin("page-0")) == {"charts": [1, 2]}
+    assert other_worker.run("key", compute, "page-1", other_worker.begin("page-1")) == {"charts": [1, 2]}
+
+    assert calls == [1]
+    assert other_worker.stats()["shared_deduplicated"] == 1
+    assert 0 < fakeredis.FakeRedis(server=server).ttl("food_price:coalesce:result:key") <= 30
+
+
+def test_workers_await_the_computation_of_another_worker(server, clock):
+    worker = make_worker(server)
+    client = fakeredis.FakeRedis(server=server)
+    # another worker holds the lock of the computation, and stores its result after a poll
+    client.set("food_price:coalesce:lock:key", b"1")
+    clock.on_sleep = lambda: client.set("food_price:coalesce:result:key", coalesce.pickle.dumps("other result"))
+
+    assert worker.run("key", lambda: "result", "page-0", worker.begin("page-0")) == "other result"
+    assert clock.sleeps == [worker.poll_interval]
+    assert worker.stats()["computed"] == 0
+
+
+def test_requests_superseded_while_awaiting_another_worker_are_dropped(server, clock):
+    worker, other_worker = make_worker(server), make_worker(server)
+    fakeredis.FakeRedis(server=server).set("food_price:coalesce:lock:key", b"1")
+    generation = worker.begin("page-0")
+    clock.on_sleep = lambda: other_worker.begin("page-0")
+
+    with pytest.raises(StaleRequest):
+        worker.run("key", lambda: "result", "page-0", generation)
+    assert worker.stats()["stale"] == 1
+
+
+def test_workers_compute_results_whose_lock_is_held_too_long(server, clock):
+    worker = make_worker(server, lock_timeout=1)
+    fakeredis.FakeRedis(server=server).set("food_price:coalesce:lock:key", b"1")
+
+    assert worker.run("key", lambda: "result", "page-0", worker.begin("page-0")) == "result"
+    assert sum(clock.sleeps) >= 1
+    assert worker.stats()["computed"] == 1
+
+
+def test_failed_computations_release_their_lock(server, clock):
+    worker, other_worker = make_worker(server), make_worker(server)
+
+    def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        worker.run("key", fail, "page-0", worker.begin("page-0"))
+
+    assert not fakeredis.FakeRedis(server=server).exists("food_price:coalesce:lock:key")
+    assert other_worker.run("key", lambda: "result", "page-1", other_worker.begin("page-1")) == "result"
+    assert clock.sleeps == []
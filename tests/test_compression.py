@@ -0,0 +1,53 @@
+# Tests of the response compression in src/compression.py
+import gzip
+
+import pytest
+from flask import Flask, Response
+
+from src import compression
+from src.compression import init_compression, compression_stats
+
+
+@pytest.fixture
+def stats(monkeypatch):
+    monkeypatch.setattr(compression, "_stats", dict.fromkeys(compression._stats, 0))
+
+
+def make_client(**kwargs):
+    server = Flask(__name__)
+    server.add_url_rule("/json", "json", lambda: Response('{"values": "' + "x" * 2000 + '"}', mimetype="application/json"))
+    server.add_url_rule("/small", "small", lambda: Response("{}", mimetype="application/json"))
+    server.add_url_rule("/image", "image", lambda: Response(b"\0" * 2000, mimetype="image/png"))
+    init_compression(server, **kwargs)
+    return server.test_client()
+
+
+def test_json_responses_are_gzipped_for_clients_accepting_it(stats):
+    client = make_client(level=6)
+
+    response = client.get("/json", headers={"Accept-Encoding": "gzip, deflate, br, zstd"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert gzip.decompress(response.get_data()) == b'{"values": "' + b"x" * 2000 + b'"}'
+    assert compression_stats()["compressed"] == 1
+    assert compression_stats()["bytes_out"] == len(response.get_data())
+    assert compression_stats()["ratio"] < 0.1
+
+
+def test_small_binary_or_unaccepted_responses_are_sent_as_they_are(stats):
+    client = make_client(level=6, min_bytes=500)
+
+    assert "Content-Encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/image", headers={"Accept-Encoding": "gzip"}).headers
+    assert "Content-Encoding" not in client.get("/json").headers
+
+    # only the small JSON response is counted, the image is not text and the last client does not accept gzip
+    assert compression_stats() == {"responses": 1, "compressed": 0, "bytes_in": 2, "bytes_out": 2, "ratio": 1.0}
+
+
+def test_level_zero_disables_compression(stats):
+    client = make_client(level=0)
+
+    assert "Content-Encoding" not in client.get("/json", headers={"Accept-Encoding": "gzip"}).headers
+    assert compression_stats()["responses"] == 0
@@ -0,0 +1,71 @@
+# Tests of the preparation of country data by the callbacks in src/callbacks.py
+# Stored versions are served until the country index lists data newer than they were built from.
+import pandas as pd
+import pytest
+
+from src import callbacks
+from src.callbacks import prepare_country_data
+from src.store import read_manifest, load_country_data
+from benchmarks.incremental_cleaning import make_raw_data
+
+
+@pytest.fixture(scope="module")
+def raw():
+    return make_raw_data(5, 4, 24)
+
+
+@pytest.fixture
+def source(raw):
+    """Source data of every country, which tests may replace."""
+    return {"data": raw}
+
+
+@pytest.fixture
+def fetches(source, monkeypatch):
+    """Serve the source data for every country, and record the countries fetched."""
+    fetched = []
+
+    def fetch_country_data(country, country_index):
+        fetched.append(country)
+        return source["data"]
+
+    monkeypatch.setattr(callbacks, "fetch_country_data", fetch_country_data)
+    return fetched
+
+
+def make_country_index(end_date):
+    country_index_df = pd.DataFrame(
+        {"end_date": [pd.Timestamp(end_date, tz="UTC")]}, index=pd.Index(["Japan"], name="country")
+    )
+    return country_index_df.to_json(date_format="iso", orient="split")
+
+
+def test_stored_country_is_served_while_up_to_date(raw, store_dir, fetches):
+    country_index = make_country_index(raw["date"].max())
+
+    handle = prepare_country_data("Japan", country_index)
+
+    assert prepare_country_data("Japan", country_index) == handle
+    assert fetches == ["Japan"]
+    assert read_manifest("Japan")["source_end_date"] == raw["date"].max().date().isoformat()
+
+
+def test_stored_country_is_prepared_again_when_the_index_is_newer(raw, store_dir, fetches):
+    prepare_country_data("Japan", make_country_index(raw["date"].max()))
+
+    prepare_country_data("Japan", make_country_index(raw["date"].max() + pd.DateOffset(months=1)))
+
+    assert fetches == ["Japan", "Japan"]
+
+
+def test_stored_country_is_served_when_the_cleaning_drops_the_last_month(
+    raw_with_dropped_last_month, source, store_dir, fetches
+):
+    source["data"] = raw_with_dropped_last_month
+    end_date = raw_with_dropped_last_month["date"].max()
+
+    handle = prepare_country_data("Japan", make_country_index(end_date))
+
+    assert load_country_data(handle)["date"].max() < end_date
+    assert prepare_country_data("Japan", make_country_index(end_date)) == handle
+    assert fetches == ["Japan"]
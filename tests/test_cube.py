@@ -0,0 +1,99 @@
+# Tests of the aggregate cube in src/cube.py
+# Every cube summary must equal the pandas path it replaces in the chart callbacks.
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.plotting as plotting
+from src.cube import PriceCube, INDEX_COMMODITY
+from src.data import filter_major_data, fill_missing_data, generate_food_price_index_data
+from src.store import to_store_layout
+from benchmarks.common import make_country_data
+
+
+def pandas_summaries(data, date_range, markets, commodities, monkeypatch):
+    """Compute the summaries of the pandas chart builders, capturing them instead of plotting."""
+    summaries = {}
+    monkeypatch.setattr(plotting, "plot_figure_charts", lambda summary, values: summaries.setdefault("figure", summary))
+    monkeypatch.setattr(plotting, "plot_country_cities", lambda country_id, summary: summaries.setdefault("geo", summary))
+    monkeypatch.setattr(plotting, "get_country_iso_numeric", lambda country: 392)
+
+    index_data = generate_food_price_index_data(data, markets, commodities)
+    summaries["index"] = index_data[index_data["commodity"] == INDEX_COMMODITY]
+    plotting.generate_figure_chart(data, date_range, markets, commodities)
+    summaries["price_summary"] = summaries.pop("figure")
+    plotting.generate_figure_chart(index_data, date_range, markets, [INDEX_COMMODITY])
+    summaries["index_summary"] = summaries.pop("figure")
+    plotting.generate_geo_chart(index_data, date_range, markets, [INDEX_COMMODITY], "Japan")
+    return summaries
+
+
+def assert_same_rows(expected, result, keys):
+    """Assert that two frames have the same rows in any order, over the columns of the pandas path."""
+    columns = [column for column in result.columns if column in expected.columns]
+
+    def normalize(frame):
+        frame = frame[columns].copy()
+        for column in frame.columns:
+            if not pd.api.types.is_numeric_dtype(frame[column]) and not pd.api.types.is_datetime64_any_dtype(frame[column]):
+                frame[column] = frame[column].astype(str)
+        return frame.sort_values(keys).reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(normalize(expected), normalize(result), check_dtype=False)
+
+
+def make_case(seed, moved_markets=0, unlocated_markets=0):
+    """Return a cleaned random country, with some markets reported at a second location or without one."""
+    rng = np.random.default_rng(seed)
+    raw = make_country_data(
+        int(rng.integers(3, 12)), int(rng.integers(2, 8)), int(rng.integers(13, 40)),
+        pair_density=0.6, missing_rate=0.4, seed=seed,
+    )
+    markets = raw["market"].unique()
+    for market in markets[:moved_markets]:
+        moved = (raw["market"] == market) & (raw["commodity"] == raw.loc[raw["market"] == market, "commodity"].iloc[0])
+        raw.loc[moved, "latitude"] += 0.5
+    for market in markets[moved_markets:moved_markets + unlocated_markets]:
+        raw.loc[raw["market"] == market, ["latitude", "longitude"]] = np.nan
+    data = to_store_layout(fill_missing_data(filter_major_data(raw, 0.2, 0.3)))
+
+    selected_markets = list(rng.choice(markets, size=min(4, len(markets)), replace=False)) + list(markets[:2])
+    commodities = data["commodity"].value_counts().index[:3].tolist()
+    dates = np.sort(data["date"].unique())
+    return data, (dates[len(dates) // 4], dates[-1]), selected_markets, commodities
+
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.parametrize("moved_markets, unlocated_markets", [(0, 0), (2, 0), (1, 1)])
+def test_cube_matches_the_pandas_path(seed, moved_markets, unlocated_markets, monkeypatch):
+    data, date_range, markets, commodities = make_case(seed, moved_markets, unlocated_markets)
+    cube = PriceCube.from_frame(data)
+    expected = pandas_summaries(data, date_range, markets, commodities, monkeypatch)
+
+    assert_same_rows(expected["index"], cube.food_price_index(markets, commodities), ["date", "market", "latitude"])
+    assert_same_rows(expected["price_summary"], cube.price_summary(date_range, markets, commodities), ["commodity"])
+    assert_same_rows(expected["index_summary"], cube.index_summary(date_range, markets, commodities), ["commodity"])
+    assert_same_rows(expected["geo"], cube.latest_index_by_market(date_range, markets, commodities), ["market", "latitude"])
+
+
+def test_markets_at_several_locations_are_one_point_each():
+    data, date_range, markets, commodities = make_case(0, moved_markets=1)
+    cube = PriceCube.from_frame(data)
+
+    # the selection ends with the moved market
+    geo = cube.latest_index_by_market(None, [markets[-2]], data["commodity"].unique())
+
+    assert len(geo) == 2
+    assert geo["latitude"].nunique() == 2
+
+
+def test_saved_cube_loads_equal(tmp_path):
+    data, date_range, markets, commodities = make_case(1, moved_markets=2)
+    cube = PriceCube.from_frame(data)
+    cube.save(tmp_path / "cube.npz")
+    loaded = PriceCube.load(tmp_path / "cube.npz")
+
+    pd.testing.assert_frame_equal(
+        cube.latest_index_by_market(date_range, markets, commodities),
+        loaded.latest_index_by_market(date_range, markets, commodities),
+    )
@@ -0,0 +1,81 @@
+# Tests of the cleaning rules of filter_major_data and fill_missing_data in src/data.py
+# Results must equal the original merge-based implementations kept in benchmarks/reference.py,
+# on random inputs with mixed units, duplicates, missing values and random thresholds.
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import reference
+from benchmarks.filter_major_data import make_raw_country_data
+from src.data import filter_major_data, fill_missing_data
+
+
+def make_random_case(seed):
+    """Generate a small raw frame with mixed units, duplicates and missing values, and random thresholds."""
+    rng = np.random.default_rng(seed)
+    n_rows = int(rng.integers(1, 400))
+    dates = pd.date_range("2010-01-15", periods=int(rng.integers(1, 12)), freq="MS") + pd.Timedelta(days=14)
+    markets = [f"m{i}" for i in range(int(rng.integers(1, 6)))]
+    commodities = [f"c{i}" for i in range(int(rng.integers(1, 5)))]
+    units = ["KG", "5 KG", "L", "Unit"][:int(rng.integers(1, 5))]
+
+    data = pd.DataFrame({"date": rng.choice(dates, n_rows), "market": rng.choice(markets, n_rows)})
+    # Occasionally give a market a second location
+    data["latitude"] = data.market.str[1:].astype(float) + (rng.random(n_rows) < 0.03) * 0.5
+    data["longitude"] = data.latitude * 2
+    data["commodity"] = rng.choice(commodities, n_rows)
+    data["unit"] = rng.choice(units, n_rows)
+    data["usdprice"] = np.where(rng.random(n_rows) < 0.05, np.nan, rng.random(n_rows).round(3))
+    if rng.random() < 0.2:
+        data.loc[rng.random(n_rows) < 0.05, "latitude"] = np.nan
+
+    thresholds = (float(rng.choice([0, 0.2, 0.5, 0.9])), float(rng.choice([0, 0.3, 0.7, 1.0])))
+    return data, thresholds
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_filter_major_data_matches_the_original(seed):
+    data, thresholds = make_random_case(seed)
+
+    pd.testing.assert_frame_equal(
+        reference.filter_major_data(data, *thresholds), filter_major_data(data, *thresholds)
+    )
+
+
+def test_filter_major_data_matches_the_original_on_a_country():
+    data = make_raw_country_data(1)
+    result = filter_major_data(data)
+
+    assert 0 < len(result) < len(data)
+    assert 0 < result["commodity"].nunique() < data["commodity"].nunique()
+    pd.testing.assert_frame_equal(reference.filter_major_data(data), result)
+
+
+@pytest.mark.parametrize("method", ["forward", None])
+@pytest.mark.parametrize("seed", range(100))
+def test_fill_missing_data_matches_the_original(seed, method):
+    data, thresholds = make_random_case(seed)
+
+    pd.testing.assert_frame_equal(reference.fill_missing_data(data, method), fill_missing_data(data, method))
+    filtered = filter_major_data(data, *thresholds)
+    if not filtered.empty:
+        pd.testing.assert_frame_equal(reference.fill_missing_data(filtered, method), fill_missing_data(filtered, method))
+
+
+@pytest.mark.parametrize("method", ["forward", None])
+def test_fill_missing_data_matches_the_original_on_a_single_pair(method):
+    data, thresholds = make_random_case(0)
+    data = data[(data["market"] == data["market"].iloc[0]) & (data["commodity"] == data["commodity"].iloc[0])]
+
+    pd.testing.assert_frame_equal(reference.fill_missing_data(data, method), fill_missing_data(data, method))
+    pd.testing.assert_frame_equal(reference.fill_missing_data(data[:1], method), fill_missing_data(data[:1], method))
+
+
+def test_fill_missing_data_keeps_empty_frames_empty():
+    data, thresholds = make_random_case(0)
+    # the original implementation fails on empty frames, merging object dates on datetime dates
+    result = fill_missing_data(data[:0])
+
+    assert result.empty
+    pd.testing.assert_series_equal(result.dtypes, data[:0][result.columns].dtypes)
+    assert list(result.columns) == ["date", "market", "latitude", "longitude", "commodity", "unit", "usdprice"]
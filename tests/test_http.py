@@ -0,0 +1,144 @@
+# Tests of the HTTP client of the data sources in src/sources.py
+# Downloads go to a local http.server, which serves one file with its validators and
+# answers conditional requests, and can fail a number of requests with a 503.
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.sources import HTTPClient
+
+
+LAST_MODIFIED = "Wed, 01 May 2024 00:00:00 GMT"
+
+
+class FileHandler(BaseHTTPRequestHandler):
+    """Serve `server.content`, answering 304 to matching If-None-Match / If-Modified-Since headers."""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.failures > 0:
+            server.failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if_none_match = self.headers.get("If-None-Match")
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if (server.etag and if_none_match == server.etag) or (
+            not if_none_match and server.last_modified and if_modified_since == server.last_modified
+        ):
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        if server.etag:
+            self.send_header("ETag", server.etag)
+        if server.last_modified:
+            self.send_header("Last-Modified", server.last_modified)
+        self.send_header("Content-Length", str(len(server.content)))
+        self.end_headers()
+        self.wfile.write(server.content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FileHandler)
+    server.content = b"countryiso3,end_date\nJPN,2024-05-15\n"
+    server.etag = '"v1"'
+    server.last_modified = LAST_MODIFIED
+    server.failures = 0
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/wfp_food_prices_jpn.csv"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    return HTTPClient(pool_size=2, retries=2, backoff=0, timeout=5)
+
+
+def test_unchanged_files_are_revalidated_with_their_etag(server, client, tmp_path):
+    path = str(tmp_path / "jpn.csv")
+
+    assert client.download(server.url, path)
+    os.utime(path, (0, 0))
+    assert not client.download(server.url, path)
+
+    assert server.requests[1]["If-None-Match"] == '"v1"'
+    assert server.requests[1]["If-Modified-Since"] == LAST_MODIFIED
+    with open(path, "rb") as file:
+        assert file.read() == server.content
+    # a 304 marks the local copy as fresh
+    assert os.path.getmtime(path) > 0
+
+
+def test_changed_files_are_downloaded_again(server, client, tmp_path):
+    path = str(tmp_path / "jpn.csv")
+    client.download(server.url, path)
+
+    server.content, server.etag = b"countryiso3,end_date\nJPN,2024-06-15\n", '"v2"'
+
+    assert client.download(server.url, path)
+    with open(path, "rb") as file:
+        assert file.read() == server.content
+    assert not client.download(server.url, path)
+
+
+def test_files_without_etag_are_revalidated_with_their_date(server, client, tmp_path):
+    path = str(tmp_path / "jpn.csv")
+    server.etag = None
+
+    assert client.download(server.url, path)
+    assert not client.download(server.url, path)
+
+    assert "If-None-Match" not in server.requests[1]
+    assert server.requests[1]["If-Modified-Since"] == LAST_MODIFIED
+
+
+def test_validators_of_another_url_or_a_missing_file_are_not_sent(server, client, tmp_path):
+    path = str(tmp_path / "jpn.csv")
+    client.download(server.url, path)
+
+    assert client.download(server.url + "?v=2", path)
+    os.remove(path)
+    assert client.download(server.url + "?v=2", path)
+
+    assert all("If-None-Match" not in headers for headers in server.requests[1:])
+
+
+def test_server_errors_are_retried(server, client, tmp_path):
+    path = str(tmp_path / "jpn.csv")
+    server.failures = 2
+
+    assert client.download(server.url, path)
+
+    assert len(server.requests) == 3
+    with open(path, "rb") as file:
+        assert file.read() == server.content
+
+
+def test_failed_downloads_keep_the_previous_file(server, client, tmp_path):
+    path = str(tmp_path / "jpn.csv")
+    client.download(server.url, path)
+    server.content, server.etag, server.failures = b"new", '"v2"', 3
+
+    with pytest.raises(requests.exceptions.RetryError):
+        client.download(server.url, path)
+
+    assert len(server.requests) == 4
+    with open(path, "rb") as file:
+        assert file.read() != b"new"
+    assert sorted(os.listdir(tmp_path)) == ["jpn.csv", "jpn.csv.meta.json"]
@@ -0,0 +1,81 @@
+# Tests of the background job manager in src/jobs.py
+import os
+import sys
+import time
+import logging
+import subprocess
+
+import diskcache
+import psutil
+
+from src import jobs
+from src.jobs import JobPool, create_job_manager
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_app_does_not_create_the_job_cache(tmp_path):
+    job_dir = tmp_path / "jobs"
+    env = dict(os.environ, FOOD_PRICE_JOB_DIR=str(job_dir))
+
+    subprocess.run([sys.executable, "-c", "import src.app"], cwd=REPO_DIR, env=env, check=True)
+
+    assert not job_dir.exists()
+
+
+def test_default_job_dir_is_in_the_repository():
+    if "FOOD_PRICE_JOB_DIR" not in os.environ:
+        assert jobs.JOB_DIR == os.path.join(REPO_DIR, "data", "processed", "jobs")
+
+
+def test_job_cache_is_opened_on_first_use(tmp_path):
+    manager = create_job_manager(str(tmp_path / "jobs"))
+    pool = JobPool(manager, 2)
+    manager.make_job_fn(lambda: None, False)
+    assert isinstance(manager.handle, diskcache.Cache)
+    assert not (tmp_path / "jobs").exists()
+
+    with pool.slot():
+        assert pool.stats() == {"slots": 2, "in_use": 1}
+
+    assert pool.stats() == {"slots": 2, "in_use": 0}
+    assert (tmp_path / "jobs" / "cache.db").exists()
+
+
+def test_jobs_write_their_progress_and_result(tmp_path):
+    manager = create_job_manager(str(tmp_path / "jobs"))
+
+    def double(set_progress, value):
+        set_progress("half way")
+        return value * 2
+
+    manager.register("double", double, True)
+    pid = manager.call_job_fn("result", manager.func_registry["double"], [21], {})
+    deadline = time.time() + 30
+    while not manager.result_ready("result") and time.time() < deadline:
+        time.sleep(0.05)
+
+    assert manager.get_result("result", pid) == 42
+
+
+def test_slots_of_processes_gone_while_checked_are_free(tmp_path, monkeypatch):
+    pool = JobPool(create_job_manager(str(tmp_path / "jobs")), 1)
+    pool.acquire(pid=os.getpid())
+
+    def gone(pid):
+        raise psutil.NoSuchProcess(pid)
+
+    monkeypatch.setattr(psutil, "Process", gone)
+
+    assert pool.stats()["in_use"] == 0
+    assert pool.acquire(pid=1) == 0
+
+
+def test_missing_dependencies_disable_jobs_with_a_warning(tmp_path, monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "psutil", None)
+
+    with caplog.at_level(logging.WARNING, logger="src.jobs"):
+        assert create_job_manager(str(tmp_path / "jobs")) is None
+
+    assert "Background jobs disabled" in caplog.text
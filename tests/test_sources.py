@@ -0,0 +1,168 @@
+# Tests of the data sources in src/sources.py, and of the reading of their country files
+# Mirrors are temporary directories, and upstreams are read through file:// URLs, so that
+# no test reaches the network.
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import reference
+from src import sources
+from src.data import read_country_csv
+from src.sources import HTTPSource, LocalMirrorSource, TieredSource, create_data_source
+from src.synthetic import generate_country_data, write_country_csv
+
+
+JAPAN = pd.Series({"countryiso3": "JPN", "hdx_identifier": "wfp-food-prices-for-japan"})
+
+
+def write_country(directory, iso3="jpn", n_months=12, seed=0):
+    """Write a small synthetic country dataset in the HDX file format, and return its path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"wfp_food_prices_{iso3}.csv")
+    write_country_csv(path, generate_country_data(3, 2, n_months, seed=seed))
+    return path
+
+
+def file_upstream(directory):
+    return HTTPSource(f"file://{os.path.abspath(directory)}")
+
+
+def wait_for_refreshes(source, timeout=10):
+    deadline = time.time() + timeout
+    while source._refreshing and time.time() < deadline:
+        time.sleep(0.01)
+    assert not source._refreshing
+
+
+def make_stale(path):
+    os.utime(path, (time.time() - 3600, time.time() - 3600))
+
+
+def test_local_mirror_resolves_hdx_file_names(tmp_path):
+    path = write_country(tmp_path)
+    mirror = LocalMirrorSource(str(tmp_path))
+
+    assert mirror.country_location(JAPAN) == path
+    with pytest.raises(FileNotFoundError):
+        mirror.country_location(pd.Series({"countryiso3": "IND"}))
+
+
+def test_local_mirror_builds_its_index_from_country_files(tmp_path):
+    write_country(tmp_path, "jpn", n_months=12)
+    write_country(tmp_path, "ind", n_months=24)
+
+    index = pd.read_csv(LocalMirrorSource(str(tmp_path)).index_location(), skiprows=[1])
+
+    assert index["countryiso3"].tolist() == ["IND", "JPN"]
+    assert index["end_date"].tolist() == ["2002-01-15", "2001-01-15"]
+
+
+def test_tiered_downloads_missing_files(tmp_path):
+    upstream_path = write_country(tmp_path / "upstream")
+    source = TieredSource(LocalMirrorSource(str(tmp_path / "mirror")), file_upstream(tmp_path / "upstream"))
+
+    path = source.country_location(JAPAN)
+
+    assert path == str(tmp_path / "mirror" / "wfp_food_prices_jpn.csv")
+    with open(path) as file, open(upstream_path) as upstream_file:
+        assert file.read() == upstream_file.read()
+
+
+def test_tiered_copies_the_seed_without_writing_to_it(tmp_path):
+    seed_path = write_country(tmp_path / "seed", seed=0)
+    write_country(tmp_path / "upstream", seed=1)
+    make_stale(seed_path)
+    with open(seed_path) as file:
+        seed_content = file.read()
+    source = TieredSource(
+        LocalMirrorSource(str(tmp_path / "mirror")), file_upstream(tmp_path / "upstream"),
+        max_age=60, seed=LocalMirrorSource(str(tmp_path / "seed")),
+    )
+
+    # the stale seed copy is served, then refreshed in the mirror only
+    path = source.country_location(JAPAN)
+    with open(path) as file:
+        assert file.read() == seed_content
+    wait_for_refreshes(source)
+
+    with open(path) as file:
+        assert file.read() != seed_content
+    with open(seed_path) as file:
+        assert file.read() == seed_content
+    assert os.listdir(tmp_path / "seed") == ["wfp_food_prices_jpn.csv"]
+
+
+def test_tiered_refreshes_only_stale_files(tmp_path):
+    write_country(tmp_path / "upstream", seed=1)
+    mirror_path = write_country(tmp_path / "mirror", seed=0)
+    source = TieredSource(LocalMirrorSource(str(tmp_path / "mirror")), file_upstream(tmp_path / "upstream"), max_age=60)
+
+    assert source.prefetch_country(JAPAN) == "fresh"
+    make_stale(mirror_path)
+    assert source.prefetch_country(JAPAN) == "downloaded"
+    assert source.prefetch_country(JAPAN) == "fresh"
+
+
+def test_tiered_max_age_zero_revalidates_on_every_read(tmp_path, monkeypatch):
+    write_country(tmp_path / "upstream")
+    monkeypatch.setattr(sources, "SEED_DIR", str(tmp_path / "seed"))
+    source = create_data_source(
+        "tiered", mirror_dir=str(tmp_path / "mirror"), max_age=0, upstream_url=f"file://{tmp_path / 'upstream'}"
+    )
+    refreshed = []
+    monkeypatch.setattr(source, "_refresh_in_background", lambda path, resolve_url: refreshed.append(path))
+
+    # downloaded on the first read, then revalidated on each read
+    for _ in range(3):
+        source.country_location(JAPAN)
+
+    assert source.max_age == 0
+    assert refreshed == [str(tmp_path / "mirror" / "wfp_food_prices_jpn.csv")] * 2
+
+
+def test_tiered_index_falls_back_to_the_mirror(tmp_path):
+    write_country(tmp_path / "mirror")
+    source = TieredSource(LocalMirrorSource(str(tmp_path / "mirror")), file_upstream(tmp_path / "unreachable"))
+
+    index = pd.read_csv(source.index_location(), skiprows=[1])
+
+    assert index["countryiso3"].tolist() == ["JPN"]
+
+
+def test_default_sources_keep_the_seed_read_only(monkeypatch):
+    for variable in ["FOOD_PRICE_SOURCE", "FOOD_PRICE_MIRROR_DIR", "FOOD_PRICE_MIRROR_MAX_AGE", "FOOD_PRICE_UPSTREAM_URL"]:
+        monkeypatch.delenv(variable, raising=False)
+
+    tiered = create_data_source()
+    assert tiered.mirror.root == sources.MIRROR_DIR
+    assert tiered.seed.root == sources.SEED_DIR
+    assert tiered.max_age == 86400
+    assert create_data_source("mirror").root == sources.SEED_DIR
+
+
+@pytest.mark.parametrize("block_size", [1 << 12, 1 << 20])
+def test_country_files_are_read_block_by_block(tmp_path, block_size):
+    data = generate_country_data(20, 6, 36, seed=1, categorical=False)
+    rng = np.random.default_rng(1)
+    data.loc[rng.random(len(data)) < 0.01, "market"] = np.nan
+    data.loc[rng.random(len(data)) < 0.01, "usdprice"] = np.nan
+    path = str(tmp_path / "wfp_food_prices_jpn.csv")
+    write_country_csv(path, data)
+
+    result = read_country_csv(path, block_size=block_size)
+
+    categorical = {column: object for column in ["market", "commodity", "unit"]}
+    pd.testing.assert_frame_equal(result.astype(categorical), reference.read_country_csv(path))
+    assert result["market"].cat.categories.is_monotonic_increasing
+
+
+def test_empty_country_files_are_read(tmp_path):
+    path = str(tmp_path / "wfp_food_prices_jpn.csv")
+    write_country_csv(path, generate_country_data(2, 2, 2, categorical=False)[:0])
+
+    result = read_country_csv(path)
+
+    assert result.empty
+    assert result.dtypes.astype(str).tolist() == ["datetime64[ns]", "category", "float64", "float64", "category", "category", "float64"]
@@ -0,0 +1,55 @@
+# Tests of the country data store in src/store.py
+# Handles come back from the browser and are checked before any path is built from them.
+import pandas as pd
+import pytest
+
+from src import callbacks
+from src.store import check_handle, write_country_data, load_country_data, load_country_cube
+from benchmarks.incremental_cleaning import make_raw_data
+
+
+@pytest.fixture
+def handle(store_dir):
+    return write_country_data("Japan", make_raw_data(3, 2, 13))
+
+
+def make_country_index(countries):
+    country_index_df = pd.DataFrame(
+        {"end_date": [pd.Timestamp("2024-01-01", tz="UTC")] * len(countries)},
+        index=pd.Index(countries, name="country"),
+    )
+    return country_index_df.to_json(date_format="iso", orient="split")
+
+
+def test_stored_handles_are_valid(handle):
+    assert check_handle(handle, ["Japan"]) == handle
+    assert len(load_country_data(handle)) > 0
+
+
+@pytest.mark.parametrize(
+    "version", ["../../../etc/passwd", "0123456789abcdeg", "0123456789ABCDEF", "0123456789abcdef0", "", None, 1]
+)
+def test_handles_with_an_invalid_version_are_rejected(handle, version):
+    forged = dict(handle, version=version)
+
+    with pytest.raises(ValueError, match="Invalid"):
+        load_country_data(forged)
+    with pytest.raises(ValueError, match="Invalid"):
+        load_country_cube(forged)
+    with pytest.raises(ValueError, match="Invalid"):
+        callbacks.draw_charts(forged, None, ["Rice"], ["Tokyo"], False, "Japan")
+
+
+@pytest.mark.parametrize("forged", [None, "Japan", {"version": "0123456789abcdef"}, {"country": ["Japan"], "version": "0123456789abcdef"}])
+def test_malformed_handles_are_rejected(forged):
+    with pytest.raises(ValueError, match="Invalid"):
+        check_handle(forged)
+
+
+def test_handles_of_countries_outside_the_index_are_rejected(handle):
+    forged = dict(handle, country="Atlantis")
+
+    with pytest.raises(ValueError, match="Unknown country"):
+        check_handle(forged, ["Japan"])
+    with pytest.raises(ValueError, match="Unknown country"):
+        callbacks.update_widget_values(make_country_index(["Japan"]), forged, False, "Atlantis")
@@ -0,0 +1,49 @@
+# Tests of the background sync process in src/sync.py
+# A country is ingested again only when the country index lists data newer than its source data.
+import pandas as pd
+import pytest
+
+from src import sync
+from src.sync import is_up_to_date, sync_country
+
+
+@pytest.fixture
+def fetches(raw_with_dropped_last_month, monkeypatch):
+    """Serve the same raw data for every country, and record the countries fetched."""
+    fetched = []
+
+    def fetch_country_data(country, country_index_json):
+        fetched.append(country)
+        return raw_with_dropped_last_month
+
+    monkeypatch.setattr(sync, "fetch_country_data", fetch_country_data)
+    return fetched
+
+
+def make_country_index(end_date):
+    country_index_df = pd.DataFrame(
+        {"end_date": [pd.Timestamp(end_date, tz="UTC")]}, index=pd.Index(["Japan"], name="country")
+    )
+    return country_index_df.to_json(date_format="iso", orient="split")
+
+
+def test_synced_countries_are_skipped_when_the_cleaning_drops_the_last_month(
+    raw_with_dropped_last_month, store_dir, fetches
+):
+    end_date = raw_with_dropped_last_month["date"].max()
+
+    assert sync_country("Japan", make_country_index(end_date)) is not None
+    assert is_up_to_date("Japan", pd.Timestamp(end_date, tz="UTC"))
+    assert sync_country("Japan", make_country_index(end_date)) is None
+    assert fetches == ["Japan"]
+
+
+def test_synced_countries_are_ingested_again_when_the_index_is_newer(
+    raw_with_dropped_last_month, store_dir, fetches
+):
+    end_date = raw_with_dropped_last_month["date"].max()
+    sync_country("Japan", make_country_index(end_date))
+
+    assert sync_country("Japan", make_country_index(end_date + pd.DateOffset(months=1))) is not None
+    assert sync_country("Japan", make_country_index(end_date), force=True) is not None
+    assert fetches == ["Japan"] * 3
@@ -0,0 +1,52 @@
+# Tests of the chart compilation in src/vega_runtime.py
+# Compiled specs are compared with chart.to_dict(format="vega") through the VegaFusion data
+# transformer enabled by src/plotting.py; dataset names differ between the two.
+import altair as alt
+import pandas as pd
+import pytest
+
+import src.plotting
+from src import vega_runtime
+from src.vega_runtime import compile_charts
+
+
+@pytest.fixture
+def data():
+    return pd.DataFrame({"date": pd.date_range("2020-01-15", periods=6, freq="MS"), "usdprice": range(6)})
+
+
+def mark_types(spec):
+    return [mark["type"] for mark in spec["marks"]]
+
+
+def make_charts(data):
+    line = alt.Chart(data).mark_line().encode(x="date:T", y="usdprice:Q")
+    return [line, line + line.mark_point(), line.transform_filter(alt.datum.usdprice > 2)]
+
+
+def test_invalid_charts_are_rejected(data):
+    chart = alt.Chart(data).mark_line().encode(x=alt.X("date:T", bin="monthly"), y="usdprice:Q")
+
+    assert vega_runtime.VALIDATE_CHARTS
+    with pytest.raises(alt.utils.schemapi.SchemaValidationError):
+        compile_charts([chart])
+
+
+def test_charts_compile_as_with_to_dict(data):
+    charts = make_charts(data)
+    specs = compile_charts(charts)
+
+    assert len(specs) == len(charts)
+    for spec, chart in zip(specs, charts):
+        assert mark_types(spec) == mark_types(chart.to_dict(format="vega"))
+
+
+def test_charts_compile_one_by_one_without_the_batching_helpers(data, monkeypatch):
+    charts = make_charts(data)
+    batched = compile_charts(charts)
+    monkeypatch.setattr(vega_runtime, "CAN_BATCH", False)
+
+    specs = compile_charts(charts)
+
+    assert [mark_types(spec) for spec in specs] == [mark_types(spec) for spec in batched]
+    assert vega_runtime.runtime_stats()["recent"][-1]["chart"] == "chart_2"